@@ -1,9 +1,18 @@
 """
 Inicialización de la aplicación Flask
 """
-from flask import Flask
-from flask_login import LoginManager
+import hmac
+from flask import Flask, Response, abort, jsonify, request
+from flask_login import LoginManager, login_required
 from config import config
+from app.services.movement_journal import MovementJournal
+from app.services.qr_queue import QRQueue
+from app.services.maintenance_kpis import MaintenanceKpiStore
+from app.services.job_scheduler import JobScheduler
+from app.services.request_metrics import RequestMetrics
+from app.services.metrics_exporter import MetricsExporter
+from app.services.call_budget import CallBudget
+from app.services.scheduled_jobs import register_default_jobs
 # Importar modelos (para Flask-Login)
 from app.services.auth_service import User
 
@@ -11,6 +20,7 @@ from app.routes.auth import auth_bp
 from app.routes.dashboard import dashboard_bp
 from app.routes.product import product_bp
 from app.routes.maintenance import maintenance_bp
+from app.routes.export import export_bp
 
 # Inicializar Flask-Login
 login_manager = LoginManager()
@@ -32,6 +42,25 @@ def create_app(config_name='default'):
     def health_check():
         return 'ok', 200
 
+    # Tiempos por petición (Server-Timing) e histogramas por endpoint de este proceso
+    if app.config.get('REQUEST_METRICS_ENABLED'):
+        RequestMetrics.init_app(app)
+        CallBudget.init_app(app)
+
+    @app.route('/health/latencias')
+    @login_required
+    def latency_report():
+        return jsonify(RequestMetrics.snapshot())
+
+    # Métricas de todos los workers en formato Prometheus (sin login, como /health;
+    # con METRICS_TOKEN configurado se exige el token)
+    @app.route('/metrics')
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+        return Response(MetricsExporter.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
     # Inicializar extensiones
     login_manager.init_app(app)
     
@@ -49,6 +78,25 @@ def create_app(config_name='default'):
     app.register_blueprint(dashboard_bp, url_prefix='/')
     app.register_blueprint(product_bp, url_prefix='/product')
     app.register_blueprint(maintenance_bp)
+    app.register_blueprint(export_bp, url_prefix='/exportar')
+    
+    # Aplicar en segundo plano los movimientos de stock del diario local
+    if app.config.get('MOVEMENT_JOURNAL_ENABLED'):
+        MovementJournal.start_background_flusher()
+    
+    if app.config.get('REQUEST_METRICS_ENABLED'):
+        MetricsExporter.start_background_flusher()
+    
+    # Generar los QR que hayan quedado en cola (importaciones masivas)
+    QRQueue.start_background_worker()
+    
+    # Tareas recurrentes (planificación, reconciliación de KPIs, precalentar cachés).
+    # Sin programador, los KPIs del tablero CMMS se verifican con un hilo propio
+    register_default_jobs()
+    if app.config.get('SCHEDULER_ENABLED'):
+        JobScheduler.start()
+    else:
+        MaintenanceKpiStore.start_background_reconciler()
     
     return app
 
@@ -1,9 +1,12 @@
 """
 Rutas del dashboard
 """
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required
+from app.services.call_budget import call_budget
 from app.services.sheets_service import SheetsService
+from app.services.consumption_forecast import ConsumptionForecast
+from app.services.low_stock_index import low_stock_index
 import pandas as pd
 
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -19,6 +22,7 @@ def home():
 
 
 @dashboard_bp.route('/dashboard')
+@call_budget(2)
 @login_required
 def index():
     """
@@ -30,7 +34,8 @@ def index():
         
         return render_template(
             'dashboard/index.html',
-            inventory_data=inventory_data
+            inventory_data=inventory_data,
+            low_stock_count=low_stock_index.count()
         )
     except Exception as e:
         # En caso de error, mostrar dashboard vacío con mensaje
@@ -41,7 +46,29 @@ def index():
         )
 
 
+@dashboard_bp.route('/reposicion')
+@login_required
+def reorder():
+    """
+    Lista de reposición según el consumo del histórico de movimientos
+    (?formato=json para la API)
+    """
+    try:
+        report = ConsumptionForecast.report()
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        if request.args.get('formato') == 'json':
+            return jsonify({'ok': False, 'message': str(e)}), 500
+        return render_template('dashboard/reorder.html', report={}, error_message=f"Error al calcular la reposición: {e}")
+
+    if request.args.get('formato') == 'json':
+        return jsonify(report)
+    return render_template('dashboard/reorder.html', report=report)
+
+
 @dashboard_bp.route('/units-of-measure')
+@call_budget(2)
 @login_required
 def units_of_measure():
     """
@@ -0,0 +1,58 @@
+"""
+Rutas de exportación (CSV / XLSX) del inventario, movimientos y hojas CMMS
+"""
+from datetime import datetime
+from flask import Blueprint, abort, request, Response, stream_with_context
+from flask_login import login_required
+from app.services.call_budget import call_budget
+from app.services.export_service import ExportService, EXPORT_SOURCES
+
+export_bp = Blueprint('export', __name__)
+
+
+def _date_arg(name: str):
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        abort(400, description=f"{name} debe tener el formato AAAA-MM-DD.")
+
+
+@export_bp.route('/<source>')
+@call_budget(2)
+@login_required
+def export(source):
+    """
+    Descargar una hoja completa o filtrada. El archivo se genera mientras se
+    descarga la hoja, sin cargarla completa en memoria.
+
+    Query params:
+        formato: 'csv' (por defecto) o 'xlsx'
+        columnas: Columnas separadas por coma, en el orden deseado
+        desde, hasta: Rango de fechas AAAA-MM-DD (movimientos y hojas CMMS)
+    """
+    if source not in EXPORT_SOURCES:
+        abort(404)
+    formato = request.args.get('formato', 'csv').strip().lower()
+    columnas = [c for c in request.args.get('columnas', '').split(',') if c.strip()]
+    desde, hasta = _date_arg('desde'), _date_arg('hasta')
+
+    try:
+        body = ExportService.export(source, formato, columns=columnas or None, desde=desde, hasta=hasta)
+    except ValueError as e:
+        abort(400, description=str(e))
+    except Exception as e:
+        abort(502, description=f"Error al leer la hoja: {str(e)}")
+
+    filename = f"{source}-{datetime.now().strftime('%Y%m%d-%H%M')}.{formato}"
+    mimetype = (
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        if formato == 'xlsx' else 'text/csv; charset=utf-8'
+    )
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
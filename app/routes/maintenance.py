@@ -3,9 +3,13 @@ Plan de mantenimiento preventivo (CMMS) — modelo simplificado.
 CRUD habilitado para Maquinas, Activos y Mantenimientos.
 Historico solo lectura.
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
+from app.services.call_budget import call_budget
 from app.services.maintenance_service import MaintenanceService
+from app.services.preventive_planner import PreventivePlanner
+from app.services.job_scheduler import JobScheduler
+from app.services.reliability_analytics import ReliabilityAnalytics
 
 maintenance_bp = Blueprint('maintenance', __name__, url_prefix='/mantenimiento')
 
@@ -107,6 +111,7 @@ def _section(active_key: str, description: str, extra_note: str = ''):
         can_close_mantenimiento=_can_close_mantenimiento(),
         id_col_index=id_col_index,
         estado_col_index=estado_col_index,
+        estados_mantenimiento=MaintenanceService.ESTADOS_MANTENIMIENTO,
     )
 
 
@@ -156,6 +161,7 @@ def _crud_form(section: str, mode: str, record_id: str = None):
 
 
 @maintenance_bp.route('/')
+@call_budget(5)
 @login_required
 def dashboard():
     kpis = MaintenanceService.compute_kpis()
@@ -267,6 +273,28 @@ def historico():
     )
 
 
+@maintenance_bp.route('/analitica')
+@login_required
+def analitica():
+    """Confiabilidad y cumplimiento a partir del histórico (?formato=json para la API)"""
+    error_message = None
+    reporte = {}
+    try:
+        reporte = ReliabilityAnalytics.report()
+    except Exception as e:
+        error_message = f"Error al calcular la analítica: {e}"
+    if request.args.get('formato') == 'json':
+        if error_message:
+            return jsonify({'ok': False, 'message': error_message}), 500
+        return jsonify(reporte)
+    return render_template(
+        'maintenance/analytics.html',
+        active_section='analitica',
+        reporte=reporte,
+        error_message=error_message,
+    )
+
+
 @maintenance_bp.route('/mantenimiento/<mtto_id>/cerrar', methods=['POST'])
 @login_required
 def cerrar_mantenimiento(mtto_id: str):
@@ -279,6 +307,162 @@ def cerrar_mantenimiento(mtto_id: str):
     return redirect(url_for('maintenance.mantenimientos'))
 
 
+def _bulk_ids():
+    """IDs seleccionados: JSON {"ids": [...]} o campos de formulario ids=..."""
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        ids = payload.get('ids') or []
+    else:
+        ids = request.form.getlist('ids')
+    return [str(i).strip() for i in ids if str(i).strip()]
+
+
+def _bulk_response(section: str, ok: bool, msg: str):
+    if request.is_json:
+        return jsonify({'ok': ok, 'message': msg}), (200 if ok else 400)
+    flash(msg, 'success' if ok else 'error')
+    return redirect(url_for(f'maintenance.{section}'))
+
+
+def _bulk_denied(section: str, action: str):
+    if section not in MaintenanceService.CRUD_SECTIONS:
+        return _bulk_response(section if section in _labels() else 'dashboard', False, 'Sección no habilitada.')
+    allowed = _can_edit(section) if action == 'edit' else _can_delete(section)
+    if allowed:
+        return None
+    if request.is_json:
+        return jsonify({'ok': False, 'message': 'No tienes permisos para realizar esta acción.'}), 403
+    return _enforce_permission_or_redirect(section, action)
+
+
+@maintenance_bp.route('/lote/<section>/actualizar', methods=['POST'])
+@login_required
+def actualizar_lote(section: str):
+    """
+    Actualizar varios registros en una sola escritura.
+    JSON: {"updates": {"<id>": {"campo": "valor"}}} o {"ids": [...], "campo": ..., "valor": ...};
+    formulario: ids (repetido), campo, valor.
+    """
+    denied = _bulk_denied(section, 'edit')
+    if denied:
+        return denied
+
+    payload = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    updates = payload.get('updates') if request.is_json else None
+    if not isinstance(updates, dict):
+        campo = str(payload.get('campo', '')).strip()
+        if not campo:
+            return _bulk_response(section, False, 'Indica el campo a actualizar.')
+        updates = {rid: {campo: payload.get('valor', '')} for rid in _bulk_ids()}
+
+    if _is_limited_mantenimiento_editor(section):
+        updates = {
+            rid: {k: v for k, v in (fields or {}).items() if str(k).strip().lower() in LIMITED_MTTO_EDIT_FIELDS}
+            for rid, fields in updates.items()
+        }
+    updates = {str(rid).strip(): fields for rid, fields in updates.items() if fields}
+    ok, msg = MaintenanceService.bulk_update(section, updates)
+    return _bulk_response(section, ok, msg)
+
+
+@maintenance_bp.route('/lote/<section>/eliminar', methods=['POST'])
+@login_required
+def eliminar_lote(section: str):
+    denied = _bulk_denied(section, 'delete')
+    if denied:
+        return denied
+    ok, msg = MaintenanceService.bulk_delete(section, _bulk_ids())
+    return _bulk_response(section, ok, msg)
+
+
+@maintenance_bp.route('/lote/mantenimientos/estado', methods=['POST'])
+@login_required
+def mantenimientos_estado_lote():
+    denied = _bulk_denied('mantenimientos', 'edit')
+    if denied:
+        return denied
+    payload = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    ok, msg = MaintenanceService.bulk_set_estado(_bulk_ids(), payload.get('estado', ''))
+    return _bulk_response('mantenimientos', ok, msg)
+
+
+@maintenance_bp.route('/lote/mantenimientos/cerrar', methods=['POST'])
+@login_required
+def cerrar_mantenimientos_lote():
+    if not _can_close_mantenimiento():
+        if request.is_json:
+            return jsonify({'ok': False, 'message': 'No tienes permisos para realizar esta acción.'}), 403
+        return _enforce_permission_or_redirect('mantenimientos', 'close')
+    payload = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    cerrado_por = str(payload.get('cerrado_por', '')).strip() or getattr(current_user, 'username', 'Sistema')
+    ok, msg = MaintenanceService.close_mantenimientos(_bulk_ids(), cerrado_por)
+    return _bulk_response('mantenimientos', ok, msg)
+
+
+@maintenance_bp.route('/lote/mantenimientos/planificar', methods=['POST'])
+@login_required
+def planificar_preventivos():
+    """Generar los mantenimientos PROGRAMADO del horizonte a partir de los activos"""
+    if not _can_create('mantenimientos'):
+        if request.is_json:
+            return jsonify({'ok': False, 'message': 'No tienes permisos para realizar esta acción.'}), 403
+        return _enforce_permission_or_redirect('mantenimientos', 'create')
+    payload = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    try:
+        horizonte = int(payload.get('horizonte_dias') or 0) or None
+        resumen = PreventivePlanner.plan(
+            horizon_days=horizonte,
+            dry_run=str(payload.get('simular', '')).lower() in ('1', 'true', 'on'),
+        )
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return _bulk_response('mantenimientos', False, f'Error al planificar: {e}')
+
+    if request.is_json:
+        return jsonify({'ok': True, **resumen})
+    flash(
+        f"Planificación: {resumen['creados']} mantenimiento(s) programado(s), "
+        f"{resumen['existentes']} ya existían ({resumen['activos']} activos).",
+        'success'
+    )
+    if resumen['frecuencia_invalida']:
+        detalle = ", ".join(
+            f"{a['id_activo']} (fila {a['fila']}: '{a['frecuencia_dias']}')" for a in resumen['frecuencia_invalida'][:10]
+        )
+        flash(
+            f"{len(resumen['frecuencia_invalida'])} activo(s) sin planificar: frecuencia_dias debe ser un número "
+            f"entero de días mayor o igual a 1. {detalle}",
+            'warning'
+        )
+    return redirect(url_for('maintenance.mantenimientos'))
+
+
+@maintenance_bp.route('/tareas')
+@login_required
+def tareas():
+    """Tareas programadas y su historial de ejecuciones (JSON)"""
+    if not _is_full_access_user():
+        return jsonify({'ok': False, 'message': 'No tienes permisos para realizar esta acción.'}), 403
+    return jsonify({
+        'tareas': [job.to_dict() for job in JobScheduler.jobs()],
+        'historial': JobScheduler.history(request.args.get('tarea'), limit=request.args.get('limite', 50, type=int)),
+    })
+
+
+@maintenance_bp.route('/tareas/<name>/ejecutar', methods=['POST'])
+@login_required
+def ejecutar_tarea(name: str):
+    """Ejecutar una tarea programada de inmediato"""
+    if not _is_full_access_user():
+        return jsonify({'ok': False, 'message': 'No tienes permisos para realizar esta acción.'}), 403
+    try:
+        resultado = JobScheduler.run_job(name, trigger=f"manual:{getattr(current_user, 'username', '')}")
+    except KeyError as e:
+        return jsonify({'ok': False, 'message': str(e)}), 404
+    return jsonify({'ok': resultado['status'] == 'ok', **resultado})
+
+
 # Estructura legacy removida intencionalmente:
 # - /componentes
 # - /componentes-maquina
@@ -1,11 +1,26 @@
 """
 Rutas para detalle y edición de productos
 """
-from flask import Blueprint, render_template, abort, request, redirect, url_for, flash
+import math
+import re
+from flask import Blueprint, render_template, abort, request, redirect, url_for, flash, Response, stream_with_context, jsonify
 from flask_login import login_required, current_user
+from app.services.call_budget import call_budget
+from config import Config
 from app.services.sheets_service import SheetsService
+from app.services.inventory_snapshot import InventorySnapshot
 from app.services.sheets_writer import SheetsWriter
 from app.services.qr_service import QRService
+from app.services.label_service import LabelService, MAX_COLUMNS, MAX_ROWS
+from app.services.movement_journal import MovementJournal
+from app.services.inventory_index import find_id_column, normalize_id
+from app.services.sequence_allocator import SequenceAllocator, PRODUCT_ID_SEQUENCE, codigo_sequence
+from app.services.low_stock_index import low_stock_index
+from app.services.search_index import inventory_search_index
+from app.services.trigram_index import reference_trigram_index
+from app.services.request_metrics import RequestMetrics
+from app.services.product_lookup import product_lookup, record_etag, compact_number
+from app.services.product_import import ProductImporter
 
 product_bp = Blueprint('product', __name__)
 
@@ -17,8 +32,12 @@ UNIDAD_MEDIDA_OPCIONES = [
     'Galón', 'Caneca', 'Juegos', 'Kit'
 ]
 
+# Líneas aceptadas por petición en /product/movimientos
+BATCH_MOVEMENTS_MAX_LINES = 200
+
 
 @product_bp.route('/create', methods=['GET', 'POST'])
+@call_budget(6)
 @login_required
 def create():
     """
@@ -66,10 +85,21 @@ def _create_product(username: str):
     try:
         form_data = request.form.to_dict()
         
-        # Asignar ID automático (siguiente consecutivo)
-        product_id = str(SheetsService.get_next_product_id())
+        # Asignar ID automático (reserva atómica del siguiente consecutivo)
+        product_id = str(SequenceAllocator.allocate(PRODUCT_ID_SEQUENCE))
         form_data['ID'] = product_id
         
+        # Reservar el consecutivo del Codigo para la abreviatura elegida; el que se
+        # mostró en el formulario puede haberlo tomado otro usuario mientras tanto
+        abreviatura = form_data.pop('codigo_abrev', '').strip().upper()
+        if abreviatura:
+            consecutivo = SequenceAllocator.allocate(codigo_sequence(abreviatura))
+            code_key = next(
+                (k for k in form_data if str(k).strip().lower() in ('codigo', 'código')),
+                'Codigo'
+            )
+            form_data[code_key] = f'{abreviatura}-{consecutivo}'
+        
         # Crear producto en el inventario
         success = SheetsWriter.create_product_in_inventory(form_data)
         
@@ -105,8 +135,320 @@ def _create_product(username: str):
         return redirect(url_for('product.create'))
 
 
+@product_bp.route('/importar', methods=['GET', 'POST'])
+@call_budget(4)
+@login_required
+def import_products():
+    """
+    Importar productos en bloque desde un archivo CSV o XLSX.
+    Si alguna fila tiene errores no se crea ningún producto.
+    """
+    if request.method == 'GET':
+        return render_template(
+            'product/import.html',
+            codigo_opciones=CODIGO_OPCIONES,
+            unidad_medida_opciones=UNIDAD_MEDIDA_OPCIONES,
+            result=None
+        )
+
+    upload = request.files.get('archivo')
+    if upload is None or not upload.filename:
+        flash('Selecciona un archivo CSV o XLSX.', 'error')
+        return redirect(url_for('product.import_products'))
+    try:
+        df = ProductImporter.read_upload(upload.filename, upload.read())
+        result = ProductImporter.import_products(
+            df,
+            abbreviations=CODIGO_OPCIONES,
+            units=UNIDAD_MEDIDA_OPCIONES,
+            base_url=request.url_root.rstrip('/'),
+            dry_run=request.form.get('solo_validar') == '1'
+        )
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('product.import_products'))
+    except Exception as e:
+        flash(f'Error al importar los productos: {str(e)}', 'error')
+        import traceback
+        traceback.print_exc()
+        return redirect(url_for('product.import_products'))
+
+    if result['errores']:
+        flash(f"El archivo tiene errores en {len(result['errores'])} fila(s); no se creó ningún producto.", 'error')
+    elif result['creados']:
+        flash(f"{result['creados']} productos creados. Los QR se generan en segundo plano.", 'success')
+    else:
+        flash(f"{result['validas']} filas válidas. No se escribió nada (solo validación).", 'info')
+    return render_template(
+        'product/import.html',
+        codigo_opciones=CODIGO_OPCIONES,
+        unidad_medida_opciones=UNIDAD_MEDIDA_OPCIONES,
+        result=result
+    )
+
+
+@product_bp.route('/movimientos', methods=['POST'])
+@call_budget(5)
+@login_required
+def batch_movements():
+    """
+    Registrar varios movimientos en una sola petición (JSON), p. ej. desde un
+    lector de mano al despachar una orden de trabajo.
+
+    Body:
+        {"movimientos": [{"producto": "<ID, Codigo o Referencia>",
+                          "tipo": "ingreso" | "salida", "unidades": 3}, ...]}
+
+    Todas las líneas se validan contra un mismo snapshot del inventario
+    (varias líneas del mismo producto se acumulan en orden). Si alguna falla
+    no se registra ninguna; si no, el inventario se actualiza con un único
+    batchUpdate y el histórico con un único append.
+    """
+    payload = request.get_json(silent=True) or {}
+    lines = payload.get('movimientos')
+    if not isinstance(lines, list) or not lines:
+        return jsonify({'ok': False, 'message': 'Envía una lista "movimientos" con al menos una línea.'}), 400
+    if len(lines) > BATCH_MOVEMENTS_MAX_LINES:
+        return jsonify({'ok': False, 'message': f'Máximo {BATCH_MOVEMENTS_MAX_LINES} líneas por petición.'}), 400
+
+    try:
+        inventory_data = SheetsService.get_inventory_data()
+        if not inventory_data:
+            # Lectura fallida o inventario vacío: no es un error de las líneas
+            return jsonify({'ok': False, 'message': 'No se pudo leer el inventario. Intenta de nuevo.'}), 502
+        planned, errors = _plan_batch_movements(lines, inventory_data)
+        if errors:
+            return jsonify({'ok': False, 'message': 'No se registró ningún movimiento.', 'errores': errors}), 422
+
+        if MovementJournal.enabled():
+            # Todas las líneas en una transacción: si otra salida agotó el stock no queda ninguna a medias
+            MovementJournal.record_many([
+                {
+                    'product_id': move['key'],
+                    'stock_field': move['stock_field'],
+                    'delta': move['ajuste'],
+                    'base_stock': move['stock_base'],
+                    'fields': {},
+                    'history': _build_history_data(move['product'], {}, move['stock_nuevo'], move['tipo'], move['unidades']),
+                }
+                for move in planned
+            ], username=current_user.username)
+            written = {move['key'] for move in planned}
+        else:
+            # Estado final por producto (la última línea de cada uno trae el stock acumulado)
+            updates = {move['key']: {move['stock_field']: move['stock_nuevo']} for move in planned}
+            written = {normalize_id(pid) for pid in SheetsWriter.batch_update_products(updates)}
+            history = [
+                _build_history_data(move['product'], {}, move['stock_nuevo'], move['tipo'], move['unidades'])
+                for move in planned if move['key'] in written
+            ]
+            if history and not SheetsWriter.append_rows_to_history(history, current_user.username):
+                return jsonify({
+                    'ok': False,
+                    'message': 'Inventario actualizado, pero hubo un error al registrar el histórico.',
+                }), 502
+
+        for move in planned:
+            if move['key'] in written:
+                low_stock_index.record_stock(move['key'], move['stock_nuevo'])
+                if not MovementJournal.enabled():
+                    product_lookup.record_stock(move['key'], move['stock_nuevo'])
+    except ValueError as e:
+        return jsonify({'ok': False, 'message': str(e)}), 409
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'ok': False, 'message': f'Error al registrar los movimientos: {str(e)}'}), 500
+
+    return jsonify({
+        'ok': len(written) == len({move['key'] for move in planned}),
+        'diferido': MovementJournal.enabled(),
+        'movimientos': [
+            {
+                'linea': move['linea'], 'ID': move['key'], 'Codigo': move['codigo'],
+                'tipo': move['tipo'], 'unidades': move['unidades'],
+                'stock_anterior': move['stock_anterior'], 'stock_nuevo': move['stock_nuevo'],
+                'registrado': move['key'] in written,
+            }
+            for move in planned
+        ],
+    })
+
+
+@product_bp.route('/secuencias')
+@login_required
+def sequences():
+    """
+    Marcas altas de las secuencias (ID de producto y consecutivo por abreviatura de Codigo)
+    """
+    return jsonify(SequenceAllocator.high_water_marks())
+
+
+@product_bp.route('/bajo-stock')
+@call_budget(2)
+@login_required
+def low_stock():
+    """
+    Productos con cantidad <= Stock-min (JSON), desde el índice precalculado.
+    Filtros: ubicacion y codigo (prefijos), q (texto en Referencia/Descripcion), agotados=1
+    """
+    if not low_stock_index.is_built():
+        SheetsService.get_inventory_data()
+    items = low_stock_index.breaches(
+        ubicacion=request.args.get('ubicacion'),
+        codigo=request.args.get('codigo'),
+        q=request.args.get('q'),
+        solo_agotados=request.args.get('agotados') in ('1', 'true', 'on'),
+    )
+    return jsonify({
+        'total': low_stock_index.count(),
+        'filtrados': len(items),
+        'antiguedad_segundos': round(low_stock_index.age_seconds() or 0, 1),
+        'productos': items,
+    })
+
+
+@product_bp.route('/buscar')
+@call_budget(2)
+@login_required
+def search():
+    """
+    Búsqueda de texto en Descripcion, Referencia, Codigo y Ubicación (JSON).
+    Sin tildes ni mayúsculas; el último término también coincide como prefijo.
+    """
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limite', 50)), 1), 500)
+    except ValueError:
+        limit = 50
+    if not inventory_search_index.is_built():
+        SheetsService.get_inventory_data()
+    results = inventory_search_index.search(query, limit=limit) if query else []
+    return jsonify({'q': query, 'total': len(results), 'productos': results})
+
+
+@product_bp.route('/sugerencias')
+@call_budget(2)
+@login_required
+def suggestions():
+    """
+    Autocompletado por Referencia o Codigo aproximados (JSON), tolerante a
+    separadores faltantes y caracteres transpuestos
+    """
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limite', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    if not reference_trigram_index.is_built():
+        SheetsService.get_inventory_data()
+    results = reference_trigram_index.suggest(query, limit=limit) if query else []
+    return jsonify({'q': query, 'total': len(results), 'productos': results})
+
+
+@product_bp.route('/escaneo/<product_id>')
+@call_budget(2)
+@login_required
+def scan(product_id):
+    """
+    Vista compacta para el escaneo de un QR (ID, Codigo o Referencia).
+    Se sirve desde el snapshot del inventario con ETag, así que un reescaneo
+    sin cambios responde 304 sin cuerpo.
+
+    Query params:
+        formato: 'json' para solo Codigo, Referencia, cantidad, Ubicación y Stock-min
+    """
+    as_json = request.args.get('formato', '').strip().lower() == 'json'
+    age = product_lookup.age_seconds()
+    fresh = age is not None and age <= Config.SCAN_SNAPSHOT_MAX_AGE_SECONDS
+    RequestMetrics.increment('cache', cache='escaneo_snapshot', resultado='hit' if fresh else 'miss')
+    if not fresh:
+        try:
+            InventorySnapshot.publish(SheetsService.read_google_sheet())
+        except Exception as e:
+            # Con un snapshot anterior se sigue respondiendo; se reintenta cuando vuelva a vencer
+            print(f"⚠️ No se pudo actualizar el inventario para el escaneo: {e}")
+            product_lookup.mark_checked()
+    if not product_lookup.is_built():
+        abort(502, description='No se pudo leer el inventario.')
+
+    record = product_lookup.get(product_id)
+    if record is None:
+        if as_json:
+            return jsonify({'ok': False, 'message': f'Producto "{product_id}" no encontrado.'}), 404
+        suggestions = reference_trigram_index.suggest(product_id, limit=8)
+        return render_template('product/not_found.html', product_id=product_id, suggestions=suggestions), 404
+
+    if MovementJournal.enabled() and record.get('cantidad') is not None:
+        record['cantidad'] = compact_number(MovementJournal.current_stock(record['ID'], record['cantidad']))
+    if as_json:
+        record = {k: record.get(k) for k in ('ID', 'Codigo', 'Referencia', 'cantidad', 'Ubicación', 'Stock-min')}
+
+    etag = record_etag({'formato': 'json' if as_json else 'html', **record})
+    not_modified = request.if_none_match.contains(etag)
+    RequestMetrics.increment('cache', cache='escaneo_etag', resultado='hit' if not_modified else 'miss')
+    if not_modified:
+        response = Response(status=304)
+    elif as_json:
+        response = jsonify(record)
+    else:
+        stock_min = record.get('Stock-min')
+        bajo_minimo = stock_min is not None and record.get('cantidad') is not None and record['cantidad'] <= stock_min
+        response = Response(render_template('product/scan.html', product=record, bajo_minimo=bajo_minimo))
+    response.set_etag(etag)
+    # Siempre se revalida: el stock cambia con cada movimiento
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@product_bp.route('/etiquetas')
+@call_budget(2)
+@login_required
+def labels():
+    """
+    Descargar una hoja de etiquetas (QR + Codigo + Referencia) para los productos
+    que cumplan el filtro. La respuesta se genera y envía página por página.
+
+    Query params:
+        codigo: Patrón de código (ej. RMEC o RMEC-*)
+        ubicacion: Texto contenido en la ubicación
+        formato: 'pdf' (por defecto) o 'png' (ZIP con una imagen por página)
+        columnas, filas: Distribución de etiquetas por página
+    """
+    codigo = request.args.get('codigo', '').strip()
+    ubicacion = request.args.get('ubicacion', '').strip()
+    formato = request.args.get('formato', 'pdf').strip().lower()
+    if formato not in ('pdf', 'png'):
+        abort(400, description='Formato no soportado. Use pdf o png.')
+    try:
+        columnas = int(request.args.get('columnas', 3))
+        filas = int(request.args.get('filas', 8))
+    except ValueError:
+        abort(400, description='columnas y filas deben ser números enteros.')
+    # Se valida antes de empezar a transmitir: un error a mitad de la respuesta la deja truncada
+    if not 1 <= columnas <= MAX_COLUMNS or not 1 <= filas <= MAX_ROWS:
+        abort(400, description=f'columnas debe estar entre 1 y {MAX_COLUMNS} y filas entre 1 y {MAX_ROWS}.')
+
+    inventory_data = SheetsService.get_inventory_data()
+    products = LabelService.filter_products(inventory_data, codigo=codigo, ubicacion=ubicacion)
+    pages = LabelService.iter_pages(products, request.url_root, columns=columnas, rows=filas)
+
+    nombre = 'etiquetas-' + (re.sub(r'[^A-Za-z0-9_-]', '', codigo).rstrip('-') or 'inventario')
+    if formato == 'png':
+        body, mimetype, filename = LabelService.stream_png_zip(pages), 'application/zip', f"{nombre}.zip"
+    else:
+        body, mimetype, filename = LabelService.stream_pdf(pages), 'application/pdf', f"{nombre}.pdf"
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
 @product_bp.route('/<product_id>', methods=['GET', 'POST'])
 @product_bp.route('/detail/<product_id>', methods=['GET', 'POST'])
+@call_budget(7)
 @login_required
 def detail(product_id):
     """
@@ -120,6 +462,12 @@ def detail(product_id):
         product = SheetsService.get_product_by_id(product_id)
         
         if not product:
+            # ¿Quisiste decir...? Referencias y códigos parecidos (guiones faltantes, letras cambiadas)
+            suggestions = reference_trigram_index.suggest(product_id, limit=8) if request.method == 'GET' else []
+            if suggestions:
+                return render_template(
+                    'product/not_found.html', product_id=product_id, suggestions=suggestions
+                ), 404
             flash(f'Producto con ID "{product_id}" no encontrado.', 'error')
             return redirect(url_for('dashboard.index'))
         
@@ -127,7 +475,10 @@ def detail(product_id):
         if request.method == 'POST':
             return _save_product(product_id, product, current_user.username)
         
-        # Si es GET, mostrar formulario de edición
+        # Si es GET, mostrar formulario de edición (con los movimientos del diario aún no sincronizados)
+        if MovementJournal.enabled():
+            product = MovementJournal.overlay(product)
+        
         return render_template(
             'product/detail.html',
             product=product,
@@ -225,6 +576,11 @@ def _save_product(product_id: str, original_product: dict, username: str):
             flash('No se pudo determinar el stock actual del producto. Verifique que exista un campo "cantidad" o "stock".', 'error')
             return redirect(url_for('product.detail', product_id=product_id))
         
+        # Los movimientos confirmados en el diario que aún no están en la hoja también cuentan
+        stock_base = stock_actual
+        if MovementJournal.enabled():
+            stock_actual = MovementJournal.current_stock(_product_key(original_product, product_id), stock_actual)
+        
         # Calcular nuevo stock
         nuevo_stock = stock_actual + ajuste
         
@@ -244,67 +600,38 @@ def _save_product(product_id: str, original_product: dict, username: str):
         # Actualizar el stock
         updated_data[stock_field] = nuevo_stock
         
-        # Actualizar producto en el inventario
-        try:
-            success = SheetsWriter.update_product_in_inventory(product_id, updated_data)
-            
-            if not success:
-                flash('Error al actualizar el producto en el inventario. Verifique las credenciales de Google Sheets.', 'error')
-                return redirect(url_for('product.detail', product_id=product_id))
-        except FileNotFoundError as e:
-            flash('No se encontró el archivo credentials.json. Colóquelo en app/static/Credenciales/ o en la raíz del proyecto.', 'error')
-            return redirect(url_for('product.detail', product_id=product_id))
-        except Exception as e:
-            error_msg = str(e)
-            if 'Google Sheets API no está habilitada' in error_msg:
-                flash(
-                    '❌ Google Sheets API no está habilitada. '
-                    'Habilítala en: https://console.developers.google.com/apis/api/sheets.googleapis.com/overview?project=1012866464546',
-                    'error'
+        # Con el diario de movimientos el movimiento se confirma al guardarse localmente
+        # y se aplica a Google Sheets en segundo plano
+        if MovementJournal.enabled():
+            try:
+                MovementJournal.record(
+                    product_id=_product_key(original_product, product_id),
+                    stock_field=stock_field,
+                    delta=ajuste,
+                    base_stock=stock_base,
+                    fields={k: v for k, v in updated_data.items() if k != stock_field},
+                    history=_build_history_data(original_product, form_data, nuevo_stock, tipo_movimiento, unidades) if ajuste != 0 else None,
+                    username=username
                 )
-            else:
-                flash(f'Error al actualizar el producto: {error_msg}', 'error')
-            import traceback
-            traceback.print_exc()
-            return redirect(url_for('product.detail', product_id=product_id))
-        
-        # Registrar movimiento en histórico (solo si hay ajuste)
-        if ajuste != 0:
-            # Función helper para buscar campo case-insensitive
-            def get_field(data, possible_names):
-                for name in possible_names:
-                    # Buscar exacto
-                    if name in data:
-                        return data[name]
-                    # Buscar case-insensitive
-                    for key in data.keys():
-                        if str(key).strip().lower() == name.lower():
-                            return data[key]
-                return ''
-            
-            # Preparar datos para el histórico
-            history_data = {
-                'Codigo': get_field(original_product, ['Codigo', 'Código', 'codigo', 'CODIGO']) or get_field(form_data, ['Codigo', 'Código', 'codigo']),
-                'Referencia': get_field(original_product, ['Referencia', 'referencia']) or get_field(form_data, ['Referencia']),
-                'Descripcion': get_field(original_product, ['Descripcion', 'Descripción', 'descripcion']) or get_field(form_data, ['Descripcion', 'Descripción']),
-                'Unidad-medida': get_field(original_product, ['Unidad-medida', 'Unidad medida', 'unidad-medida']) or get_field(form_data, ['Unidad-medida']),
-                'cantidad': nuevo_stock,  # Stock final después del ajuste
-                'Ubicación': get_field(original_product, ['Ubicación', 'Ubicacion', 'ubicación']) or get_field(form_data, ['Ubicación', 'Ubicacion']),
-                'Stock-min': get_field(original_product, ['Stock-min', 'Stock min', 'stock-min']) or get_field(form_data, ['Stock-min']),
-                'Estado': get_field(original_product, ['Estado', 'estado']) or get_field(form_data, ['Estado']),
-                'Metodo': 'Ingreso' if tipo_movimiento == 'ingreso' else 'Salida',
-                'UnidadesUtilizadas': unidades,  # Unidades utilizadas (siempre positivo)
-            }
-            
-            # Registrar en histórico
-            history_success = SheetsWriter.append_row_to_history(history_data, username)
-            
-            if not history_success:
-                flash('Producto actualizado, pero hubo un error al registrar el movimiento en el histórico.', 'warning')
-            else:
-                flash('Producto actualizado y movimiento registrado correctamente.', 'success')
+            except ValueError as e:
+                flash(str(e), 'error')
+                return redirect(url_for('product.detail', product_id=product_id))
+            flash('Movimiento registrado. Se sincronizará con Google Sheets en unos segundos.', 'success')
         else:
-            flash('Producto actualizado correctamente (sin ajuste de unidades).', 'success')
+            error_response = _write_movement(product_id, original_product, form_data, updated_data,
+                                             nuevo_stock, ajuste, tipo_movimiento, unidades, username)
+            if error_response is not None:
+                return error_response
+        
+        # Mantener al día las alertas de stock bajo sin esperar al próximo snapshot
+        low_stock_index.record_stock(
+            _product_key(original_product, product_id),
+            nuevo_stock,
+            stock_min=next((v for k, v in updated_data.items() if str(k).strip().lower() == 'stock-min'), None)
+        )
+        if not MovementJournal.enabled():
+            # Con el diario, la vista de escaneo suma los movimientos pendientes
+            product_lookup.record_stock(_product_key(original_product, product_id), nuevo_stock)
         
         # Generar QR para el producto (si no existe)
         try:
@@ -345,3 +672,178 @@ def _save_product(product_id: str, original_product: dict, username: str):
         traceback.print_exc()
         return redirect(url_for('product.detail', product_id=product_id))
 
+def _stock_field(product: dict):
+    """Nombre y valor numérico de la columna de stock (cantidad/stock), o (None, 0)"""
+    for key, value in product.items():
+        if str(key).strip().lower() in ('cantidad', 'stock'):
+            try:
+                number = float(value) if value is not None and str(value).strip() else 0.0
+            except (TypeError, ValueError):
+                number = 0.0
+            # Celda vacía en una columna numérica: pandas la entrega como NaN
+            return key, 0.0 if number != number else number
+    return None, 0.0
+
+
+def _plan_batch_movements(lines: list, inventory_data: list):
+    """
+    Validar las líneas de un lote de movimientos contra un snapshot
+
+    Returns:
+        (movimientos planificados en orden, errores por línea)
+    """
+    by_id, by_ref = {}, {}
+    for product in inventory_data:
+        for key, value in product.items():
+            name = str(key).strip().lower()
+            if value is None or str(value).strip() == '':
+                continue
+            if name in ('id', 'codigo', 'código'):
+                by_id.setdefault(normalize_id(value).upper(), product)
+            elif name == 'referencia':
+                by_ref.setdefault(str(value).strip().upper(), product)
+
+    running, planned, errors = {}, [], []
+    for number, line in enumerate(lines, start=1):
+        line = line if isinstance(line, dict) else {}
+        ref = str(line.get('producto') or '').strip().upper()
+        tipo = str(line.get('tipo') or '').strip().lower()
+        product = by_id.get(normalize_id(ref).upper()) or by_ref.get(ref)
+        problems = []
+        if not ref:
+            problems.append('Falta el producto.')
+        elif product is None:
+            problems.append(f'Producto "{line.get("producto")}" no encontrado.')
+        if tipo not in ('ingreso', 'salida'):
+            problems.append('El tipo debe ser ingreso o salida.')
+        try:
+            unidades = float(line.get('unidades'))
+            if not math.isfinite(unidades):
+                raise ValueError(unidades)
+            if unidades <= 0:
+                problems.append('Las unidades deben ser mayor a 0.')
+        except (TypeError, ValueError):
+            unidades = 0
+            problems.append('Las unidades deben ser un número válido.')
+
+        stock_field = None
+        if product is not None:
+            stock_field, stock = _stock_field(product)
+            if stock_field is None:
+                problems.append('El producto no tiene columna de cantidad/stock.')
+        if problems:
+            errors.append({'linea': number, 'producto': line.get('producto'), 'errores': problems})
+            continue
+
+        key = _product_key(product, ref)
+        if key not in running:
+            running[key] = (stock, MovementJournal.current_stock(key, stock) if MovementJournal.enabled() else stock)
+        stock_base, actual = running[key]
+        ajuste = unidades if tipo == 'ingreso' else -unidades
+        nuevo = actual + ajuste
+        if nuevo < 0:
+            errors.append({'linea': number, 'producto': line.get('producto'), 'errores': [
+                f'El stock resultante sería negativo ({nuevo:g}). Stock disponible: {actual:g}.'
+            ]})
+        running[key] = (stock_base, nuevo)
+        planned.append({
+            'linea': number, 'key': key, 'product': product, 'stock_field': stock_field,
+            'codigo': next((v for k, v in product.items() if str(k).strip().lower() in ('codigo', 'código')), ''),
+            'tipo': tipo, 'unidades': unidades, 'ajuste': ajuste, 'stock_base': stock_base,
+            'stock_anterior': actual, 'stock_nuevo': nuevo,
+        })
+    return planned, errors
+
+
+def _product_key(product: dict, fallback: str) -> str:
+    """
+    ID real del producto (columna ID). La URL puede traer la Referencia,
+    pero el inventario y el diario se indexan por ID.
+    """
+    headers = list(product.keys())
+    id_col = find_id_column(headers)
+    if id_col is not None:
+        key = normalize_id(product[headers[id_col]])
+        if key:
+            return key
+    return normalize_id(fallback)
+
+
+def _build_history_data(original_product: dict, form_data: dict, nuevo_stock: float,
+                        tipo_movimiento: str, unidades: float) -> dict:
+    """
+    Preparar los datos de un movimiento para el histórico
+    """
+    # Función helper para buscar campo case-insensitive
+    def get_field(data, possible_names):
+        for name in possible_names:
+            # Buscar exacto
+            if name in data:
+                return data[name]
+            # Buscar case-insensitive
+            for key in data.keys():
+                if str(key).strip().lower() == name.lower():
+                    return data[key]
+        return ''
+    
+    return {
+        'Codigo': get_field(original_product, ['Codigo', 'Código', 'codigo', 'CODIGO']) or get_field(form_data, ['Codigo', 'Código', 'codigo']),
+        'Referencia': get_field(original_product, ['Referencia', 'referencia']) or get_field(form_data, ['Referencia']),
+        'Descripcion': get_field(original_product, ['Descripcion', 'Descripción', 'descripcion']) or get_field(form_data, ['Descripcion', 'Descripción']),
+        'Unidad-medida': get_field(original_product, ['Unidad-medida', 'Unidad medida', 'unidad-medida']) or get_field(form_data, ['Unidad-medida']),
+        'cantidad': nuevo_stock,  # Stock final después del ajuste
+        'Ubicación': get_field(original_product, ['Ubicación', 'Ubicacion', 'ubicación']) or get_field(form_data, ['Ubicación', 'Ubicacion']),
+        'Stock-min': get_field(original_product, ['Stock-min', 'Stock min', 'stock-min']) or get_field(form_data, ['Stock-min']),
+        'Estado': get_field(original_product, ['Estado', 'estado']) or get_field(form_data, ['Estado']),
+        'Metodo': 'Ingreso' if tipo_movimiento == 'ingreso' else 'Salida',
+        'UnidadesUtilizadas': unidades,  # Unidades utilizadas (siempre positivo)
+    }
+
+
+def _write_movement(product_id: str, original_product: dict, form_data: dict, updated_data: dict,
+                    nuevo_stock: float, ajuste: float, tipo_movimiento: str, unidades: float, username: str):
+    """
+    Escribir el movimiento directamente en Google Sheets (inventario + histórico)
+    
+    Returns:
+        Redirect de error o None si el producto se actualizó
+    """
+    # Actualizar producto en el inventario
+    try:
+        success = SheetsWriter.update_product_in_inventory(product_id, updated_data)
+
+        if not success:
+            flash('Error al actualizar el producto en el inventario. Verifique las credenciales de Google Sheets.', 'error')
+            return redirect(url_for('product.detail', product_id=product_id))
+    except FileNotFoundError as e:
+        flash('No se encontró el archivo credentials.json. Colóquelo en app/static/Credenciales/ o en la raíz del proyecto.', 'error')
+        return redirect(url_for('product.detail', product_id=product_id))
+    except Exception as e:
+        error_msg = str(e)
+        if 'Google Sheets API no está habilitada' in error_msg:
+            flash(
+                '❌ Google Sheets API no está habilitada. '
+                'Habilítala en: https://console.developers.google.com/apis/api/sheets.googleapis.com/overview?project=1012866464546',
+                'error'
+            )
+        else:
+            flash(f'Error al actualizar el producto: {error_msg}', 'error')
+        import traceback
+        traceback.print_exc()
+        return redirect(url_for('product.detail', product_id=product_id))
+
+    # Registrar movimiento en histórico (solo si hay ajuste)
+    if ajuste != 0:
+        history_data = _build_history_data(original_product, form_data, nuevo_stock, tipo_movimiento, unidades)
+        
+        # Registrar en histórico
+        history_success = SheetsWriter.append_row_to_history(history_data, username)
+
+        if not history_success:
+            flash('Producto actualizado, pero hubo un error al registrar el movimiento en el histórico.', 'warning')
+        else:
+            flash('Producto actualizado y movimiento registrado correctamente.', 'success')
+    else:
+        flash('Producto actualizado correctamente (sin ajuste de unidades).', 'success')
+    
+    return None
@@ -1,8 +1,10 @@
 """
 Servicio de autenticación
 """
+import time
 from werkzeug.security import check_password_hash, generate_password_hash
 from flask_login import UserMixin
+from config import Config
 from app.services.sheets_service import SheetsService
 
 
@@ -14,12 +16,22 @@ class User(UserMixin):
         self.id = user_id
         self.username = username
     
+    # (hora de lectura, usuarios) de la última lectura correcta de la hoja
+    _users_cache = None
+
     @staticmethod
-    def _get_users_from_sheet():
+    def _get_users_from_sheet(max_age: float = None):
         """
         Obtener usuarios desde Google Sheets
         Retorna diccionario vacío si hay error (fallback silencioso)
+
+        Args:
+            max_age: Segundos que se acepta la última lectura en lugar de
+                     descargar la hoja (None: leer siempre)
         """
+        cached = User._users_cache
+        if max_age and cached is not None and time.time() - cached[0] <= max_age:
+            return cached[1]
         try:
             users_data = SheetsService.get_users_data()
             # Convertir a diccionario para búsqueda rápida
@@ -29,6 +41,7 @@ class User(UserMixin):
                 password = str(user.get('password', ''))  # NO hacer strip aquí
                 if username and password:
                     users_dict[username] = {'password': password}
+            User._users_cache = (time.time(), users_dict)
             return users_dict
         except Exception as e:
             print(f"Error al obtener usuarios: {e}")
@@ -37,9 +50,11 @@ class User(UserMixin):
     @staticmethod
     def get(user_id):
         """
-        Obtener usuario por ID desde Google Sheets
+        Obtener usuario por ID desde Google Sheets. Se llama en cada petición
+        autenticada, así que usa la lectura reciente de la hoja (USERS_CACHE_SECONDS);
+        el login siempre lee la hoja.
         """
-        users = User._get_users_from_sheet()
+        users = User._get_users_from_sheet(max_age=Config.USERS_CACHE_SECONDS)
         if user_id in users:
             return User(user_id, user_id)
         return None
@@ -0,0 +1,138 @@
+"""
+Presupuesto de llamadas externas por ruta (detector de N+1).
+
+Una ruta declara cuántas lecturas/escrituras a Google puede hacer por
+petición con @call_budget(n). Al terminar la petición se cuentan las
+llamadas de la traza de RequestMetrics (CSV, Sheets API, Drive API): si se
+excede el presupuesto se registra una advertencia, o se lanza
+CallBudgetExceeded en modo 'raise' (y siempre con app.testing), para que una
+regresión como descargar la misma hoja varias veces haga fallar las pruebas.
+Cada lectura repetida del mismo recurso ((sheet, gid) o URL de la API) se
+informa con la pila de llamadas que la hizo.
+
+Los presupuestos incluyen una lectura de la hoja de usuarios: la sesión la
+relee cuando vence USERS_CACHE_SECONDS.
+"""
+import os
+from typing import Dict, List, Optional
+
+from flask import current_app, request
+
+from config import Config
+from app.services.request_metrics import RequestMetrics, RequestTrace
+
+
+# Categorías de RequestMetrics que cuentan como llamadas externas
+EXTERNAL_CATEGORIES = ('sheets_csv', 'sheets_api', 'drive_api')
+
+MODE_OFF = 'off'
+MODE_WARN = 'warn'
+MODE_RAISE = 'raise'
+
+# Marcos de la pila que se muestran por lectura repetida (solo código del proyecto)
+STACK_FRAMES = 8
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class CallBudgetExceeded(AssertionError):
+    """Una petición hizo más llamadas externas que las declaradas para su ruta"""
+
+
+def call_budget(max_calls: int):
+    """
+    Declarar el máximo de llamadas externas por petición de una ruta.
+    Va justo debajo de @blueprint.route (sobre @login_required):
+
+        @product_bp.route('/escaneo/<product_id>')
+        @call_budget(2)
+        @login_required
+        def scan(product_id): ...
+    """
+    def decorator(view):
+        view.call_budget = max_calls
+        return view
+    return decorator
+
+
+def _project_frames(stack: List[str]) -> List[str]:
+    frames = [
+        frame for frame in stack
+        if _PROJECT_ROOT in frame and 'site-packages' not in frame
+        and 'request_metrics.py' not in frame and 'contextlib.py' not in frame
+    ]
+    return frames[-STACK_FRAMES:]
+
+
+def budget_report(trace: RequestTrace, budget: Optional[int]) -> Optional[str]:
+    """
+    Texto con las llamadas de la petición si excede el presupuesto o repite
+    lecturas; None si no hay nada que informar
+    """
+    calls = sum(trace.stats[c].count for c in EXTERNAL_CATEGORIES if c in trace.stats)
+    exceeded = budget is not None and calls > budget
+    if not exceeded and not trace.repeated_stacks:
+        return None
+
+    by_category = ', '.join(
+        f'{c}={trace.stats[c].count}' for c in EXTERNAL_CATEGORIES if c in trace.stats
+    )
+    if exceeded:
+        lines = [f"Presupuesto de llamadas excedido en {trace.endpoint}: {calls} llamadas externas "
+                 f"(máximo {budget}; {by_category})"]
+    else:
+        lines = [f"Lecturas repetidas en {trace.endpoint}: {calls} llamadas externas ({by_category})"]
+    for (category, resource), stacks in trace.repeated_stacks.items():
+        lines.append(f"  ↻ {category} {resource} leído {trace.fetches[(category, resource)]} veces")
+        for number, stack in enumerate(stacks, start=2):
+            lines.append(f"    lectura #{number}:")
+            lines.extend('      ' + frame.rstrip().replace('\n', '\n      ') for frame in _project_frames(stack))
+    return '\n'.join(lines)
+
+
+class CallBudget:
+    """
+    Verificación del presupuesto al final de cada petición
+    """
+
+    @staticmethod
+    def mode(app) -> str:
+        if app.testing:
+            return MODE_RAISE
+        return (app.config.get('CALL_BUDGET_MODE') or Config.CALL_BUDGET_MODE).strip().lower()
+
+    @staticmethod
+    def budget_for_endpoint(app, endpoint: Optional[str]) -> Optional[int]:
+        view = app.view_functions.get(endpoint) if endpoint else None
+        return getattr(view, 'call_budget', None)
+
+    @staticmethod
+    def budgets(app) -> Dict[str, int]:
+        """Presupuestos declarados por endpoint"""
+        return {
+            endpoint: view.call_budget
+            for endpoint, view in sorted(app.view_functions.items())
+            if getattr(view, 'call_budget', None) is not None
+        }
+
+    @staticmethod
+    def init_app(app):
+        """
+        Registrar la verificación (requiere el middleware de RequestMetrics,
+        inicializado antes para que su traza siga activa aquí)
+        """
+
+        @app.after_request
+        def _check_budget(response):
+            mode = CallBudget.mode(current_app)
+            trace = RequestMetrics.current_trace()
+            if mode == MODE_OFF or trace is None:
+                return response
+            budget = CallBudget.budget_for_endpoint(current_app, request.endpoint)
+            report = budget_report(trace, budget)
+            if report is None:
+                return response
+            calls = sum(trace.stats[c].count for c in EXTERNAL_CATEGORIES if c in trace.stats)
+            if mode == MODE_RAISE and budget is not None and calls > budget:
+                raise CallBudgetExceeded(report)
+            print(f"⚠️ {report}")
+            return response
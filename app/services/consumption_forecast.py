@@ -0,0 +1,199 @@
+"""
+Pronóstico de consumo y lista de reposición a partir del histórico de
+movimientos (HISTORY_SHEET_URL).
+
+El consumo diario por Codigo (suma de UnidadesUtilizadas de las Salidas) se
+guarda como agregado en memoria y cada actualización procesa solo las filas
+del histórico agregadas desde la anterior. Las tasas se calculan con
+ventanas de 7, 30 y 90 días y se cruzan con cantidad y Stock-min del último
+snapshot del inventario para estimar los días hasta el agotamiento.
+"""
+import math
+import threading
+from datetime import date, datetime
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from app.services.inventory_snapshot import InventorySnapshot
+from app.services.sheets_service import SheetsService
+from app.services.sheet_frames import columns_map, first_pending_row, fingerprint, parse_sheet_dates
+
+
+WINDOWS = (7, 30, 90)
+
+
+def _first(cols: Dict[str, str], names) -> Optional[str]:
+    return next((cols[n] for n in names if n in cols), None)
+
+
+def _codes(series: pd.Series) -> pd.Series:
+    return series.fillna('').astype(str).str.strip().str.upper()
+
+
+class ConsumptionForecast:
+    """
+    Agregados de consumo diario (uno por proceso) y lista de reposición
+    """
+
+    _lock = threading.Lock()
+    _rows = 0
+    _last_fingerprint: Optional[str] = None
+    _version = 0
+    _daily: pd.Series = pd.Series(dtype='float64')
+    _report: Optional[Dict] = None
+    _report_key = None
+
+    @staticmethod
+    def daily_consumption(batch: pd.DataFrame) -> pd.Series:
+        """
+        Consumo (Salidas) por Codigo y día de un bloque del histórico
+
+        Returns:
+            Serie con índice (codigo, fecha) y unidades consumidas
+        """
+        empty = pd.Series(dtype='float64', index=pd.MultiIndex.from_arrays([[], []], names=['codigo', 'fecha']))
+        if batch is None or batch.empty:
+            return empty
+        cols = columns_map(batch)
+        code_col = _first(cols, ['codigo', 'código'])
+        date_col = _first(cols, ['fechamovimiento', 'fecha movimiento', 'fecha'])
+        units_col = _first(cols, ['unidadesutilizadas', 'unidades utilizadas'])
+        method_col = _first(cols, ['metodo', 'método'])
+        if not all([code_col, date_col, units_col, method_col]):
+            return empty
+
+        fechas = parse_sheet_dates(batch[date_col])
+        frame = pd.DataFrame({
+            'codigo': _codes(batch[code_col]),
+            'fecha': fechas,
+            'unidades': pd.to_numeric(batch[units_col], errors='coerce').abs(),
+        })
+        salida = batch[method_col].astype(str).str.strip().str.lower().str.startswith('salida')
+        frame = frame[salida & frame['codigo'].ne('') & frame['fecha'].notna() & frame['unidades'].gt(0)]
+        if frame.empty:
+            return empty
+        return frame.groupby(['codigo', 'fecha'])['unidades'].sum()
+
+    @staticmethod
+    def refresh() -> int:
+        """
+        Leer el histórico y agregar solo las filas nuevas. Si una fila ya
+        procesada cambió o desapareció, se reconstruye todo.
+
+        Returns:
+            Versión de los agregados
+        """
+        df = SheetsService.read_google_sheet(Config.HISTORY_SHEET_URL)
+        rows = 0 if df is None else len(df.index)
+        with ConsumptionForecast._lock:
+            cls = ConsumptionForecast
+            processed = first_pending_row(df, cls._rows, cls._last_fingerprint)
+            if processed < cls._rows:
+                cls._daily = pd.Series(dtype='float64')
+                cls._version += 1
+            if rows > processed:
+                new = cls.daily_consumption(df.iloc[processed:])
+                cls._daily = new if cls._daily.empty else cls._daily.add(new, fill_value=0)
+                cls._last_fingerprint = fingerprint(df, rows)
+                cls._version += 1
+            cls._rows = rows
+            return cls._version
+
+    @staticmethod
+    def rates(today: Optional[date] = None) -> pd.DataFrame:
+        """Consumo medio diario por Codigo en cada ventana y fecha del último consumo"""
+        columns = [f'consumo_{w}d' for w in WINDOWS] + ['ultimo_consumo']
+        daily = ConsumptionForecast._daily
+        if daily.empty:
+            return pd.DataFrame(columns=columns)
+        frame = daily.rename('unidades').reset_index()
+        age = (pd.Timestamp(today or date.today()) - frame['fecha']).dt.days
+        out = pd.DataFrame(index=pd.Index(frame['codigo'].unique(), name='codigo'))
+        for window in WINDOWS:
+            inside = frame[(age >= 0) & (age < window)]
+            out[f'consumo_{window}d'] = inside.groupby('codigo')['unidades'].sum() / window
+        out['ultimo_consumo'] = frame.groupby('codigo')['fecha'].max().dt.strftime('%Y-%m-%d')
+        return out.fillna({f'consumo_{w}d': 0.0 for w in WINDOWS})
+
+    @staticmethod
+    def _inventory() -> pd.DataFrame:
+        df = InventorySnapshot.latest()
+        if df is None:
+            SheetsService.get_inventory_data()
+            df = InventorySnapshot.latest()
+        return df
+
+    @staticmethod
+    def forecast(today: Optional[date] = None) -> pd.DataFrame:
+        """Tasas de consumo, días hasta agotamiento y sugerencia de reposición por producto"""
+        inventory = ConsumptionForecast._inventory()
+        if inventory is None or inventory.empty:
+            return pd.DataFrame()
+        cols = columns_map(inventory)
+        code_col = _first(cols, ['codigo', 'código'])
+        stock_col = _first(cols, ['cantidad', 'stock'])
+        min_col = _first(cols, ['stock-min', 'stock min', 'stock_min'])
+        if not code_col or not stock_col:
+            return pd.DataFrame()
+
+        frame = pd.DataFrame({
+            'Codigo': _codes(inventory[code_col]),
+            'Referencia': inventory[cols['referencia']] if 'referencia' in cols else '',
+            'Descripcion': inventory[cols['descripcion']] if 'descripcion' in cols else '',
+            'stock': pd.to_numeric(inventory[stock_col], errors='coerce').fillna(0),
+            'stock_min': pd.to_numeric(inventory[min_col], errors='coerce').fillna(0) if min_col else 0.0,
+        })
+        frame = frame[frame['Codigo'].ne('')].drop_duplicates('Codigo')
+        frame = frame.join(ConsumptionForecast.rates(today), on='Codigo')
+        for window in WINDOWS:
+            frame[f'consumo_{window}d'] = frame[f'consumo_{window}d'].fillna(0.0)
+
+        # Tasa de referencia: 30 días; si no hubo consumo, 90; si tampoco, 7
+        rate = frame['consumo_30d'].where(frame['consumo_30d'] > 0, frame['consumo_90d'])
+        rate = rate.where(rate > 0, frame['consumo_7d'])
+        frame['consumo_diario'] = rate.round(3)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frame['dias_agotamiento'] = (frame['stock'] / rate).where(rate > 0).round(1)
+            frame['dias_a_minimo'] = ((frame['stock'] - frame['stock_min']) / rate).where(rate > 0).round(1)
+
+        below = frame['stock'] <= frame['stock_min']
+        soon = frame['dias_a_minimo'] <= Config.REORDER_LEAD_TIME_DAYS
+        frame['reponer'] = below | soon.fillna(False)
+        target = rate.fillna(0) * Config.REORDER_COVER_DAYS + frame['stock_min']
+        frame['cantidad_sugerida'] = np.ceil((target - frame['stock']).clip(lower=0)).astype(int)
+        return frame
+
+    @staticmethod
+    def report(today: Optional[date] = None) -> Dict:
+        """
+        Lista de reposición ordenada por urgencia. Se reutiliza mientras no
+        cambien el histórico, el snapshot del inventario ni el día.
+        """
+        version = ConsumptionForecast.refresh()
+        key = (version, InventorySnapshot.version(), str(today or date.today()))
+        with ConsumptionForecast._lock:
+            if ConsumptionForecast._report is not None and ConsumptionForecast._report_key == key:
+                return ConsumptionForecast._report
+
+        frame = ConsumptionForecast.forecast(today)
+        reorder = frame[frame['reponer']] if not frame.empty else frame
+        if not reorder.empty:
+            reorder = reorder.assign(_orden=reorder['dias_a_minimo'].fillna(-math.inf)).sort_values(
+                ['_orden', 'cantidad_sugerida'], ascending=[True, False]
+            ).drop(columns=['_orden', 'reponer'])
+        report = {
+            'generado': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'filas_historial': ConsumptionForecast._rows,
+            'productos': int(len(frame.index)),
+            'tiempo_entrega_dias': Config.REORDER_LEAD_TIME_DAYS,
+            'cobertura_dias': Config.REORDER_COVER_DAYS,
+            'reposicion': reorder.astype(object).where(reorder.notna(), None).to_dict('records')
+                          if not reorder.empty else [],
+        }
+        with ConsumptionForecast._lock:
+            ConsumptionForecast._report = report
+            ConsumptionForecast._report_key = key
+        return report
@@ -0,0 +1,217 @@
+"""
+Exportación en streaming (CSV o XLSX) del inventario, el histórico de
+movimientos y las hojas CMMS.
+
+La hoja se descarga como CSV en streaming y cada fila se filtra y se escribe
+en cuanto llega, sin construir un DataFrame: la memoria no depende del
+tamaño de la hoja. El XLSX se escribe con openpyxl en modo write-only sobre
+un archivo temporal que luego se envía por bloques.
+"""
+import csv
+import io
+import os
+import re
+import tempfile
+from datetime import datetime, date
+from typing import Iterable, Iterator, List, Optional
+
+import requests
+
+from config import Config
+from app.services.request_metrics import RequestMetrics
+from app.services.search_index import fold
+from app.services.sheets_service import SheetsService
+
+
+# Fuente -> (título, columnas de fecha candidatas para desde/hasta)
+EXPORT_SOURCES = {
+    'inventario': ('Inventario', []),
+    'movimientos': ('Movimientos', ['fechamovimiento', 'fecha movimiento', 'fecha']),
+    'maquinas': ('Máquinas', ['fecha_creacion']),
+    'activos': ('Activos', ['proxima_fecha', 'ultima_fecha', 'fecha_creacion']),
+    'mantenimientos': ('Mantenimientos', ['fecha_programada', 'fecha_creacion']),
+    'historico': ('Histórico mantenimientos', ['fecha_ejecucion', 'fecha_programada']),
+}
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+DATE_FORMATS = ['%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y', '%d-%m-%Y']
+CSV_CHUNK_ROWS = 500
+FILE_CHUNK_BYTES = 64 * 1024
+_NUMBER_RE = re.compile(r'-?(0|[1-9]\d{0,14})(\.\d+)?')
+
+
+def parse_date(value) -> Optional[date]:
+    """Fecha de una celda de la hoja (ISO primero, luego día/mes/año); None si no se reconoce"""
+    text = str(value or '').strip()
+    if not text:
+        return None
+    try:
+        return datetime.fromisoformat(text).date()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+class ExportService:
+    """
+    Filas de una hoja como generador y serialización en streaming
+    """
+
+    @staticmethod
+    def source_url(source: str) -> str:
+        from app.services.maintenance_service import MaintenanceService
+
+        if source == 'inventario':
+            return Config.INVENTORY_SHEET_URL
+        if source == 'movimientos':
+            return Config.HISTORY_SHEET_URL
+        url = MaintenanceService.sheet_urls().get(source)
+        if not url:
+            raise ValueError(f"La hoja '{source}' no está configurada.")
+        return url
+
+    @staticmethod
+    def iter_sheet_rows(sheet_url: str, gid: str = '0') -> Iterator[List[str]]:
+        """
+        Filas de la hoja (la primera es el encabezado) leídas del CSV de
+        exportación a medida que se descarga
+        """
+        sheet_id = SheetsService.get_sheet_id_from_url(sheet_url)
+        if not sheet_id:
+            raise ValueError(f"No se pudo extraer el ID de la hoja desde: {sheet_url}")
+        # Solo se mide la conexión: el cuerpo se descarga mientras se envía la respuesta
+        with RequestMetrics.track('sheets_csv', resource=(sheet_id, str(gid))):
+            response = requests.get(SheetsService.get_sheet_as_csv_url(sheet_id, gid), stream=True, timeout=30)
+        try:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            text = io.TextIOWrapper(response.raw, encoding='utf-8', newline='')
+            yield from csv.reader(text)
+        finally:
+            response.close()
+
+    @staticmethod
+    def filter_rows(rows: Iterable[List[str]], columns: Optional[List[str]] = None,
+                    desde: Optional[date] = None, hasta: Optional[date] = None,
+                    date_candidates: Optional[List[str]] = None) -> Iterator[List[str]]:
+        """
+        Seleccionar columnas (sin distinguir tildes ni mayúsculas, en el orden
+        pedido) y filas con la fecha dentro de [desde, hasta]
+
+        Raises:
+            ValueError: Columna o columna de fecha inexistente
+        """
+        rows = iter(rows)
+        header = [str(h).strip() for h in next(rows, [])]
+        folded = {fold(h): i for i, h in reversed(list(enumerate(header)))}
+
+        if columns:
+            missing = [c for c in columns if fold(c.strip()) not in folded]
+            if missing:
+                raise ValueError(f"Columnas no encontradas: {', '.join(missing)}")
+            positions = [folded[fold(c.strip())] for c in columns]
+        else:
+            positions = list(range(len(header)))
+
+        date_pos = None
+        if desde or hasta:
+            date_pos = next((folded[fold(c)] for c in (date_candidates or []) if fold(c) in folded), None)
+            if date_pos is None:
+                raise ValueError('La hoja no tiene una columna de fecha para filtrar.')
+
+        yield [header[i] for i in positions]
+        width = len(header)
+        for row in rows:
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) < width:
+                row = row + [''] * (width - len(row))
+            if date_pos is not None:
+                fecha = parse_date(row[date_pos])
+                if fecha is None or (desde and fecha < desde) or (hasta and fecha > hasta):
+                    continue
+            yield [row[i] for i in positions]
+
+    @staticmethod
+    def stream_csv(rows: Iterable[List[str]]) -> Iterator[bytes]:
+        """CSV UTF-8 con BOM (Excel respeta las tildes), en bloques de CSV_CHUNK_ROWS filas"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        yield '\ufeff'.encode('utf-8')
+        pending = 0
+        for row in rows:
+            writer.writerow(row)
+            pending += 1
+            if pending >= CSV_CHUNK_ROWS:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            yield buffer.getvalue().encode('utf-8')
+
+    @staticmethod
+    def stream_xlsx(rows: Iterable[List[str]], title: str = 'Exportación') -> Iterator[bytes]:
+        """
+        XLSX escrito fila por fila (openpyxl write-only) en un archivo
+        temporal y enviado por bloques; los números se escriben como número
+        """
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title=title[:31])
+        for index, row in enumerate(rows):
+            sheet.append(row if index == 0 else [_cell_value(v) for v in row])
+
+        handle, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(handle)
+        try:
+            workbook.save(path)
+            with open(path, 'rb') as stream:
+                while True:
+                    chunk = stream.read(FILE_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            os.remove(path)
+
+    @staticmethod
+    def export(source: str, formato: str = 'csv', columns: Optional[List[str]] = None,
+               desde: Optional[date] = None, hasta: Optional[date] = None) -> Iterator[bytes]:
+        """
+        Generador con el archivo exportado. La primera fila se lee antes de
+        retornar, así los errores de configuración o de filtros se reportan
+        antes de empezar la respuesta.
+        """
+        if source not in EXPORT_SOURCES:
+            raise ValueError(f"Fuente de exportación desconocida: {source}")
+        if formato not in EXPORT_FORMATS:
+            raise ValueError('Formato no soportado. Use csv o xlsx.')
+        title, date_candidates = EXPORT_SOURCES[source]
+        rows = ExportService.filter_rows(
+            ExportService.iter_sheet_rows(ExportService.source_url(source)),
+            columns=columns, desde=desde, hasta=hasta, date_candidates=date_candidates,
+        )
+        header = next(rows)
+
+        def with_header():
+            yield header
+            yield from rows
+
+        if formato == 'xlsx':
+            return ExportService.stream_xlsx(with_header(), title)
+        return ExportService.stream_csv(with_header())
+
+
+def _cell_value(value: str):
+    """Número si la celda es numérica (sin ceros a la izquierda, que suelen ser códigos)"""
+    text = value.strip()
+    if _NUMBER_RE.fullmatch(text):
+        return float(text) if '.' in text else int(text)
+    return value
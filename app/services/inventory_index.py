@@ -0,0 +1,123 @@
+"""
+Índice ID -> número de fila de la hoja de inventario.
+
+Se construye con cada snapshot del inventario, se parchea cuando se agregan
+productos y SheetsWriter lo usa para escribir directamente en la fila del
+producto sin descargar la hoja completa. La posición siempre se verifica
+contra la celda de ID antes de escribir, porque la hoja puede cambiar desde
+otro worker o desde Google Sheets.
+"""
+import re
+import threading
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from app.services.inventory_snapshot import InventorySnapshot
+
+
+def find_id_column(headers: List[str]) -> Optional[int]:
+    """
+    Posición de la columna de ID: primera columna si es 'ID', luego 'id'
+    (sin distinguir mayúsculas) y por último 'codigo'/'código'
+    """
+    headers = [str(h).strip() for h in headers]
+    if headers and headers[0] == 'ID':
+        return 0
+    for idx, header in enumerate(headers):
+        if header.lower() == 'id':
+            return idx
+    for idx, header in enumerate(headers):
+        if header.lower() in ['codigo', 'código']:
+            return idx
+    return None
+
+
+def normalize_id(value) -> str:
+    """
+    Normalizar un ID para comparar valores de la API (texto) con los del CSV
+    (pandas convierte 7 en 7.0 cuando la columna tiene vacíos)
+    """
+    if value is None:
+        return ''
+    try:
+        if pd.isna(value):
+            return ''
+    except (TypeError, ValueError):
+        pass
+    text = str(value).strip()
+    if re.fullmatch(r'-?\d+\.0+', text):
+        text = text.split('.')[0]
+    return text
+
+
+class InventoryRowIndex:
+    """
+    Mapa en memoria de ID de producto a fila (1-based, incluyendo encabezado)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._headers: List[str] = []
+        self._id_col_index: Optional[int] = None
+
+    @property
+    def headers(self) -> List[str]:
+        return list(self._headers)
+
+    @property
+    def id_col_index(self) -> Optional[int]:
+        return self._id_col_index
+
+    def rebuild(self, headers: List[str], ids: List) -> None:
+        """
+        Reconstruir el índice a partir de los encabezados y de la columna de
+        ID en orden de filas (ids[0] corresponde a la fila 2)
+        """
+        headers = [str(h).strip() for h in headers]
+        rows = {}
+        for offset, raw_id in enumerate(ids):
+            key = normalize_id(raw_id)
+            if key and key not in rows:
+                rows[key] = offset + 2
+        with self._lock:
+            self._headers = headers
+            self._id_col_index = find_id_column(headers)
+            self._rows = rows
+
+    def build_from_dataframe(self, df: pd.DataFrame) -> None:
+        """Listener de InventorySnapshot: reconstruir desde el CSV descargado"""
+        if df is None:
+            return
+        headers = [str(c).strip() for c in df.columns]
+        id_col = find_id_column(headers)
+        ids = df.iloc[:, id_col].tolist() if id_col is not None else []
+        self.rebuild(headers, ids)
+
+    def lookup(self, product_id) -> Optional[int]:
+        """Fila del producto o None si no está indexado"""
+        with self._lock:
+            return self._rows.get(normalize_id(product_id))
+
+    def record_append(self, product_id, row_number: int) -> None:
+        """Registrar un producto recién agregado al final de la hoja"""
+        key = normalize_id(product_id)
+        if key and row_number:
+            with self._lock:
+                self._rows[key] = int(row_number)
+
+    def invalidate(self, product_id=None) -> None:
+        """Olvidar la posición de un producto (o de todos si no se indica)"""
+        with self._lock:
+            if product_id is None:
+                self._rows = {}
+            else:
+                self._rows.pop(normalize_id(product_id), None)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+inventory_row_index = InventoryRowIndex()
+InventorySnapshot.subscribe(inventory_row_index.build_from_dataframe)
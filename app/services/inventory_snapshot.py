@@ -0,0 +1,67 @@
+"""
+Snapshot del inventario: cada lectura completa de la hoja de inventario se
+publica aquí para que los índices en memoria se reconstruyan a partir de ella
+"""
+import threading
+import time
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+
+class InventorySnapshot:
+    """
+    Registro de la última lectura completa del inventario y de los índices
+    que dependen de ella
+    """
+
+    _lock = threading.Lock()
+    _listeners: List[Callable[[pd.DataFrame], None]] = []
+    _version = 0
+    _loaded_at: Optional[float] = None
+    _latest: Optional[pd.DataFrame] = None
+
+    @staticmethod
+    def subscribe(listener: Callable[[pd.DataFrame], None]):
+        """
+        Registrar una función que se invoca con el DataFrame crudo de cada
+        snapshot (índice 0 = fila 2 de la hoja)
+        """
+        with InventorySnapshot._lock:
+            if listener not in InventorySnapshot._listeners:
+                InventorySnapshot._listeners.append(listener)
+
+    @staticmethod
+    def publish(df: pd.DataFrame):
+        """
+        Publicar un snapshot recién descargado. Un índice que falle no debe
+        impedir la lectura del inventario, así que los errores solo se registran.
+        """
+        with InventorySnapshot._lock:
+            InventorySnapshot._version += 1
+            InventorySnapshot._loaded_at = time.time()
+            InventorySnapshot._latest = df
+            listeners = list(InventorySnapshot._listeners)
+
+        for listener in listeners:
+            try:
+                listener(df)
+            except Exception as e:
+                print(f"⚠️ Error al actualizar índice del inventario ({getattr(listener, '__qualname__', listener)}): {e}")
+
+    @staticmethod
+    def latest() -> Optional[pd.DataFrame]:
+        """Último DataFrame publicado (compartido: no modificarlo)"""
+        return InventorySnapshot._latest
+
+    @staticmethod
+    def version() -> int:
+        """Número de snapshots publicados en este proceso"""
+        return InventorySnapshot._version
+
+    @staticmethod
+    def age_seconds() -> Optional[float]:
+        """Segundos desde el último snapshot (None si aún no hay ninguno)"""
+        if InventorySnapshot._loaded_at is None:
+            return None
+        return time.time() - InventorySnapshot._loaded_at
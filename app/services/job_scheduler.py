@@ -0,0 +1,366 @@
+"""
+Programador de tareas recurrentes dentro de la aplicación.
+
+Cada worker de gunicorn arranca un hilo que revisa las expresiones cron una
+vez por minuto (hora local del servidor):
+- Las tareas globales (planificación, reconciliación) solo corren en el
+  worker líder: el que obtiene el bloqueo exclusivo del archivo
+  SCHEDULER_LOCK_FILE. Si el líder muere, el sistema operativo libera el
+  bloqueo y otro worker lo toma en la siguiente revisión.
+- Las tareas por worker (precalentar cachés en memoria) corren en todos.
+
+Una ejecución no se solapa con otra de la misma tarea: antes de correr se
+toma un lease en LOCAL_STATE_DB. Cada ejecución queda en el historial
+(job_runs) con su duración, estado y mensaje.
+"""
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+
+from config import Config
+from app.services import local_store
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin elección de líder, cada proceso se considera líder
+    fcntl = None
+
+
+HISTORY_PER_JOB = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL,
+    message TEXT,
+    pid INTEGER NOT NULL,
+    trigger TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_runs_job ON job_runs (job, id);
+CREATE TABLE IF NOT EXISTS job_leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+_FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def _parse_field(field: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Paso inválido en expresión cron: {field}")
+        if part in ('*', ''):
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high + (1 if high == 6 else 0) or start > end:
+            raise ValueError(f"Valor fuera de rango en expresión cron: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """
+    Expresión cron de 5 campos: minuto hora día-del-mes mes día-de-la-semana
+    (0 o 7 = domingo). Soporta *, listas (1,15), rangos (1-5) y pasos (*/15).
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"La expresión cron debe tener 5 campos: '{expression}'")
+        self.expression = expression
+        parsed = [_parse_field(f, low, high) for f, (low, high) in zip(fields, _FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {0 if d == 7 else d for d in weekdays}
+        # Semántica cron: si se restringen día del mes y día de la semana, basta con uno
+        self._dom_any = fields[2] == '*'
+        self._dow_any = fields[4] == '*'
+
+    def matches(self, moment: datetime) -> bool:
+        if moment.minute not in self.minutes or moment.hour not in self.hours or moment.month not in self.months:
+            return False
+        cron_weekday = (moment.weekday() + 1) % 7
+        day_ok = moment.day in self.days
+        weekday_ok = cron_weekday in self.weekdays
+        if self._dom_any or self._dow_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def __repr__(self):
+        return f"CronExpression('{self.expression}')"
+
+
+class ScheduledJob:
+    """
+    Tarea registrada en el programador
+    """
+
+    def __init__(self, name: str, cron: str, func: Callable[[], Optional[str]],
+                 description: str = '', leader_only: bool = True, timeout_seconds: int = 3600):
+        self.name = name
+        self.cron = CronExpression(cron)
+        self.func = func
+        self.description = description
+        self.leader_only = leader_only
+        self.timeout_seconds = timeout_seconds
+        self.running = threading.Lock()
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'cron': self.cron.expression,
+            'description': self.description,
+            'leader_only': self.leader_only,
+            'running': self.running.locked(),
+        }
+
+
+class JobScheduler:
+    """
+    Registro de tareas y hilo de ejecución
+    """
+
+    _jobs: Dict[str, ScheduledJob] = {}
+    _thread: Optional[threading.Thread] = None
+    _lock_handle = None
+    _lock_pid: Optional[int] = None
+    _schema_ready = False
+
+    @staticmethod
+    def _conn():
+        conn = local_store.connect()
+        if not JobScheduler._schema_ready:
+            conn.executescript(_SCHEMA)
+            JobScheduler._schema_ready = True
+        return conn
+
+    @staticmethod
+    def register(name: str, cron: str, func: Callable[[], Optional[str]], description: str = '',
+                 leader_only: bool = True, timeout_seconds: int = 3600) -> Optional[ScheduledJob]:
+        """
+        Registrar una tarea. Una expresión vacía la desactiva.
+
+        Args:
+            name: Identificador único
+            cron: Expresión cron de 5 campos
+            func: Función sin argumentos; puede retornar un texto para el historial
+            leader_only: Correr solo en el worker líder (False = en cada worker)
+            timeout_seconds: Duración máxima del lease contra ejecuciones solapadas
+        """
+        if not cron or not cron.strip():
+            JobScheduler._jobs.pop(name, None)
+            return None
+        job = ScheduledJob(name, cron, func, description, leader_only, timeout_seconds)
+        JobScheduler._jobs[name] = job
+        return job
+
+    @staticmethod
+    def jobs() -> List[ScheduledJob]:
+        return list(JobScheduler._jobs.values())
+
+    # ------------------------------------------------------------------
+    # Elección de líder
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def is_leader() -> bool:
+        """Intentar tomar (o confirmar) el bloqueo del archivo de líder"""
+        if JobScheduler._lock_handle is not None and JobScheduler._lock_pid == os.getpid():
+            return True
+        if fcntl is None:
+            return True
+        path = Config.SCHEDULER_LOCK_FILE
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handle = open(path, 'a+')
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(f"{os.getpid()}\n")
+        handle.flush()
+        # El bloqueo dura lo que viva el proceso (se mantiene el archivo abierto)
+        JobScheduler._lock_handle = handle
+        JobScheduler._lock_pid = os.getpid()
+        print(f"🕒 Programador de tareas: worker {os.getpid()} es el líder")
+        return True
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _lease_name(job: ScheduledJob) -> str:
+        return job.name if job.leader_only else f"{job.name}@{os.getpid()}"
+
+    @staticmethod
+    def _acquire_lease(job: ScheduledJob) -> bool:
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        now = time.time()
+        with local_store.transaction() as conn:
+            row = conn.execute(
+                "SELECT owner, expires_at FROM job_leases WHERE name = ?", (JobScheduler._lease_name(job),)
+            ).fetchone()
+            if row is not None and row['expires_at'] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO job_leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (JobScheduler._lease_name(job), owner, now + job.timeout_seconds)
+            )
+        return True
+
+    @staticmethod
+    def _release_lease(job: ScheduledJob):
+        with local_store.transaction() as conn:
+            conn.execute("DELETE FROM job_leases WHERE name = ?", (JobScheduler._lease_name(job),))
+
+    @staticmethod
+    def _record(job: ScheduledJob, started_at: float, status: str, message: str, trigger: str):
+        with local_store.transaction() as conn:
+            conn.execute(
+                "INSERT INTO job_runs (job, started_at, finished_at, status, message, pid, trigger) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.name, started_at, time.time(), status, (message or '')[:2000], os.getpid(), trigger)
+            )
+            conn.execute(
+                "DELETE FROM job_runs WHERE job = ? AND id NOT IN "
+                "(SELECT id FROM job_runs WHERE job = ? ORDER BY id DESC LIMIT ?)",
+                (job.name, job.name, HISTORY_PER_JOB)
+            )
+
+    @staticmethod
+    def run_job(name: str, trigger: str = 'manual') -> Dict:
+        """
+        Ejecutar una tarea ahora (en el hilo actual) respetando la prevención
+        de solapamiento
+
+        Returns:
+            {'status': 'ok' | 'error' | 'skipped', 'message': ...}
+        """
+        job = JobScheduler._jobs.get(name)
+        if job is None:
+            raise KeyError(f"Tarea no registrada: {name}")
+        JobScheduler._conn()
+        started_at = time.time()
+        acquired = job.running.acquire(blocking=False)
+        if acquired:
+            try:
+                acquired = JobScheduler._acquire_lease(job)
+            except Exception:
+                job.running.release()
+                raise
+            if not acquired:
+                job.running.release()
+        if not acquired:
+            message = 'Ejecución anterior todavía en curso'
+            JobScheduler._record(job, started_at, 'skipped', message, trigger)
+            return {'status': 'skipped', 'message': message}
+        try:
+            result = job.func()
+            status, message = 'ok', str(result) if result is not None else ''
+        except Exception as e:
+            traceback.print_exc()
+            status, message = 'error', f"{type(e).__name__}: {e}"
+        finally:
+            JobScheduler._release_lease(job)
+            job.running.release()
+        JobScheduler._record(job, started_at, status, message, trigger)
+        if status == 'error':
+            print(f"❌ Tarea {job.name} falló: {message}")
+        return {'status': status, 'message': message}
+
+    @staticmethod
+    def history(name: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Últimas ejecuciones (de una tarea o de todas), más recientes primero"""
+        query = "SELECT job, started_at, finished_at, status, message, pid, trigger FROM job_runs"
+        params: list = []
+        if name:
+            query += " WHERE job = ?"
+            params.append(name)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(int(limit))
+        rows = JobScheduler._conn().execute(query, params).fetchall()
+        return [
+            {
+                'job': row['job'],
+                'inicio': datetime.fromtimestamp(row['started_at']).strftime('%Y-%m-%d %H:%M:%S'),
+                'duracion_s': round((row['finished_at'] or row['started_at']) - row['started_at'], 3),
+                'estado': row['status'],
+                'mensaje': row['message'],
+                'pid': row['pid'],
+                'origen': row['trigger'],
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def _due_jobs(moment: datetime, leader: bool) -> List[ScheduledJob]:
+        return [
+            job for job in JobScheduler._jobs.values()
+            if job.cron.matches(moment) and (leader or not job.leader_only)
+        ]
+
+    @staticmethod
+    def _run_loop():
+        last_minute = datetime.now().replace(second=0, microsecond=0)
+        while True:
+            time.sleep(max(1.0, 60 - datetime.now().second + 0.5))
+            current = datetime.now().replace(second=0, microsecond=0)
+            try:
+                leader = JobScheduler.is_leader()
+            except Exception as e:
+                print(f"⚠️ Programador de tareas: no se pudo verificar el líder: {e}")
+                leader = False
+            # Revisar cada minuto transcurrido (por si el hilo se retrasó), sin ponerse al día más de una hora
+            minute = max(last_minute + timedelta(minutes=1), current - timedelta(minutes=60))
+            due: Dict[str, ScheduledJob] = {}
+            while minute <= current:
+                for job in JobScheduler._due_jobs(minute, leader):
+                    due[job.name] = job
+                minute += timedelta(minutes=1)
+            last_minute = current
+            for job in due.values():
+                threading.Thread(
+                    target=JobScheduler._run_scheduled, args=(job.name,),
+                    name=f"job-{job.name}", daemon=True
+                ).start()
+
+    @staticmethod
+    def _run_scheduled(name: str):
+        try:
+            JobScheduler.run_job(name, trigger='cron')
+        except Exception as e:
+            print(f"❌ Error en el programador de tareas ({name}): {e}")
+
+    @staticmethod
+    def start():
+        """Iniciar (una vez por proceso) el hilo del programador"""
+        if JobScheduler._thread is not None and JobScheduler._thread.is_alive():
+            return
+        JobScheduler._conn()
+        JobScheduler._thread = threading.Thread(
+            target=JobScheduler._run_loop, name='job-scheduler', daemon=True
+        )
+        JobScheduler._thread.start()
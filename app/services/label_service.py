@@ -0,0 +1,263 @@
+"""
+Servicio para generar hojas de etiquetas (QR + Codigo + Referencia) en lote.
+
+Las páginas se generan una a una y se serializan de inmediato, de modo que la
+memoria se mantiene constante aunque la hoja tenga miles de etiquetas.
+"""
+import io
+import fnmatch
+import zlib
+import zipfile
+import urllib.parse
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.services.qr_service import QRService
+
+
+# Hoja carta a 150 DPI (8.5 x 11 pulgadas)
+PAGE_DPI = 150
+PAGE_WIDTH_PX = 1275
+PAGE_HEIGHT_PX = 1650
+PAGE_MARGIN_PX = 45
+
+DEFAULT_COLUMNS = 3
+DEFAULT_ROWS = 8
+# Más etiquetas por página dejan celdas demasiado pequeñas para el QR y el texto
+MAX_COLUMNS = 10
+MAX_ROWS = 30
+
+CODE_KEYS = ['Codigo', 'codigo', 'Código', 'CODIGO']
+REFERENCE_KEYS = ['Referencia', 'referencia', 'REFERENCIA', 'Ref', 'ref']
+LOCATION_KEYS = ['Ubicación', 'Ubicacion', 'ubicación', 'ubicacion']
+ID_KEYS = ['ID', 'id', 'Id']
+
+
+def _get_field(product: dict, possible_names: List[str]) -> str:
+    """Buscar un campo por varios nombres posibles (case-insensitive)"""
+    for name in possible_names:
+        if name in product and product[name] is not None:
+            return str(product[name]).strip()
+    lowered = {str(k).strip().lower(): v for k, v in product.items()}
+    for name in possible_names:
+        value = lowered.get(name.lower())
+        if value is not None:
+            return str(value).strip()
+    return ''
+
+
+class _StreamBuffer:
+    """
+    Destino de escritura no posicionable: acumula bytes hasta que el
+    generador los entrega con drain().
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class LabelService:
+    """
+    Servicio para componer y exportar hojas de etiquetas de productos
+    """
+
+    @staticmethod
+    def filter_products(products: Iterable[Dict], codigo: str = None, ubicacion: str = None) -> Iterator[Dict]:
+        """
+        Filtrar productos del inventario por patrón de código y/o ubicación
+
+        Args:
+            products: Productos del inventario (ej. SheetsService.get_inventory_data())
+            codigo: Patrón de código; acepta comodines (ej. "RMEC-*") o solo la
+                    abreviatura (ej. "RMEC", equivalente a "RMEC-*")
+            ubicacion: Texto que debe contener la ubicación (case-insensitive)
+
+        Returns:
+            Iterador con los productos que cumplen el filtro
+        """
+        pattern = (codigo or '').strip().upper()
+        if pattern and not any(ch in pattern for ch in '*?['):
+            pattern = f"{pattern.rstrip('-')}-*"
+        location = (ubicacion or '').strip().lower()
+
+        for product in products:
+            if pattern:
+                code = _get_field(product, CODE_KEYS).upper()
+                if not code or not fnmatch.fnmatchcase(code, pattern):
+                    continue
+            if location and location not in _get_field(product, LOCATION_KEYS).lower():
+                continue
+            yield product
+
+    @staticmethod
+    def product_url(product: dict, base_url: str) -> Optional[str]:
+        """
+        URL codificada en el QR: la misma que usa scripts/generate_all_qr_codes.py
+        (detalle del producto identificado por su Referencia, o por ID si no tiene)
+        """
+        identifier = _get_field(product, REFERENCE_KEYS) or _get_field(product, ID_KEYS)
+        if not identifier:
+            return None
+        return f"{base_url.rstrip('/')}/product/detail/{urllib.parse.quote(identifier, safe='')}"
+
+    @staticmethod
+    def render_label(product: dict, base_url: str, width: int, height: int) -> Image.Image:
+        """
+        Dibujar una etiqueta: QR a la izquierda, Codigo y Referencia a la derecha
+
+        Returns:
+            Imagen PIL en escala de grises del tamaño indicado
+        """
+        label = Image.new('L', (width, height), 255)
+        draw = ImageDraw.Draw(label)
+        padding = max(4, height // 16)
+
+        qr_side = height - 2 * padding
+        url = LabelService.product_url(product, base_url)
+        if url:
+            qr_img = QRService.build_qr_image(url, box_size=4, border=1)
+            qr_img = qr_img.resize((qr_side, qr_side), Image.NEAREST)
+            label.paste(qr_img, (padding, padding))
+
+        text_x = padding * 2 + qr_side
+        text_width = width - text_x - padding
+        code_font = ImageFont.load_default(size=max(12, height // 5))
+        text_font = ImageFont.load_default(size=max(10, height // 8))
+
+        lines = [
+            (_get_field(product, CODE_KEYS), code_font),
+            (_get_field(product, REFERENCE_KEYS), text_font),
+            (_get_field(product, LOCATION_KEYS), text_font),
+        ]
+        y = padding
+        for text, font in lines:
+            if not text:
+                continue
+            # Recortar el texto para que quepa en el ancho disponible
+            while text and draw.textlength(text, font=font) > text_width:
+                text = text[:-1]
+            draw.text((text_x, y), text, fill=0, font=font)
+            y += int(font.size * 1.3)
+
+        draw.rectangle((0, 0, width - 1, height - 1), outline=200)
+        return label
+
+    @staticmethod
+    def iter_pages(products: Iterable[Dict], base_url: str,
+                   columns: int = DEFAULT_COLUMNS, rows: int = DEFAULT_ROWS) -> Iterator[Image.Image]:
+        """
+        Generar las páginas de etiquetas de forma incremental
+
+        Solo existe en memoria la página en construcción: cada página se
+        entrega en cuanto se completa.
+        """
+        columns = min(max(1, int(columns)), MAX_COLUMNS)
+        rows = min(max(1, int(rows)), MAX_ROWS)
+        cell_w = (PAGE_WIDTH_PX - 2 * PAGE_MARGIN_PX) // columns
+        cell_h = (PAGE_HEIGHT_PX - 2 * PAGE_MARGIN_PX) // rows
+        per_page = columns * rows
+
+        page = None
+        slot = 0
+        for product in products:
+            if page is None:
+                page = Image.new('L', (PAGE_WIDTH_PX, PAGE_HEIGHT_PX), 255)
+                slot = 0
+            col, row = slot % columns, slot // columns
+            label = LabelService.render_label(product, base_url, cell_w, cell_h)
+            page.paste(label, (PAGE_MARGIN_PX + col * cell_w, PAGE_MARGIN_PX + row * cell_h))
+            slot += 1
+            if slot == per_page:
+                yield page
+                page = None
+        if page is not None:
+            yield page
+
+    @staticmethod
+    def stream_pdf(pages: Iterable[Image.Image]) -> Iterator[bytes]:
+        """
+        Serializar páginas como PDF de forma incremental
+
+        Cada página se escribe (imagen + contenido + objeto página) apenas se
+        genera; el árbol de páginas y la tabla xref se escriben al final, así
+        que solo se retienen los offsets de los objetos.
+        """
+        offsets = {}
+        position = 0
+        page_ids = []
+        next_id = 3  # 1: Catalog, 2: Pages (se escribe al final)
+
+        def emit(obj_id: int, body: bytes) -> bytes:
+            nonlocal position
+            offsets[obj_id] = position
+            chunk = f"{obj_id} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+            position += len(chunk)
+            return chunk
+
+        header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        position += len(header)
+        yield header
+        yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        # Tamaño de página en puntos PDF (72 por pulgada)
+        width_pt = PAGE_WIDTH_PX * 72 / PAGE_DPI
+        height_pt = PAGE_HEIGHT_PX * 72 / PAGE_DPI
+
+        for page in pages:
+            image_id, content_id, page_id = next_id, next_id + 1, next_id + 2
+            next_id += 3
+
+            data = zlib.compress(page.convert('L').tobytes())
+            image_dict = (
+                f"<< /Type /XObject /Subtype /Image /Width {page.width} /Height {page.height} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>\n"
+            ).encode('ascii')
+            chunk = emit(image_id, image_dict + b"stream\n" + data + b"\nendstream")
+            del data
+
+            content = f"q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im0 Do Q".encode('ascii')
+            chunk += emit(content_id, f"<< /Length {len(content)} >>\nstream\n".encode('ascii') + content + b"\nendstream")
+            chunk += emit(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] "
+                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode('ascii'))
+            page_ids.append(page_id)
+            yield chunk
+
+        kids = ' '.join(f"{pid} 0 R" for pid in page_ids)
+        yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('ascii'))
+
+        xref_position = position
+        lines = [f"xref\n0 {next_id}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, next_id):
+            lines.append(f"{offsets[obj_id]:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+        yield ''.join(lines).encode('ascii')
+
+    @staticmethod
+    def stream_png_zip(pages: Iterable[Image.Image]) -> Iterator[bytes]:
+        """
+        Serializar páginas como PNG dentro de un ZIP, entregando cada página
+        en cuanto se comprime (el ZIP se escribe sin necesidad de seek).
+        """
+        buffer = _StreamBuffer()
+        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+            for number, page in enumerate(pages, 1):
+                png = io.BytesIO()
+                page.save(png, format='PNG', optimize=True)
+                archive.writestr(f"etiquetas-{number:04d}.png", png.getvalue())
+                yield buffer.drain()
+        yield buffer.drain()
@@ -0,0 +1,58 @@
+"""
+Almacenamiento local compartido entre workers (SQLite en modo WAL)
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import Config
+
+
+_local = threading.local()
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """
+    Obtener la conexión SQLite del hilo actual
+
+    Las conexiones se reutilizan por hilo y por proceso (tras un fork de
+    gunicorn se abre una nueva). Se usa autocommit: las transacciones se
+    delimitan explícitamente con transaction().
+    """
+    path = path or Config.LOCAL_STATE_DB
+    connections = getattr(_local, 'connections', None)
+    if connections is None or getattr(_local, 'pid', None) != os.getpid():
+        connections = {}
+        _local.connections = connections
+        _local.pid = os.getpid()
+
+    conn = connections.get(path)
+    if conn is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        connections[path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(path: str = None):
+    """
+    Transacción con bloqueo de escritura inmediato (BEGIN IMMEDIATE), para
+    que leer y actualizar sea atómico entre workers
+    """
+    conn = connect(path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
@@ -0,0 +1,154 @@
+"""
+Índice de productos con stock bajo (cantidad <= Stock-min).
+
+Se recalcula de forma vectorizada con cada snapshot del inventario y se
+actualiza producto a producto con cada movimiento registrado en este
+worker, así que consultar las alertas no requiere recorrer el inventario.
+Solo se vigilan productos con Stock-min mayor que cero.
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from app.services.inventory_index import find_id_column, normalize_id
+from app.services.inventory_snapshot import InventorySnapshot
+
+
+STOCK_COLUMNS = ['cantidad', 'stock']
+MIN_COLUMNS = ['stock-min', 'stock min', 'stock_min']
+INFO_COLUMNS = {
+    'Codigo': ['codigo', 'código'],
+    'Referencia': ['referencia'],
+    'Descripcion': ['descripcion', 'descripción'],
+    'Ubicación': ['ubicación', 'ubicacion'],
+    'Unidad-medida': ['unidad-medida', 'unidad medida'],
+}
+
+
+def _to_number(value) -> Optional[float]:
+    try:
+        number = float(str(value).strip().replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(number) else number
+
+
+def _to_numbers(series: pd.Series) -> pd.Series:
+    """Versión vectorizada de _to_number (acepta coma decimal: "2,5" -> 2.5)"""
+    text = series.astype(str).str.strip().str.replace(',', '.', regex=False)
+    return pd.to_numeric(text, errors='coerce')
+
+
+class LowStockIndex:
+    """
+    Productos vigilados (con Stock-min) y conjunto de alertas vigentes
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tracked: Dict[str, Dict] = {}
+        self._breaches: set = set()
+        self._built_at: Optional[float] = None
+
+    def build_from_dataframe(self, df: pd.DataFrame) -> None:
+        """Listener de InventorySnapshot: reconstruir el índice completo"""
+        if df is None:
+            return
+        cols = {str(c).strip().lower(): c for c in df.columns}
+        stock_col = next((cols[n] for n in STOCK_COLUMNS if n in cols), None)
+        min_col = next((cols[n] for n in MIN_COLUMNS if n in cols), None)
+        id_idx = find_id_column([str(c) for c in df.columns])
+        if stock_col is None or min_col is None or id_idx is None:
+            with self._lock:
+                self._tracked, self._breaches, self._built_at = {}, set(), time.time()
+            return
+
+        frame = pd.DataFrame({
+            'ID': df.iloc[:, id_idx].map(normalize_id),
+            'cantidad': _to_numbers(df[stock_col]).fillna(0),
+            'Stock-min': _to_numbers(df[min_col]),
+        })
+        for name, candidates in INFO_COLUMNS.items():
+            column = next((cols[n] for n in candidates if n in cols), None)
+            frame[name] = df[column].astype(object).where(df[column].notna(), None) if column is not None else None
+        frame = frame[frame['ID'].ne('') & frame['Stock-min'].gt(0)].drop_duplicates('ID')
+
+        tracked = {row['ID']: row for row in frame.to_dict('records')}
+        breaches = set(frame.loc[frame['cantidad'] <= frame['Stock-min'], 'ID'])
+        with self._lock:
+            self._tracked, self._breaches, self._built_at = tracked, breaches, time.time()
+
+    def record_stock(self, product_id, stock, stock_min=None) -> None:
+        """Actualizar un producto tras un movimiento (y su Stock-min si cambió)"""
+        key = normalize_id(product_id)
+        stock = _to_number(stock)
+        if not key or stock is None:
+            return
+        new_min = _to_number(stock_min) if stock_min not in (None, '') else None
+        with self._lock:
+            entry = self._tracked.get(key)
+            if entry is None:
+                if not new_min or new_min <= 0:
+                    return
+                entry = {'ID': key}
+                self._tracked[key] = entry
+            entry['cantidad'] = stock
+            if new_min is not None:
+                entry['Stock-min'] = new_min
+            if not entry.get('Stock-min') or entry['Stock-min'] <= 0:
+                self._tracked.pop(key, None)
+                self._breaches.discard(key)
+            elif stock <= entry['Stock-min']:
+                self._breaches.add(key)
+            else:
+                self._breaches.discard(key)
+
+    def is_built(self) -> bool:
+        return self._built_at is not None
+
+    def count(self) -> int:
+        return len(self._breaches)
+
+    def breaches(self, ubicacion: str = None, codigo: str = None, q: str = None,
+                 solo_agotados: bool = False) -> List[Dict]:
+        """
+        Alertas vigentes, de la más grave (menor cantidad / Stock-min) a la menos
+
+        Args:
+            ubicacion: Prefijo de Ubicación (sin distinguir mayúsculas)
+            codigo: Prefijo de Codigo
+            q: Texto contenido en Referencia o Descripcion
+            solo_agotados: Solo productos con cantidad <= 0
+        """
+        with self._lock:
+            items = [dict(self._tracked[key]) for key in self._breaches if key in self._tracked]
+
+        def starts(value, prefix):
+            return str(value or '').strip().upper().startswith(prefix.strip().upper())
+
+        if ubicacion:
+            items = [i for i in items if starts(i.get('Ubicación'), ubicacion)]
+        if codigo:
+            items = [i for i in items if starts(i.get('Codigo'), codigo)]
+        if q:
+            needle = q.strip().lower()
+            items = [
+                i for i in items
+                if needle in str(i.get('Referencia') or '').lower() or needle in str(i.get('Descripcion') or '').lower()
+            ]
+        if solo_agotados:
+            items = [i for i in items if i['cantidad'] <= 0]
+        for item in items:
+            item['faltante'] = max(item['Stock-min'] - item['cantidad'], 0)
+            item['agotado'] = item['cantidad'] <= 0
+        items.sort(key=lambda i: (i['cantidad'] / i['Stock-min'], i.get('Codigo') or ''))
+        return items
+
+    def age_seconds(self) -> Optional[float]:
+        return None if self._built_at is None else time.time() - self._built_at
+
+
+low_stock_index = LowStockIndex()
+InventorySnapshot.subscribe(low_stock_index.build_from_dataframe)
@@ -0,0 +1,258 @@
+"""
+KPIs materializados del tablero CMMS.
+
+Los contadores viven en LOCAL_STATE_DB para que todos los workers lean y
+actualicen los mismos valores:
+- Cada lectura completa de una hoja CMMS (snapshot) fija los contadores de
+  esa sección con un conteo exacto.
+- create/update/delete/cierre aplican deltas después de escribir en la hoja.
+- Una reconciliación periódica recuenta las cuatro hojas y corrige la deriva.
+
+Como la exportación CSV de Google Sheets puede tardar unos segundos en
+reflejar una escritura, un snapshot no sobrescribe un contador que recibió
+un delta dentro del período de gracia.
+"""
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+from config import Config
+from app.services import local_store
+
+
+KPI_KEYS = [
+    "total_maquinas",
+    "total_activos",
+    "programados",
+    "pendientes",
+    "en_proceso",
+    "hechos",
+    "historicos",
+]
+
+# Contador de filas por sección (las que no cuentan estados)
+SECTION_TOTALS = {
+    "maquinas": "total_maquinas",
+    "activos": "total_activos",
+    "historico": "historicos",
+}
+
+# Estado de un mantenimiento -> contador
+ESTADO_KPIS = {
+    "PROGRAMADO": "programados",
+    "PENDIENTE": "pendientes",
+    "EN_PROCESO": "en_proceso",
+    "HECHO": "hechos",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cmms_kpis (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    delta_at REAL
+);
+"""
+
+
+def estado_kpi(estado) -> Optional[str]:
+    """Contador afectado por un estado (None si el estado no se cuenta)"""
+    if estado is None:
+        return None
+    try:
+        if pd.isna(estado):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return ESTADO_KPIS.get(str(estado).strip().upper())
+
+
+def snapshot_counts(section: str, df: pd.DataFrame) -> Dict[str, int]:
+    """Conteo exacto de los contadores de una sección a partir de su hoja"""
+    if section in SECTION_TOTALS:
+        return {SECTION_TOTALS[section]: 0 if df is None else int(len(df.index))}
+    if section != "mantenimientos":
+        return {}
+    counts = {key: 0 for key in ESTADO_KPIS.values()}
+    if df is None or df.empty:
+        return counts
+    estado_col = next((c for c in df.columns if str(c).strip().lower() == "estado"), None)
+    if estado_col is None:
+        return counts
+    estados = df[estado_col].astype(str).str.strip().str.upper().value_counts()
+    for estado, key in ESTADO_KPIS.items():
+        counts[key] = int(estados.get(estado, 0))
+    return counts
+
+
+class MaintenanceKpiStore:
+    """
+    Contadores del tablero de mantenimiento
+    """
+
+    _schema_ready = False
+    _reconciler: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _conn():
+        conn = local_store.connect()
+        if not MaintenanceKpiStore._schema_ready:
+            conn.executescript(_SCHEMA)
+            MaintenanceKpiStore._schema_ready = True
+        return conn
+
+    @staticmethod
+    def _store(counts: Dict[str, int], source: str, force: bool = False) -> None:
+        """Guardar conteos absolutos respetando el período de gracia de los deltas"""
+        MaintenanceKpiStore._conn()
+        now = time.time()
+        grace = Config.MAINTENANCE_KPI_SNAPSHOT_GRACE_SECONDS
+        with local_store.transaction() as conn:
+            for name, value in counts.items():
+                row = conn.execute("SELECT delta_at FROM cmms_kpis WHERE name = ?", (name,)).fetchone()
+                if not force and row is not None and row["delta_at"] and now - row["delta_at"] < grace:
+                    continue
+                conn.execute(
+                    "INSERT INTO cmms_kpis (name, value, source, updated_at, delta_at) VALUES (?, ?, ?, ?, NULL) "
+                    "ON CONFLICT(name) DO UPDATE SET value = excluded.value, source = excluded.source, "
+                    "updated_at = excluded.updated_at, delta_at = NULL",
+                    (name, int(value), source, now)
+                )
+
+    @staticmethod
+    def observe(section: str, df: pd.DataFrame):
+        """Fijar los contadores de una sección con el conteo de un snapshot de su hoja"""
+        counts = snapshot_counts(section, df)
+        if not counts:
+            return
+        try:
+            MaintenanceKpiStore._store(counts, "snapshot")
+        except Exception as e:
+            print(f"⚠️ No se pudieron actualizar los KPIs CMMS desde {section}: {e}")
+
+    @staticmethod
+    def apply(deltas: Dict[str, int]):
+        """Sumar deltas a los contadores (los que aún no existen se ignoran)"""
+        deltas = {k: int(v) for k, v in (deltas or {}).items() if k in KPI_KEYS and v}
+        if not deltas:
+            return
+        # La escritura en la hoja ya ocurrió: un fallo local no debe propagarse,
+        # la reconciliación corregirá el contador
+        try:
+            MaintenanceKpiStore._conn()
+            now = time.time()
+            with local_store.transaction() as conn:
+                conn.executemany(
+                    "UPDATE cmms_kpis SET value = MAX(0, value + ?), source = 'delta', "
+                    "updated_at = ?, delta_at = ? WHERE name = ?",
+                    [(delta, now, now, name) for name, delta in deltas.items()]
+                )
+        except Exception as e:
+            print(f"⚠️ No se pudieron actualizar los KPIs CMMS: {e}")
+
+    @staticmethod
+    def _row_deltas(section: str, sign: int, count: int, estados: Iterable) -> Dict[str, int]:
+        if section in SECTION_TOTALS:
+            return {SECTION_TOTALS[section]: sign * count}
+        deltas: Dict[str, int] = {}
+        for estado in estados:
+            key = estado_kpi(estado)
+            if key:
+                deltas[key] = deltas.get(key, 0) + sign
+        return deltas
+
+    @staticmethod
+    def record_created(section: str, count: int = 1, estados: Iterable = ()):
+        """Filas agregadas a una sección (para mantenimientos, con su estado)"""
+        MaintenanceKpiStore.apply(MaintenanceKpiStore._row_deltas(section, 1, count, estados))
+
+    @staticmethod
+    def record_deleted(section: str, count: int = 1, estados: Iterable = ()):
+        """Filas eliminadas de una sección (para mantenimientos, con el estado que tenían)"""
+        MaintenanceKpiStore.apply(MaintenanceKpiStore._row_deltas(section, -1, count, estados))
+
+    @staticmethod
+    def record_estado_changes(changes: Iterable):
+        """Cambios de estado de mantenimientos: pares (estado_anterior, estado_nuevo)"""
+        deltas: Dict[str, int] = {}
+        for old, new in changes:
+            old_key, new_key = estado_kpi(old), estado_kpi(new)
+            if old_key == new_key:
+                continue
+            if old_key:
+                deltas[old_key] = deltas.get(old_key, 0) - 1
+            if new_key:
+                deltas[new_key] = deltas.get(new_key, 0) + 1
+        MaintenanceKpiStore.apply(deltas)
+
+    @staticmethod
+    def read() -> Dict[str, int]:
+        """
+        Contadores para el tablero. Si falta alguno (primera ejecución) se
+        hace un recuento completo.
+        """
+        rows = MaintenanceKpiStore._conn().execute("SELECT name, value FROM cmms_kpis").fetchall()
+        kpis = {row["name"]: int(row["value"]) for row in rows}
+        if any(key not in kpis for key in KPI_KEYS):
+            MaintenanceKpiStore.reconcile(force=True)
+            rows = MaintenanceKpiStore._conn().execute("SELECT name, value FROM cmms_kpis").fetchall()
+            kpis = {row["name"]: int(row["value"]) for row in rows}
+        return {key: kpis.get(key, 0) for key in KPI_KEYS}
+
+    @staticmethod
+    def recount() -> Dict[str, int]:
+        """Conteo completo leyendo las cuatro hojas"""
+        from app.services.maintenance_service import MaintenanceService
+
+        counts: Dict[str, int] = {}
+        for section in ("maquinas", "activos", "mantenimientos", "historico"):
+            df = MaintenanceService._read_df(section, observe=False)
+            counts.update(snapshot_counts(section, df))
+        return counts
+
+    @staticmethod
+    def reconcile(force: bool = False) -> Dict[str, Dict[str, int]]:
+        """
+        Verificar los contadores contra un recuento completo y corregirlos.
+        Los que recibieron deltas recientes se conservan salvo con force=True.
+
+        Returns:
+            {nombre: {"almacenado": x, "real": y}} de los contadores que no coincidían
+        """
+        counts = MaintenanceKpiStore.recount()
+        rows = MaintenanceKpiStore._conn().execute("SELECT name, value FROM cmms_kpis").fetchall()
+        stored = {row["name"]: int(row["value"]) for row in rows}
+        drift = {
+            name: {"almacenado": stored.get(name), "real": value}
+            for name, value in counts.items()
+            if name in stored and stored[name] != value
+        }
+        MaintenanceKpiStore._store(counts, "recount", force=force)
+        if drift:
+            print(f"⚠️ KPIs CMMS con diferencias en la reconciliación: {drift}")
+        return drift
+
+    @staticmethod
+    def _run_reconciler():
+        interval = Config.MAINTENANCE_KPI_RECONCILE_SECONDS
+        while True:
+            time.sleep(interval)
+            try:
+                MaintenanceKpiStore.reconcile()
+            except Exception as e:
+                print(f"❌ Error al reconciliar KPIs CMMS: {e}")
+
+    @staticmethod
+    def start_background_reconciler():
+        """Iniciar (una vez por proceso) el hilo de reconciliación periódica"""
+        if Config.MAINTENANCE_KPI_RECONCILE_SECONDS <= 0:
+            return
+        if MaintenanceKpiStore._reconciler is not None and MaintenanceKpiStore._reconciler.is_alive():
+            return
+        MaintenanceKpiStore._reconciler = threading.Thread(
+            target=MaintenanceKpiStore._run_reconciler, name='cmms-kpi-reconciler', daemon=True
+        )
+        MaintenanceKpiStore._reconciler.start()
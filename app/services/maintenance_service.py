@@ -4,19 +4,38 @@ MAQUINAS -> ACTIVOS_MANTENIBLES -> MANTENIMIENTOS -> HISTORICO_MANTENIMIENTOS
 """
 from __future__ import annotations
 
+import re
+import threading
+import time
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 
 import pandas as pd
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 from config import Config
+from app.services.request_metrics import RequestMetrics
 from app.services.sheets_service import SheetsService
-from app.services.sheets_writer import get_credentials, get_sheet_id_from_url
+from app.services.sheets_writer import build_service, column_letter, get_credentials, get_sheet_id_from_url
+from app.services.maintenance_kpis import MaintenanceKpiStore, KPI_KEYS
 
 
 class MaintenanceService:
     CRUD_SECTIONS = {"maquinas", "activos", "mantenimientos"}
+    SECTION_ID_COLUMNS = {
+        "maquinas": "id_maquina",
+        "activos": "id_activo",
+        "mantenimientos": "id_mtto",
+        "historico": "id_hist",
+    }
+    ESTADOS_MANTENIMIENTO = ["PROGRAMADO", "PENDIENTE", "EN_PROCESO", "HECHO", "OMITIDO", "REPROGRAMADO"]
+
+    # Caché por spreadsheet de encabezados (fila 1) y propiedades de pestañas
+    # (gid, título, tamaño de grilla). Se invalida por TTL o al detectar que
+    # los encabezados de la hoja cambiaron.
+    METADATA_FIELDS = "sheets.properties(sheetId,title,index,gridProperties(rowCount,columnCount))"
+    _metadata: Dict[str, Dict] = {}
+    _metadata_lock = threading.Lock()
 
     @staticmethod
     def sheet_urls() -> Dict[str, str]:
@@ -31,25 +50,40 @@ class MaintenanceService:
     def _normalize_columns(df: pd.DataFrame) -> Dict[str, str]:
         return {str(c).strip().lower(): c for c in df.columns}
 
-    @staticmethod
-    def _col_letter(index: int) -> str:
-        # 0 -> A, 25 -> Z, 26 -> AA
-        result = ""
-        index += 1
-        while index > 0:
-            index, rem = divmod(index - 1, 26)
-            result = chr(65 + rem) + result
-        return result
-
     @staticmethod
     def _get_sheet_service():
         creds = get_credentials()
-        return build("sheets", "v4", credentials=creds)
+        return build_service("sheets", "v4", creds)
+
+    @staticmethod
+    def _metadata_entry(spreadsheet_id: str) -> Dict:
+        # Llamar con _metadata_lock tomado
+        entry = MaintenanceService._metadata.get(spreadsheet_id)
+        if entry is None or time.time() - entry["created_at"] > Config.MAINTENANCE_METADATA_TTL_SECONDS:
+            entry = {"created_at": time.time()}
+            MaintenanceService._metadata[spreadsheet_id] = entry
+        return entry
+
+    @staticmethod
+    def invalidate_metadata(section: Optional[str] = None) -> None:
+        """Descartar la metadata cacheada de una sección (o de todas)."""
+        with MaintenanceService._metadata_lock:
+            if section is None:
+                MaintenanceService._metadata.clear()
+            else:
+                sheet_id = get_sheet_id_from_url(MaintenanceService.sheet_urls()[section])
+                MaintenanceService._metadata.pop(sheet_id, None)
 
     @staticmethod
     def _get_sheet_headers(section: str) -> List[str]:
         urls = MaintenanceService.sheet_urls()
         sheet_id = get_sheet_id_from_url(urls[section])
+        with MaintenanceService._metadata_lock:
+            cached = MaintenanceService._metadata_entry(sheet_id).get("headers")
+        RequestMetrics.increment("cache", cache="metadata_headers", resultado="hit" if cached else "miss")
+        if cached:
+            return list(cached)
+
         service = MaintenanceService._get_sheet_service()
         resp = (
             service.spreadsheets()
@@ -58,20 +92,127 @@ class MaintenanceService:
             .execute()
         )
         headers = resp.get("values", [[]])[0]
-        return [str(h).strip() for h in headers]
+        headers = [str(h).strip() for h in headers]
+        if headers:
+            with MaintenanceService._metadata_lock:
+                MaintenanceService._metadata_entry(sheet_id)["headers"] = headers
+        return list(headers)
+
+    @staticmethod
+    def _get_sheet_properties(section: str) -> List[Dict]:
+        """Propiedades de las pestañas (sheetId, title, index, gridProperties), con caché."""
+        sheet_id = get_sheet_id_from_url(MaintenanceService.sheet_urls()[section])
+        with MaintenanceService._metadata_lock:
+            cached = MaintenanceService._metadata_entry(sheet_id).get("sheets")
+        RequestMetrics.increment("cache", cache="metadata_sheets", resultado="hit" if cached else "miss")
+        if cached:
+            return cached
+
+        service = MaintenanceService._get_sheet_service()
+        meta = service.spreadsheets().get(
+            spreadsheetId=sheet_id,
+            fields=MaintenanceService.METADATA_FIELDS,
+        ).execute()
+        sheets = [s.get("properties", {}) for s in meta.get("sheets", [])]
+        with MaintenanceService._metadata_lock:
+            MaintenanceService._metadata_entry(sheet_id)["sheets"] = sheets
+        return sheets
 
     @staticmethod
-    def _read_df(section: str) -> pd.DataFrame:
+    def _first_sheet_gid(section: str) -> int:
+        sheets = MaintenanceService._get_sheet_properties(section)
+        first = min(sheets, key=lambda p: p.get("index", 0))
+        return first["sheetId"]
+
+    @staticmethod
+    def _adjust_row_count(section: str, delta: int) -> None:
+        """Mantener el tamaño de grilla cacheado tras insertar o borrar filas."""
+        sheet_id = get_sheet_id_from_url(MaintenanceService.sheet_urls()[section])
+        with MaintenanceService._metadata_lock:
+            sheets = MaintenanceService._metadata.get(sheet_id, {}).get("sheets")
+            if sheets:
+                first = min(sheets, key=lambda p: p.get("index", 0))
+                grid = first.setdefault("gridProperties", {})
+                if "rowCount" in grid:
+                    grid["rowCount"] = max(0, grid["rowCount"] + delta)
+
+    @staticmethod
+    def _check_schema(section: str, df: pd.DataFrame) -> None:
+        """
+        Invalidar la metadata si los encabezados del CSV recién leído no
+        coinciden con los cacheados (columnas agregadas, renombradas o movidas).
+        """
+        sheet_id = get_sheet_id_from_url(MaintenanceService.sheet_urls()[section])
+        with MaintenanceService._metadata_lock:
+            cached = MaintenanceService._metadata.get(sheet_id, {}).get("headers")
+        if not cached or df is None:
+            return
+        # pandas nombra "Unnamed: N" las columnas sin encabezado
+        current = ["" if re.fullmatch(r"Unnamed: \d+", str(c)) else str(c).strip() for c in df.columns]
+        while current and not current[-1]:
+            current.pop()
+        if current != cached:
+            MaintenanceService.invalidate_metadata(section)
+
+    @staticmethod
+    def _read_df(section: str, observe: bool = True) -> pd.DataFrame:
         urls = MaintenanceService.sheet_urls()
-        return SheetsService.read_google_sheet(urls[section])
+        df = SheetsService.read_google_sheet(urls[section])
+        MaintenanceService._check_schema(section, df)
+        if observe:
+            MaintenanceKpiStore.observe(section, df)
+        return df
+
+    @staticmethod
+    def _id_column(df: pd.DataFrame, section: Optional[str] = None) -> Optional[str]:
+        cols = MaintenanceService._normalize_columns(df)
+        # activos y mantenimientos también tienen id_maquina / id_activo como referencia:
+        # la columna propia de la sección tiene prioridad
+        own = MaintenanceService.SECTION_ID_COLUMNS.get(section)
+        if own and own in cols:
+            return cols[own]
+        return cols.get("id_maquina") or cols.get("id_activo") or cols.get("id_mtto") or cols.get("id")
+
+    @staticmethod
+    def _resolve_rows(df: pd.DataFrame, id_col: str) -> Dict[str, int]:
+        """ID -> fila de la hoja (1-based + encabezado) para todo el snapshot; gana la primera aparición."""
+        ids = df[id_col].astype(str).str.strip()
+        ids = ids[~ids.duplicated()]
+        return dict(zip(ids.tolist(), (ids.index + 2).tolist()))
+
+    @staticmethod
+    def _payload_estado(payload: Dict[str, str]) -> Optional[str]:
+        for k, v in payload.items():
+            if str(k).strip().lower() == "estado":
+                return v
+        return None
+
+    @staticmethod
+    def _row_estados(df: pd.DataFrame, rows: List[int]) -> List[str]:
+        """Estado de las filas indicadas (números de fila de la hoja)"""
+        estado_col = MaintenanceService._normalize_columns(df).get("estado") if df is not None else None
+        if not estado_col:
+            return []
+        return [df.at[row_pos - 2, estado_col] for row_pos in rows]
+
+    @staticmethod
+    def _closed_ids(df: pd.DataFrame, record_ids, positions: Dict[str, int]) -> List[str]:
+        """IDs cuyas filas ya están cerradas en histórico (no se modifican)"""
+        estado_col = MaintenanceService._normalize_columns(df).get("estado")
+        if not estado_col:
+            return []
+        return [
+            r for r in (str(r).strip() for r in record_ids)
+            if r in positions
+            and str(df.at[positions[r] - 2, estado_col]).strip().upper() == "CERRADO_EN_HISTORICO"
+        ]
 
     @staticmethod
     def _find_record_row(section: str, record_id: str) -> Tuple[Optional[int], Optional[str], Optional[pd.DataFrame]]:
         df = MaintenanceService._read_df(section)
         if df is None or df.empty:
             return None, None, df
-        cols = MaintenanceService._normalize_columns(df)
-        id_col = cols.get("id_maquina") or cols.get("id_activo") or cols.get("id_mtto") or cols.get("id")
+        id_col = MaintenanceService._id_column(df, section)
         if not id_col:
             return None, None, df
         record_id = str(record_id).strip()
@@ -137,6 +278,8 @@ class MaintenanceService:
             insertDataOption="INSERT_ROWS",
             body={"values": [values]},
         ).execute()
+        MaintenanceService._adjust_row_count(section, 1)
+        MaintenanceKpiStore.record_created(section, estados=[MaintenanceService._payload_estado(payload)])
         return True, "Registro creado correctamente."
 
     @staticmethod
@@ -176,46 +319,229 @@ class MaintenanceService:
             valueInputOption="RAW",
             body={"values": [values]},
         ).execute()
+        if section == "mantenimientos":
+            estado_col = MaintenanceService._normalize_columns(df).get("estado")
+            new_estado = MaintenanceService._payload_estado(payload)
+            if estado_col and new_estado is not None:
+                MaintenanceKpiStore.record_estado_changes([(row_current[estado_col], new_estado)])
         return True, "Registro actualizado correctamente."
 
     @staticmethod
     def delete_record(section: str, record_id: str) -> Tuple[bool, str]:
         if section not in MaintenanceService.CRUD_SECTIONS:
             return False, "Sección no habilitada para eliminar."
-        row_pos, _, _ = MaintenanceService._find_record_row(section, record_id)
+        row_pos, _, df = MaintenanceService._find_record_row(section, record_id)
         if not row_pos:
             return False, f"No se encontró el registro {record_id}."
+        estados = MaintenanceService._row_estados(df, [row_pos])
 
+        MaintenanceService._delete_rows(section, [(row_pos - 1, row_pos)])
+        MaintenanceService._adjust_row_count(section, -1)
+        MaintenanceKpiStore.record_deleted(section, estados=estados)
+        return True, "Registro eliminado correctamente."
+
+    @staticmethod
+    def _delete_rows(section: str, ranges: List[Tuple[int, int]]) -> None:
+        """
+        Borrar rangos de filas [start, end) 0-based de la primera pestaña en un
+        único batchUpdate. Si el gid cacheado ya no es válido (pestaña
+        recreada) se descarta la metadata y se reintenta una vez.
+        """
         service = MaintenanceService._get_sheet_service()
         spreadsheet_id = get_sheet_id_from_url(MaintenanceService.sheet_urls()[section])
-        meta = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        first_sheet = meta["sheets"][0]["properties"]
-        sheet_gid = first_sheet["sheetId"]
-        start_index = row_pos - 1
-        end_index = row_pos
-        service.spreadsheets().batchUpdate(
-            spreadsheetId=spreadsheet_id,
-            body={
-                "requests": [
-                    {
-                        "deleteDimension": {
-                            "range": {
-                                "sheetId": sheet_gid,
-                                "dimension": "ROWS",
-                                "startIndex": start_index,
-                                "endIndex": end_index,
+
+        def send(sheet_gid: int):
+            service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={
+                    "requests": [
+                        {
+                            "deleteDimension": {
+                                "range": {
+                                    "sheetId": sheet_gid,
+                                    "dimension": "ROWS",
+                                    "startIndex": start_index,
+                                    "endIndex": end_index,
+                                }
                             }
                         }
-                    }
-                ]
-            },
-        ).execute()
-        return True, "Registro eliminado correctamente."
+                        for start_index, end_index in ranges
+                    ]
+                },
+            ).execute()
+
+        try:
+            send(MaintenanceService._first_sheet_gid(section))
+        except HttpError as e:
+            if getattr(e.resp, "status", None) != 400:
+                raise
+            MaintenanceService.invalidate_metadata(section)
+            send(MaintenanceService._first_sheet_gid(section))
+
+    @staticmethod
+    def _missing_note(missing: List[str]) -> str:
+        if not missing:
+            return ""
+        shown = ", ".join(missing[:10]) + ("…" if len(missing) > 10 else "")
+        return f" No se encontraron: {shown}."
+
+    @staticmethod
+    def _apply_cell_updates(section: str, df: pd.DataFrame, id_col: str,
+                            positions: Dict[str, int], updates: Dict[str, Dict[str, str]]) -> int:
+        """
+        Escribir en un único values.batchUpdate las celdas indicadas de cada fila.
+        El ID y fecha_creacion no se modifican; fecha_actualizacion se sella si existe.
+
+        Returns:
+            Cantidad de filas escritas
+        """
+        col_index: Dict[str, int] = {}
+        for idx, col in enumerate(df.columns):
+            col_index.setdefault(str(col).strip().lower(), idx)
+        protected = {str(id_col).strip().lower(), "fecha_creacion"}
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        estado_idx = col_index.get("estado") if section == "mantenimientos" else None
+
+        data = []
+        estado_changes = []
+        rows_written = 0
+        for record_id, fields in updates.items():
+            row_pos = positions.get(str(record_id).strip())
+            if not row_pos:
+                continue
+            cells = {}
+            for k, v in fields.items():
+                key = str(k).strip().lower()
+                if key in col_index and key not in protected:
+                    cells[col_index[key]] = "" if v is None else str(v)
+            if not cells:
+                continue
+            if estado_idx is not None and estado_idx in cells:
+                estado_changes.append((df.iat[row_pos - 2, estado_idx], cells[estado_idx]))
+            if "fecha_actualizacion" in col_index:
+                cells[col_index["fecha_actualizacion"]] = now
+            for idx, value in cells.items():
+                data.append({
+                    "range": f"{column_letter(idx)}{row_pos}",
+                    "values": [[value]],
+                })
+            rows_written += 1
+
+        if data:
+            service = MaintenanceService._get_sheet_service()
+            sheet_id = get_sheet_id_from_url(MaintenanceService.sheet_urls()[section])
+            service.spreadsheets().values().batchUpdate(
+                spreadsheetId=sheet_id,
+                body={"valueInputOption": "RAW", "data": data},
+            ).execute()
+            MaintenanceKpiStore.record_estado_changes(estado_changes)
+        return rows_written
+
+    @staticmethod
+    def bulk_update(section: str, updates: Dict[str, Dict[str, str]]) -> Tuple[bool, str]:
+        """
+        Actualizar varios registros a la vez: una lectura de la hoja para ubicar
+        todas las filas y un único batchUpdate con las celdas modificadas.
+        Los registros ya cerrados en histórico no se modifican.
+
+        Args:
+            section: Sección CRUD
+            updates: {record_id: {campo: valor}}
+        """
+        if section not in MaintenanceService.CRUD_SECTIONS:
+            return False, "Sección no habilitada para editar."
+        if not updates:
+            return False, "No se seleccionaron registros."
+        df = MaintenanceService._read_df(section)
+        if df is None or df.empty:
+            return False, "La hoja no tiene registros."
+        id_col = MaintenanceService._id_column(df, section)
+        if not id_col:
+            return False, "La hoja no tiene columna de ID."
+
+        positions = MaintenanceService._resolve_rows(df, id_col)
+        missing = [str(r) for r in updates if str(r).strip() not in positions]
+        closed = set(MaintenanceService._closed_ids(df, updates, positions))
+        updates = {r: fields for r, fields in updates.items() if str(r).strip() not in closed}
+        written = MaintenanceService._apply_cell_updates(section, df, id_col, positions, updates)
+        msg = f"{written} registro(s) actualizado(s)."
+        if closed:
+            msg += f" {len(closed)} ya cerrado(s) en histórico no se modificaron."
+        return written > 0, msg + MaintenanceService._missing_note(missing)
+
+    @staticmethod
+    def bulk_delete(section: str, record_ids: List[str]) -> Tuple[bool, str]:
+        """
+        Eliminar varios registros con un único batchUpdate. Las filas se borran
+        de abajo hacia arriba (y las contiguas en un solo rango) para que los
+        índices de las siguientes eliminaciones sigan siendo válidos.
+        """
+        if section not in MaintenanceService.CRUD_SECTIONS:
+            return False, "Sección no habilitada para eliminar."
+        record_ids = [str(r).strip() for r in record_ids if str(r).strip()]
+        if not record_ids:
+            return False, "No se seleccionaron registros."
+        df = MaintenanceService._read_df(section)
+        if df is None or df.empty:
+            return False, "La hoja no tiene registros."
+        id_col = MaintenanceService._id_column(df, section)
+        if not id_col:
+            return False, "La hoja no tiene columna de ID."
+
+        positions = MaintenanceService._resolve_rows(df, id_col)
+        missing = [r for r in record_ids if r not in positions]
+        rows = sorted({positions[r] for r in record_ids if r in positions}, reverse=True)
+        if not rows:
+            return False, f"No se eliminó ningún registro.{MaintenanceService._missing_note(missing)}"
+
+        # Rangos 0-based [start, end) en orden descendente, fusionando filas contiguas
+        ranges: List[List[int]] = []
+        for row_pos in rows:
+            if ranges and ranges[-1][0] == row_pos:
+                ranges[-1][0] = row_pos - 1
+            else:
+                ranges.append([row_pos - 1, row_pos])
+
+        MaintenanceService._delete_rows(section, [tuple(r) for r in ranges])
+        MaintenanceService._adjust_row_count(section, -len(rows))
+        MaintenanceKpiStore.record_deleted(
+            section, count=len(rows), estados=MaintenanceService._row_estados(df, rows)
+        )
+        return True, f"{len(rows)} registro(s) eliminado(s).{MaintenanceService._missing_note(missing)}"
+
+    @staticmethod
+    def bulk_set_estado(record_ids: List[str], estado: str) -> Tuple[bool, str]:
+        """
+        Cambiar el estado de varios mantenimientos en un único batchUpdate.
+        Los registros ya cerrados en histórico no se modifican.
+        """
+        estado = str(estado or "").strip().upper()
+        if estado not in MaintenanceService.ESTADOS_MANTENIMIENTO:
+            return False, f"Estado no válido: {estado or '(vacío)'}."
+        record_ids = [str(r).strip() for r in record_ids if str(r).strip()]
+        if not record_ids:
+            return False, "No se seleccionaron registros."
+        df = MaintenanceService._read_df("mantenimientos")
+        if df is None or df.empty:
+            return False, "No hay mantenimientos."
+        id_col = MaintenanceService._id_column(df, "mantenimientos")
+        estado_col = MaintenanceService._normalize_columns(df).get("estado")
+        if not id_col or not estado_col:
+            return False, "La hoja de mantenimientos debe tener columnas id_mtto e estado."
+
+        positions = MaintenanceService._resolve_rows(df, id_col)
+        missing = [r for r in record_ids if r not in positions]
+        closed = MaintenanceService._closed_ids(df, record_ids, positions)
+        updates = {r: {estado_col: estado} for r in record_ids if r in positions and r not in closed}
+        written = MaintenanceService._apply_cell_updates("mantenimientos", df, id_col, positions, updates)
+        msg = f"{written} mantenimiento(s) pasaron a {estado}."
+        if closed:
+            msg += f" {len(closed)} ya cerrado(s) en histórico no se modificaron."
+        return written > 0, msg + MaintenanceService._missing_note(missing)
 
     @staticmethod
     def read_table(key: str) -> Tuple[List[str], List[List[str]]]:
-        urls = MaintenanceService.sheet_urls()
-        df = SheetsService.read_google_sheet(urls[key])
+        df = MaintenanceService._read_df(key)
         if df is None or df.empty:
             return [], []
         df = df.where(pd.notna(df), "")
@@ -225,42 +551,12 @@ class MaintenanceService:
 
     @staticmethod
     def compute_kpis() -> Dict[str, int]:
-        kpis = {
-            "total_maquinas": 0,
-            "total_activos": 0,
-            "programados": 0,
-            "pendientes": 0,
-            "en_proceso": 0,
-            "hechos": 0,
-            "historicos": 0,
-        }
-        urls = MaintenanceService.sheet_urls()
+        """KPIs del tablero desde los contadores materializados (ver MaintenanceKpiStore)"""
         try:
-            maq_df = SheetsService.read_google_sheet(urls["maquinas"])
-            if maq_df is not None and not maq_df.empty:
-                kpis["total_maquinas"] = len(maq_df.index)
-
-            act_df = SheetsService.read_google_sheet(urls["activos"])
-            if act_df is not None and not act_df.empty:
-                kpis["total_activos"] = len(act_df.index)
-
-            mtto_df = SheetsService.read_google_sheet(urls["mantenimientos"])
-            if mtto_df is not None and not mtto_df.empty:
-                cols = MaintenanceService._normalize_columns(mtto_df)
-                estado_col = cols.get("estado")
-                if estado_col:
-                    estados = mtto_df[estado_col].astype(str).str.strip().str.upper()
-                    kpis["programados"] = int((estados == "PROGRAMADO").sum())
-                    kpis["pendientes"] = int((estados == "PENDIENTE").sum())
-                    kpis["en_proceso"] = int((estados == "EN_PROCESO").sum())
-                    kpis["hechos"] = int((estados == "HECHO").sum())
-
-            hist_df = SheetsService.read_google_sheet(urls["historico"])
-            if hist_df is not None and not hist_df.empty:
-                kpis["historicos"] = len(hist_df.index)
-        except Exception:
-            pass
-        return kpis
+            return MaintenanceKpiStore.read()
+        except Exception as e:
+            print(f"⚠️ Error al leer KPIs CMMS: {e}")
+            return {key: 0 for key in KPI_KEYS}
 
     @staticmethod
     def close_mantenimiento(mtto_id: str, cerrado_por: str) -> Tuple[bool, str]:
@@ -269,96 +565,105 @@ class MaintenanceService:
         1) Copia snapshot al histórico
         2) Marca estado operativo como CERRADO_EN_HISTORICO (no editable)
         """
+        mtto_id = str(mtto_id).strip()
+        ok, msg, closed = MaintenanceService._close_many([mtto_id], cerrado_por)
+        if not ok or not closed:
+            return False, msg
+        return True, f"Mantenimiento {mtto_id} cerrado y movido al histórico."
+
+    @staticmethod
+    def close_mantenimientos(mtto_ids: List[str], cerrado_por: str) -> Tuple[bool, str]:
+        """
+        Cierre en lote de mantenimientos HECHO: un solo append al histórico con
+        todas las filas y un solo batchUpdate de estado y fecha_actualizacion.
+        Los registros que no estén en HECHO se omiten.
+        """
+        ok, msg, _closed = MaintenanceService._close_many(mtto_ids, cerrado_por)
+        return ok, msg
+
+    @staticmethod
+    def _close_many(mtto_ids: List[str], cerrado_por: str) -> Tuple[bool, str, List[str]]:
+        mtto_ids = list(dict.fromkeys(str(m).strip() for m in mtto_ids if str(m).strip()))
+        if not mtto_ids:
+            return False, "No se seleccionaron mantenimientos.", []
+
         urls = MaintenanceService.sheet_urls()
-        df = SheetsService.read_google_sheet(urls["mantenimientos"])
+        df = MaintenanceService._read_df("mantenimientos")
         if df is None or df.empty:
-            return False, "No hay mantenimientos para cerrar."
+            return False, "No hay mantenimientos para cerrar.", []
 
         cols = MaintenanceService._normalize_columns(df)
         id_col = cols.get("id_mtto") or cols.get("id")
         estado_col = cols.get("estado")
         if not id_col or not estado_col:
-            return False, "La hoja de mantenimientos debe tener columnas id_mtto e estado."
-
-        mtto_id = str(mtto_id).strip()
-        match = df[df[id_col].astype(str).str.strip() == mtto_id]
-        if match.empty:
-            return False, f"No se encontró el mantenimiento {mtto_id}."
-
-        row = match.iloc[0]
-        row_pos = int(match.index[0]) + 2  # +2: header + 1-index
-        estado = str(row[estado_col]).strip().upper()
-        if estado != "HECHO":
-            return False, "Solo se puede cerrar un mantenimiento con estado HECHO."
-
-        # Construir snapshot para histórico
-        snapshot = {
-            "id_mtto_original": row.get(id_col, ""),
-            "id_activo": row.get(cols.get("id_activo", ""), ""),
-            "fecha_programada": row.get(cols.get("fecha_programada", ""), ""),
-            "fecha_ejecucion": row.get(cols.get("fecha_ejecucion", ""), ""),
-            "tipo_mtto": row.get(cols.get("tipo_mtto", ""), ""),
-            "tecnico": row.get(cols.get("tecnico", ""), ""),
-            "actividad": row.get(cols.get("actividad", ""), ""),
-            "observaciones": row.get(cols.get("observaciones", ""), ""),
-            "cerrado_por": cerrado_por,
-            "fecha_cierre": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "version": 1,
-        }
-
-        creds = get_credentials()
-        service = build("sheets", "v4", credentials=creds)
-
-        # 1) Append en histórico respetando headers reales
-        hist_id = get_sheet_id_from_url(urls["historico"])
-        hist_headers_resp = service.spreadsheets().values().get(
-            spreadsheetId=hist_id,
-            range="A1:ZZ1",
-        ).execute()
-        hist_headers = hist_headers_resp.get("values", [[]])[0]
+            return False, "La hoja de mantenimientos debe tener columnas id_mtto e estado.", []
+
+        positions = MaintenanceService._resolve_rows(df, id_col)
+        missing = [m for m in mtto_ids if m not in positions]
+        if len(mtto_ids) == 1 and missing:
+            return False, f"No se encontró el mantenimiento {mtto_ids[0]}.", []
+
+        found = [m for m in mtto_ids if m in positions]
+        estados = df[estado_col].astype(str).str.strip().str.upper()
+        to_close = [m for m in found if estados.at[positions[m] - 2] == "HECHO"]
+        skipped = [m for m in found if m not in to_close]
+        if not to_close:
+            if len(mtto_ids) == 1:
+                return False, "Solo se puede cerrar un mantenimiento con estado HECHO.", []
+            return False, (
+                "Ninguno de los mantenimientos seleccionados está en HECHO."
+                + MaintenanceService._missing_note(missing)
+            ), []
+
+        hist_headers = MaintenanceService._get_sheet_headers("historico")
         if not hist_headers:
-            return False, "La hoja de histórico no tiene encabezados."
+            return False, "La hoja de histórico no tiene encabezados.", []
+        hist_keys = [str(h).strip().lower() for h in hist_headers]
+
+        fecha_cierre = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        hist_rows = []
+        for mtto_id in to_close:
+            row = df.loc[positions[mtto_id] - 2]
+            # Construir snapshot para histórico
+            snapshot = {
+                "id_mtto_original": row.get(id_col, ""),
+                "id_activo": row.get(cols.get("id_activo", ""), ""),
+                "fecha_programada": row.get(cols.get("fecha_programada", ""), ""),
+                "fecha_ejecucion": row.get(cols.get("fecha_ejecucion", ""), ""),
+                "tipo_mtto": row.get(cols.get("tipo_mtto", ""), ""),
+                "tecnico": row.get(cols.get("tecnico", ""), ""),
+                "actividad": row.get(cols.get("actividad", ""), ""),
+                "observaciones": row.get(cols.get("observaciones", ""), ""),
+                "cerrado_por": cerrado_por,
+                "fecha_cierre": fecha_cierre,
+                "version": 1,
+            }
+            hist_rows.append([
+                "" if pd.isna(snapshot.get(h, "")) else str(snapshot.get(h, ""))
+                for h in hist_keys
+            ])
 
-        hist_values = []
-        for h in hist_headers:
-            hv = str(h).strip().lower()
-            value = ""
-            for k, v in snapshot.items():
-                if str(k).strip().lower() == hv:
-                    value = "" if pd.isna(v) else str(v)
-                    break
-            hist_values.append(value)
+        service = MaintenanceService._get_sheet_service()
 
+        # 1) Append en histórico respetando headers reales (una sola llamada)
         service.spreadsheets().values().append(
-            spreadsheetId=hist_id,
+            spreadsheetId=get_sheet_id_from_url(urls["historico"]),
             range="A:ZZ",
             valueInputOption="RAW",
             insertDataOption="INSERT_ROWS",
-            body={"values": [hist_values]},
+            body={"values": hist_rows},
         ).execute()
+        MaintenanceService._adjust_row_count("historico", len(hist_rows))
+        MaintenanceKpiStore.record_created("historico", count=len(hist_rows))
 
-        # 2) Bloquear el registro operativo cambiando estado
-        mtto_sheet_id = get_sheet_id_from_url(urls["mantenimientos"])
-        estado_col_idx = list(df.columns).index(cols["estado"])
-        estado_letter = chr(ord("A") + estado_col_idx)
-        service.spreadsheets().values().update(
-            spreadsheetId=mtto_sheet_id,
-            range=f"{estado_letter}{row_pos}",
-            valueInputOption="RAW",
-            body={"values": [["CERRADO_EN_HISTORICO"]]},
-        ).execute()
-
-        # fecha_actualizacion si existe
-        fecha_act_col = cols.get("fecha_actualizacion")
-        if fecha_act_col:
-            fecha_idx = list(df.columns).index(fecha_act_col)
-            fecha_letter = chr(ord("A") + fecha_idx)
-            service.spreadsheets().values().update(
-                spreadsheetId=mtto_sheet_id,
-                range=f"{fecha_letter}{row_pos}",
-                valueInputOption="RAW",
-                body={"values": [[datetime.now().strftime("%Y-%m-%d %H:%M:%S")]]},
-            ).execute()
+        # 2) Bloquear los registros operativos (estado + fecha_actualizacion en un batchUpdate)
+        MaintenanceService._apply_cell_updates(
+            "mantenimientos", df, id_col, positions,
+            {m: {estado_col: "CERRADO_EN_HISTORICO"} for m in to_close},
+        )
 
-        return True, f"Mantenimiento {mtto_id} cerrado y movido al histórico."
+        msg = f"{len(to_close)} mantenimiento(s) cerrado(s) y movido(s) al histórico."
+        if skipped:
+            msg += f" {len(skipped)} omitido(s) por no estar en HECHO."
+        return True, msg + MaintenanceService._missing_note(missing), to_close
 
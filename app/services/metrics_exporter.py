@@ -0,0 +1,217 @@
+"""
+Exportación de métricas en formato de texto de Prometheus.
+
+Cada worker de gunicorn acumula sus métricas en memoria (RequestMetrics) y
+las vuelca periódicamente a LOCAL_STATE_DB, una fila por proceso y serie.
+/metrics suma los contadores de todos los procesos (incluidos los que ya
+terminaron, para que los totales no retrocedan al reiniciar un worker) y
+muestra los valores por proceso (edad del snapshot) solo de los workers
+que siguen vivos. La profundidad de las colas se lee directamente de SQLite.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from app.services import local_store
+from app.services.request_metrics import RequestMetrics
+
+
+PREFIX = 'convexa_'
+
+# Un proceso que no vuelca métricas en este tiempo deja de reportar gauges
+STALE_PROCESS_SECONDS = 300
+# Filas de procesos terminados que se conservan (los totales se reinician luego)
+RETENTION_SECONDS = 7 * 24 * 3600
+
+KIND_COUNTER = 'counter'
+KIND_GAUGE = 'gauge'
+
+HELP = {
+    'request_duration_seconds': ('histogram', 'Duración de las peticiones por endpoint'),
+    'external_calls_total': ('counter', 'Llamadas externas (CSV, Sheets API, Drive, QR) por categoría'),
+    'external_call_seconds_total': ('counter', 'Segundos en llamadas externas por categoría'),
+    'external_bytes_total': ('counter', 'Bytes transferidos en llamadas externas por categoría'),
+    'external_errors_total': ('counter', 'Errores de llamadas externas por categoría y clase (quota, auth, timeout, other)'),
+    'cache_total': ('counter', 'Consultas a cachés por resultado (hit, miss)'),
+    'token_refresh_total': ('counter', 'Refrescos del token de Google por resultado'),
+    'inventory_snapshot_age_seconds': ('gauge', 'Segundos desde el último snapshot del inventario en cada worker'),
+    'inventory_snapshot_version': ('gauge', 'Snapshots del inventario publicados en cada worker'),
+    'qr_queue_items': ('gauge', 'QR en la cola local por estado'),
+    'movement_journal_items': ('gauge', 'Movimientos en el diario local por estado'),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_samples (
+    process TEXT NOT NULL,
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (process, name, labels)
+);
+"""
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _sort_key(item: Tuple[Dict[str, str], float]):
+    # Buckets en orden creciente de "le" dentro de cada serie
+    labels = item[0]
+    le = labels.get('le')
+    rest = sorted((k, v) for k, v in labels.items() if k != 'le')
+    return rest, float('inf') if le == '+Inf' else float(le or 0)
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsExporter:
+    """
+    Agregación entre workers y serialización de /metrics
+    """
+
+    _schema_ready = False
+    _process: Optional[Tuple[int, str]] = None
+    _worker: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _conn():
+        conn = local_store.connect()
+        if not MetricsExporter._schema_ready:
+            conn.executescript(_SCHEMA)
+            MetricsExporter._schema_ready = True
+        return conn
+
+    @staticmethod
+    def process_key() -> str:
+        """Identificador del proceso (pid + hora de inicio, para no mezclar pids reutilizados)"""
+        pid = os.getpid()
+        if MetricsExporter._process is None or MetricsExporter._process[0] != pid:
+            MetricsExporter._process = (pid, f'{pid}-{int(time.time())}')
+        return MetricsExporter._process[1]
+
+    @staticmethod
+    def _gauges() -> List[Tuple[str, Dict[str, str], float]]:
+        """Valores propios de este proceso"""
+        from app.services.inventory_snapshot import InventorySnapshot
+
+        result = [('inventory_snapshot_version', {}, InventorySnapshot.version())]
+        age = InventorySnapshot.age_seconds()
+        if age is not None:
+            result.append(('inventory_snapshot_age_seconds', {}, age))
+        return result
+
+    @staticmethod
+    def flush() -> None:
+        """Volcar las métricas de este proceso a LOCAL_STATE_DB"""
+        process = MetricsExporter.process_key()
+        now = time.time()
+        rows = [
+            (process, name, json.dumps(labels, sort_keys=True), KIND_COUNTER, float(value), now)
+            for name, labels, value in RequestMetrics.samples()
+        ]
+        rows += [
+            (process, name, json.dumps(labels, sort_keys=True), KIND_GAUGE, float(value), now)
+            for name, labels, value in MetricsExporter._gauges()
+        ]
+        MetricsExporter._conn()
+        with local_store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO metric_samples (process, name, labels, kind, value, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (process, name, labels) DO UPDATE SET value = excluded.value, "
+                "updated_at = excluded.updated_at",
+                rows
+            )
+            conn.execute("DELETE FROM metric_samples WHERE updated_at < ?", (now - RETENTION_SECONDS,))
+
+    @staticmethod
+    def _queue_gauges() -> List[Tuple[str, Dict[str, str], float]]:
+        from app.services.movement_journal import MovementJournal
+        from app.services.qr_queue import QRQueue
+
+        result = []
+        for name, stats in (('qr_queue_items', QRQueue.status), ('movement_journal_items', MovementJournal.stats)):
+            try:
+                for status, total in stats().items():
+                    result.append((name, {'estado': status}, total))
+            except Exception as e:
+                print(f"⚠️ No se pudo leer {name} para /metrics: {e}")
+        return result
+
+    @staticmethod
+    def render() -> str:
+        """Texto de /metrics con los valores de todos los workers"""
+        MetricsExporter.flush()
+        now = time.time()
+        conn = MetricsExporter._conn()
+        series: Dict[str, List[Tuple[Dict[str, str], float]]] = {}
+
+        for row in conn.execute(
+            "SELECT name, labels, SUM(value) AS value FROM metric_samples WHERE kind = ? "
+            "GROUP BY name, labels ORDER BY name, labels",
+            (KIND_COUNTER,)
+        ):
+            series.setdefault(row['name'], []).append((json.loads(row['labels']), row['value']))
+
+        for row in conn.execute(
+            "SELECT process, name, labels, value FROM metric_samples WHERE kind = ? AND updated_at >= ? "
+            "ORDER BY name, process",
+            (KIND_GAUGE, now - STALE_PROCESS_SECONDS)
+        ):
+            labels = {**json.loads(row['labels']), 'proceso': row['process']}
+            series.setdefault(row['name'], []).append((labels, row['value']))
+
+        for name, labels, value in MetricsExporter._queue_gauges():
+            series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        families_done = set()
+        for name in sorted(series):
+            family = name
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.startswith('request_duration_seconds') and name.endswith(suffix):
+                    family = name[:-len(suffix)]
+            if family not in families_done:
+                families_done.add(family)
+                kind, description = HELP.get(family, ('untyped', family))
+                lines.append(f'# HELP {PREFIX}{family} {description}')
+                lines.append(f'# TYPE {PREFIX}{family} {kind}')
+            for labels, value in sorted(series[name], key=_sort_key):
+                lines.append(f'{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _run_worker():
+        while True:
+            time.sleep(Config.METRICS_FLUSH_SECONDS)
+            try:
+                MetricsExporter.flush()
+            except Exception as e:
+                print(f"Error al volcar métricas: {e}")
+
+    @staticmethod
+    def start_background_flusher():
+        """Iniciar (una vez por proceso) el hilo que vuelca las métricas a SQLite"""
+        if MetricsExporter._worker is not None and MetricsExporter._worker.is_alive():
+            return
+        MetricsExporter._conn()
+        MetricsExporter._worker = threading.Thread(
+            target=MetricsExporter._run_worker, name='metrics-flusher', daemon=True
+        )
+        MetricsExporter._worker.start()
@@ -0,0 +1,544 @@
+"""
+Diario local (write-ahead) de movimientos de stock.
+
+Cada movimiento se guarda en SQLite (modo WAL) y se confirma al usuario de
+inmediato; un hilo en segundo plano aplica los movimientos pendientes a
+Google Sheets en lotes: un batchUpdate para las filas del inventario y un
+append para el histórico.
+
+Garantías:
+- Orden por producto: los movimientos se aplican por número de secuencia y
+  no se toma un producto mientras otro lote suyo esté en vuelo.
+- Recuperación: antes de escribir en Sheets se persiste el stock resultante
+  de cada movimiento. Un lote interrumpido (caída del worker o error a mitad
+  de escritura) se reaplica con esos valores absolutos y solo se agregan al
+  histórico las filas que aún no estén allí.
+- Sin stock negativo: el export CSV de la hoja puede llegar con retraso, así
+  que mientras un snapshot no sea claramente posterior a la aplicación de un
+  movimiento se toma como stock el que dejó el último movimiento aplicado.
+"""
+import atexit
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import Config
+from app.services import local_store
+from app.services.inventory_index import find_id_column, normalize_id
+
+
+STATUS_PENDING = 'pending'
+STATUS_FLUSHING = 'flushing'
+STATUS_APPLIED = 'applied'
+STATUS_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS movement_journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT NOT NULL,
+    stock_field TEXT NOT NULL,
+    delta REAL NOT NULL,
+    fields TEXT NOT NULL,
+    history TEXT,
+    username TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    batch_id TEXT,
+    claimed_at REAL,
+    stock_after REAL,
+    applied_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_movement_journal_status ON movement_journal (status, seq);
+CREATE INDEX IF NOT EXISTS idx_movement_journal_product ON movement_journal (product_id, status);
+"""
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value) if value is not None and str(value).strip() else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class MovementJournal:
+    """
+    Diario de movimientos de stock con aplicación diferida por lotes
+    """
+
+    _schema_ready = False
+    _wakeup = threading.Event()
+    _flusher: Optional[threading.Thread] = None
+    _flush_lock = threading.Lock()
+
+    @staticmethod
+    def _conn():
+        conn = local_store.connect()
+        if not MovementJournal._schema_ready:
+            conn.executescript(_SCHEMA)
+            MovementJournal._schema_ready = True
+        return conn
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(Config.MOVEMENT_JOURNAL_ENABLED)
+
+    # ------------------------------------------------------------------
+    # Registro
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def record(product_id: str, stock_field: str, delta: float, base_stock: float,
+               fields: Dict, history: Optional[Dict], username: str) -> int:
+        """
+        Registrar un movimiento de forma durable
+
+        La validación de stock negativo se repite dentro de la transacción
+        (stock actual según current_stock + este movimiento) para que dos
+        workers no puedan confirmar salidas que juntas dejen el stock negativo.
+
+        Args:
+            product_id: ID del producto (valor de la columna ID)
+            stock_field: Nombre de la columna de stock
+            delta: Ajuste de stock (positivo ingreso, negativo salida, 0 sin movimiento)
+            base_stock: Stock leído del snapshot del inventario
+            fields: Otros campos editados del producto
+            history: Datos para el histórico (None si no hay ajuste)
+            username: Usuario que registra el movimiento
+
+        Returns:
+            Número de secuencia del movimiento
+
+        Raises:
+            ValueError: Si el stock resultante sería negativo
+        """
+        MovementJournal._conn()
+        product_key = normalize_id(product_id)
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cutoff = MovementJournal._snapshot_cutoff()
+        with local_store.transaction() as conn:
+            current = MovementJournal._current_stock(conn, product_key, base_stock, cutoff)
+            resulting = current + delta
+            if resulting < 0:
+                raise ValueError(
+                    f'No se puede realizar la operación. El stock resultante sería negativo ({resulting}). '
+                    f'Stock actual: {current}'
+                )
+            seq = MovementJournal._insert(conn, product_key, stock_field, delta, fields, history, username, created_at)
+        MovementJournal._wakeup.set()
+        return seq
+
+    @staticmethod
+    def _insert(conn, product_key: str, stock_field: str, delta: float, fields: Dict,
+                history: Optional[Dict], username: str, created_at: str) -> int:
+        cursor = conn.execute(
+            "INSERT INTO movement_journal (product_id, stock_field, delta, fields, history, username, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                product_key, stock_field, float(delta),
+                json.dumps(fields, default=str),
+                json.dumps(history, default=str) if history is not None else None,
+                username, created_at,
+            )
+        )
+        return cursor.lastrowid
+
+    @staticmethod
+    def record_many(movements: List[Dict], username: str) -> List[int]:
+        """
+        Registrar varios movimientos en una sola transacción: se revalida el
+        stock de cada línea (acumulando las del mismo producto en orden) y, si
+        alguna dejaría el stock negativo, no se registra ninguna.
+
+        Args:
+            movements: Diccionarios con los argumentos de record (product_id,
+                stock_field, delta, base_stock, fields, history)
+            username: Usuario que registra los movimientos
+
+        Returns:
+            Números de secuencia, en el orden recibido
+
+        Raises:
+            ValueError: Si alguna línea dejaría el stock negativo
+        """
+        MovementJournal._conn()
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cutoff = MovementJournal._snapshot_cutoff()
+        seqs = []
+        with local_store.transaction() as conn:
+            running = {}
+            for number, move in enumerate(movements, start=1):
+                product_key = normalize_id(move['product_id'])
+                if product_key not in running:
+                    running[product_key] = MovementJournal._current_stock(conn, product_key, move['base_stock'], cutoff)
+                resulting = running[product_key] + move['delta']
+                if resulting < 0:
+                    raise ValueError(
+                        f'Línea {number}: el stock resultante sería negativo ({resulting:g}). '
+                        f'Stock actual: {running[product_key]:g}. No se registró ningún movimiento.'
+                    )
+                running[product_key] = resulting
+                seqs.append(MovementJournal._insert(
+                    conn, product_key, move['stock_field'], move['delta'], move.get('fields') or {},
+                    move.get('history'), username, created_at
+                ))
+        MovementJournal._wakeup.set()
+        return seqs
+
+    @staticmethod
+    def _snapshot_cutoff() -> float:
+        """
+        Momento desde el cual un movimiento aplicado puede no estar en el último
+        snapshot del inventario: su lectura (o ahora, si no hay ninguno) menos
+        el retraso admitido del export CSV
+        """
+        from app.services.inventory_snapshot import InventorySnapshot
+
+        age = InventorySnapshot.age_seconds()
+        return time.time() - (age or 0) - Config.MOVEMENT_JOURNAL_EXPORT_LAG_SECONDS
+
+    @staticmethod
+    def _last_applied(conn, product_key: str, cutoff: float) -> Optional[float]:
+        """Stock que dejó el último movimiento aplicado después de `cutoff` (o None)"""
+        row = conn.execute(
+            "SELECT stock_after FROM movement_journal WHERE product_id = ? AND status = ? "
+            "AND applied_at >= ? ORDER BY seq DESC LIMIT 1",
+            (product_key, STATUS_APPLIED, cutoff)
+        ).fetchone()
+        return None if row is None or row['stock_after'] is None else float(row['stock_after'])
+
+    @staticmethod
+    def _current_stock(conn, product_key: str, base_stock: float, cutoff: float) -> float:
+        last = MovementJournal._last_applied(conn, product_key, cutoff)
+        row = conn.execute(
+            "SELECT COALESCE(SUM(delta), 0) AS total FROM movement_journal "
+            "WHERE product_id = ? AND status IN (?, ?)",
+            (product_key, STATUS_PENDING, STATUS_FLUSHING)
+        ).fetchone()
+        return (_to_float(base_stock) if last is None else last) + float(row['total'] or 0)
+
+    @staticmethod
+    def current_stock(product_id: str, base_stock: float) -> float:
+        """
+        Stock que ya se confirmó al usuario: el del snapshot (o el del último
+        movimiento aplicado, si el snapshot puede no incluirlo) más los
+        movimientos que aún no se reflejan en Google Sheets
+        """
+        return MovementJournal._current_stock(
+            MovementJournal._conn(), normalize_id(product_id), base_stock, MovementJournal._snapshot_cutoff()
+        )
+
+    @staticmethod
+    def overlay(product: dict) -> dict:
+        """
+        Copia del producto con el stock incluyendo los movimientos pendientes,
+        para mostrar al usuario el valor que ya confirmó
+        """
+        headers = list(product.keys())
+        id_col = find_id_column(headers)
+        if id_col is None:
+            return product
+        result = dict(product)
+        for key in headers:
+            if str(key).strip().lower() in ('cantidad', 'stock'):
+                current = MovementJournal.current_stock(product[headers[id_col]], result[key])
+                if current != _to_float(result[key]):
+                    result[key] = current
+                break
+        return result
+
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        """Cantidad de movimientos por estado"""
+        rows = MovementJournal._conn().execute(
+            "SELECT status, COUNT(*) AS total FROM movement_journal GROUP BY status"
+        ).fetchall()
+        return {row['status']: int(row['total']) for row in rows}
+
+    # ------------------------------------------------------------------
+    # Aplicación por lotes
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _claim(limit: int):
+        """
+        Reservar un lote. Primero se recupera un lote abandonado (lease vencido);
+        si no hay, se toman movimientos pendientes de productos sin lote en vuelo.
+
+        Returns:
+            (batch_id, entries, recovering)
+        """
+        MovementJournal._conn()
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        with local_store.transaction() as conn:
+            stale = conn.execute(
+                "SELECT batch_id FROM movement_journal WHERE status = ? AND claimed_at < ? "
+                "ORDER BY seq LIMIT 1",
+                (STATUS_FLUSHING, now - Config.MOVEMENT_JOURNAL_LEASE_SECONDS)
+            ).fetchone()
+            if stale:
+                conn.execute(
+                    "UPDATE movement_journal SET batch_id = ?, claimed_at = ?, attempts = attempts + 1 "
+                    "WHERE batch_id = ? AND status = ?",
+                    (batch_id, now, stale['batch_id'], STATUS_FLUSHING)
+                )
+                recovering = True
+            else:
+                seqs = [row['seq'] for row in conn.execute(
+                    "SELECT seq FROM movement_journal WHERE status = ? AND product_id NOT IN "
+                    "(SELECT product_id FROM movement_journal WHERE status = ?) ORDER BY seq LIMIT ?",
+                    (STATUS_PENDING, STATUS_FLUSHING, limit)
+                ).fetchall()]
+                if not seqs:
+                    return batch_id, [], False
+                conn.executemany(
+                    "UPDATE movement_journal SET status = ?, batch_id = ?, claimed_at = ?, "
+                    "attempts = attempts + 1 WHERE seq = ?",
+                    [(STATUS_FLUSHING, batch_id, now, seq) for seq in seqs]
+                )
+                recovering = False
+            entries = [dict(row) for row in conn.execute(
+                "SELECT * FROM movement_journal WHERE batch_id = ? ORDER BY seq", (batch_id,)
+            ).fetchall()]
+        for entry in entries:
+            entry['fields'] = json.loads(entry['fields'] or '{}')
+            entry['history'] = json.loads(entry['history']) if entry['history'] else None
+        return batch_id, entries, recovering
+
+    @staticmethod
+    def _set_status(seqs: List[int], status: str, error: str = None):
+        if not seqs:
+            return
+        applied_at = time.time() if status == STATUS_APPLIED else None
+        with local_store.transaction() as conn:
+            conn.executemany(
+                "UPDATE movement_journal SET status = ?, last_error = ?, applied_at = ? WHERE seq = ?",
+                [(status, error, applied_at, seq) for seq in seqs]
+            )
+
+    @staticmethod
+    def _release(batch_id: str, error: str):
+        """
+        Devolver un lote fallido. Si ya tenía stock calculado (pudo escribirse
+        en parte) se deja en vuelo con lease vencido para que se recupere con
+        valores absolutos; si no, vuelve a pendiente. Tras
+        MOVEMENT_JOURNAL_MAX_ATTEMPTS intentos los movimientos quedan fallidos.
+        """
+        with local_store.transaction() as conn:
+            exhausted = [row['seq'] for row in conn.execute(
+                "SELECT seq FROM movement_journal WHERE batch_id = ? AND status = ? AND attempts >= ?",
+                (batch_id, STATUS_FLUSHING, Config.MOVEMENT_JOURNAL_MAX_ATTEMPTS)
+            ).fetchall()]
+            conn.executemany(
+                "UPDATE movement_journal SET status = ?, last_error = ? WHERE seq = ?",
+                [(STATUS_FAILED, error, seq) for seq in exhausted]
+            )
+            conn.execute(
+                "UPDATE movement_journal SET status = ?, batch_id = NULL, claimed_at = NULL, last_error = ? "
+                "WHERE batch_id = ? AND status = ? AND stock_after IS NULL",
+                (STATUS_PENDING, error, batch_id, STATUS_FLUSHING)
+            )
+            conn.execute(
+                "UPDATE movement_journal SET claimed_at = 0, last_error = ? WHERE batch_id = ? AND status = ?",
+                (error, batch_id, STATUS_FLUSHING)
+            )
+        if exhausted:
+            print(f"⚠️ Movimientos marcados como fallidos tras {Config.MOVEMENT_JOURNAL_MAX_ATTEMPTS} intentos (seq): {exhausted}")
+
+    @staticmethod
+    def _prepare(entries: List[dict], inventory: List[dict]) -> List[dict]:
+        """
+        Calcular el stock resultante de cada movimiento (en orden de secuencia)
+        a partir del inventario recién leído y persistirlo antes de escribir.
+        Si un lote anterior del producto se aplicó hace menos de
+        MOVEMENT_JOURNAL_EXPORT_LAG_SECONDS, el export puede no incluirlo y se
+        parte del stock que dejó ese lote.
+
+        Returns:
+            Movimientos cuyo producto no existe en el inventario
+        """
+        products = {}
+        for product in inventory:
+            headers = list(product.keys())
+            id_col = find_id_column(headers)
+            if id_col is not None:
+                products[normalize_id(product[headers[id_col]])] = product
+
+        stock = {}
+        missing = []
+        conn = MovementJournal._conn()
+        cutoff = MovementJournal._snapshot_cutoff()
+        for entry in entries:
+            product = products.get(entry['product_id'])
+            if product is None:
+                missing.append(entry)
+                continue
+            if entry['product_id'] not in stock:
+                base = MovementJournal._last_applied(conn, entry['product_id'], cutoff)
+                if base is None:
+                    for key, value in product.items():
+                        if str(key).strip().lower() == str(entry['stock_field']).strip().lower():
+                            base = _to_float(value)
+                            break
+                stock[entry['product_id']] = base or 0.0
+            stock[entry['product_id']] += entry['delta']
+            entry['stock_after'] = stock[entry['product_id']]
+
+        with local_store.transaction() as conn:
+            conn.executemany(
+                "UPDATE movement_journal SET stock_after = ? WHERE seq = ?",
+                [(entry['stock_after'], entry['seq']) for entry in entries if entry.get('stock_after') is not None]
+            )
+        return missing
+
+    @staticmethod
+    def _read_inventory() -> List[dict]:
+        """
+        Leer el inventario para calcular el stock del lote. A diferencia de
+        get_inventory_data, un error de descarga o una hoja vacía se propagan:
+        el lote vuelve a pendiente en lugar de marcar sus movimientos como fallidos.
+        """
+        from app.services.inventory_snapshot import InventorySnapshot
+        from app.services.sheets_service import SheetsService
+
+        df = SheetsService.read_google_sheet()
+        if df.empty:
+            raise Exception('El inventario leído está vacío')
+        InventorySnapshot.publish(df)
+        return df.astype(object).where(df.notna(), None).to_dict('records')
+
+    @staticmethod
+    def _history_rows(entries: List[dict]) -> List[dict]:
+        rows = []
+        for entry in entries:
+            if not entry['history']:
+                continue
+            data = dict(entry['history'])
+            data['cantidad'] = entry['stock_after']
+            data['FechaMovimiento'] = entry['created_at']
+            data['Usuario'] = entry['username']
+            rows.append(data)
+        return rows
+
+    @staticmethod
+    def _already_in_history(rows: List[dict]) -> List[dict]:
+        """Filtrar las filas que ya se agregaron al histórico (recuperación)"""
+        from app.services.sheets_service import SheetsService
+
+        df = SheetsService.read_google_sheet(Config.HISTORY_SHEET_URL)
+        columns = {str(c).strip().lower(): c for c in df.columns}
+
+        def key_of(codigo, fecha, usuario, unidades):
+            return (str(codigo).strip(), str(fecha).strip(), str(usuario).strip(), round(_to_float(unidades), 6))
+
+        existing = set()
+        names = ['codigo', 'fechamovimiento', 'usuario', 'unidadesutilizadas']
+        if all(name in columns for name in names):
+            for values in df[[columns[name] for name in names]].itertuples(index=False):
+                existing.add(key_of(*values))
+        return [
+            row for row in rows
+            if key_of(row.get('Codigo', ''), row['FechaMovimiento'], row['Usuario'], row.get('UnidadesUtilizadas')) not in existing
+        ]
+
+    @staticmethod
+    def flush(limit: int = None) -> int:
+        """
+        Aplicar un lote de movimientos a Google Sheets
+
+        Returns:
+            Cantidad de movimientos aplicados
+        """
+        from app.services.sheets_writer import SheetsWriter
+
+        with MovementJournal._flush_lock:
+            batch_id, entries, recovering = MovementJournal._claim(limit or Config.MOVEMENT_JOURNAL_BATCH_SIZE)
+            if not entries:
+                return 0
+            try:
+                # Un lote recuperado que ya tenía stock calculado se reaplica con esos
+                # valores absolutos; recalcularlo sobre la hoja duplicaría los ajustes
+                if recovering and any(entry['stock_after'] is not None for entry in entries):
+                    missing = [entry for entry in entries if entry['stock_after'] is None]
+                else:
+                    missing = MovementJournal._prepare(entries, MovementJournal._read_inventory())
+                missing_seqs = {entry['seq'] for entry in missing}
+                ready = [entry for entry in entries if entry['seq'] not in missing_seqs]
+
+                # Estado final de cada fila: último stock + campos editados en orden
+                updates = {}
+                for entry in ready:
+                    row = updates.setdefault(entry['product_id'], {})
+                    row.update(entry['fields'])
+                    row[entry['stock_field']] = entry['stock_after']
+                written = set(normalize_id(pid) for pid in SheetsWriter.batch_update_products(updates))
+
+                applied = [entry for entry in ready if entry['product_id'] in written]
+                history = MovementJournal._history_rows(applied)
+                if recovering and history:
+                    history = MovementJournal._already_in_history(history)
+                if history and not SheetsWriter.append_rows_to_history(history):
+                    raise Exception('Error al agregar los movimientos al histórico')
+
+                applied_seqs = [entry['seq'] for entry in applied]
+                failed = sorted({entry['seq'] for entry in entries} - set(applied_seqs))
+                MovementJournal._set_status(applied_seqs, STATUS_APPLIED)
+                # La vista de escaneo suma los pendientes al stock de la hoja: ya aplicados,
+                # su stock pasa a ser el de la hoja
+                from app.services.product_lookup import product_lookup
+                for entry in applied:
+                    product_lookup.record_stock(entry['product_id'], entry['stock_after'])
+                MovementJournal._set_status(failed, STATUS_FAILED, 'Producto no encontrado en el inventario')
+                if failed:
+                    print(f"⚠️ Movimientos sin producto en el inventario (seq): {failed}")
+                return len(applied)
+            except Exception as e:
+                print(f"Error al aplicar movimientos del diario: {e}")
+                import traceback
+                traceback.print_exc()
+                MovementJournal._release(batch_id, str(e))
+                return 0
+
+    @staticmethod
+    def flush_all() -> int:
+        """Aplicar todos los movimientos pendientes (lote tras lote)"""
+        total = 0
+        while True:
+            applied = MovementJournal.flush()
+            if not applied:
+                return total
+            total += applied
+
+    # ------------------------------------------------------------------
+    # Hilo en segundo plano
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _run_flusher():
+        while True:
+            MovementJournal._wakeup.wait(Config.MOVEMENT_JOURNAL_FLUSH_SECONDS)
+            MovementJournal._wakeup.clear()
+            try:
+                MovementJournal.flush_all()
+            except Exception as e:
+                print(f"Error en el hilo del diario de movimientos: {e}")
+
+    @staticmethod
+    def start_background_flusher():
+        """
+        Iniciar (una vez por proceso) el hilo que aplica los movimientos
+        pendientes, incluidos los que quedaron de una ejecución anterior
+        """
+        if MovementJournal._flusher is not None and MovementJournal._flusher.is_alive():
+            return
+        MovementJournal._conn()
+        MovementJournal._flusher = threading.Thread(
+            target=MovementJournal._run_flusher, name='movement-journal-flusher', daemon=True
+        )
+        MovementJournal._flusher.start()
+        atexit.register(MovementJournal.flush_all)
@@ -0,0 +1,273 @@
+"""
+Planificación de mantenimiento preventivo a partir de los activos.
+
+Para cada activo con frecuencia_dias se calcula la próxima fecha
+(ultima_fecha + frecuencia_dias, o proxima_fecha si no hay última) y se
+generan las ocurrencias PROGRAMADO dentro del horizonte. Todo el cálculo es
+vectorizado sobre la hoja completa; los mantenimientos nuevos se agregan con
+un único append y las fechas de los activos con un único batchUpdate.
+
+La generación es idempotente: no se crea un mantenimiento si ya existe otro
+(en cualquier estado) con el mismo id_activo y fecha_programada.
+"""
+from datetime import datetime, date
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from app.services.maintenance_kpis import MaintenanceKpiStore
+from app.services.maintenance_service import MaintenanceService
+from app.services.sequence_allocator import SequenceAllocator
+from app.services.sheet_frames import columns_map, parse_sheet_dates
+from app.services.sheets_writer import get_sheet_id_from_url
+
+
+MTTO_ID_SEQUENCE = 'cmms:id_mtto'
+DEFAULT_MTTO_PREFIX = 'MT-'
+DATE_FORMAT = '%Y-%m-%d'
+
+# Columnas del activo que se copian al mantenimiento si ambas hojas las tienen
+INHERITED_FIELDS = ['id_maquina', 'actividad', 'tecnico']
+
+
+def _frequency_status(activos: pd.DataFrame, freq_col: str, ids: pd.Series):
+    """
+    Frecuencia numérica de cada activo y máscaras de válidas (entero >= 1) e
+    inválidas (valor cargado que no es un número entero de días >= 1). Una
+    frecuencia vacía no es un error: el activo no se planifica.
+    """
+    raw = activos[freq_col].astype(str).str.strip()
+    freq = pd.to_numeric(raw, errors='coerce')
+    has_id = ids.ne('') & ids.ne('nan')
+    whole = freq.notna() & (freq >= 1) & np.isfinite(freq) & freq.eq(freq.round())
+    filled = raw.ne('') & raw.str.lower().ne('nan')
+    return freq, has_id & whole, has_id & filled & ~whole
+
+
+class PreventivePlanner:
+    """
+    Motor de programación preventiva
+    """
+
+    @staticmethod
+    def invalid_frequencies(activos: pd.DataFrame) -> List[Dict]:
+        """Activos con frecuencia_dias que no es un número entero de días >= 1"""
+        if activos is None or activos.empty:
+            return []
+        cols = columns_map(activos)
+        id_col = cols.get('id_activo') or cols.get('id')
+        freq_col = cols.get('frecuencia_dias')
+        if not id_col or not freq_col:
+            return []
+        ids = activos[id_col].astype(str).str.strip()
+        _, _, invalid = _frequency_status(activos, freq_col, ids)
+        return [
+            {'fila': int(index) + 2, 'id_activo': ids[index], 'frecuencia_dias': str(activos.at[index, freq_col]).strip()}
+            for index in activos.index[invalid.values]
+        ]
+
+    @staticmethod
+    def compute_due_dates(activos: pd.DataFrame, today: Optional[date] = None) -> pd.DataFrame:
+        """
+        Próxima fecha de cada activo planificable (frecuencia_dias entera >= 1;
+        las demás se informan con invalid_frequencies).
+
+        Returns:
+            DataFrame con row (fila de la hoja), id_activo, frecuencia_dias,
+            proxima (datetime64) y proxima_actual (valor que tenía la hoja)
+        """
+        empty = pd.DataFrame(columns=['row', 'id_activo', 'frecuencia_dias', 'proxima', 'proxima_actual'])
+        if activos is None or activos.empty:
+            return empty
+        cols = columns_map(activos)
+        id_col = cols.get('id_activo') or cols.get('id')
+        freq_col = cols.get('frecuencia_dias')
+        if not id_col or not freq_col:
+            return empty
+
+        today_ts = pd.Timestamp(today or date.today())
+        ids = activos[id_col].astype(str).str.strip()
+        freq, valid, _ = _frequency_status(activos, freq_col, ids)
+        ultima = parse_sheet_dates(activos[cols['ultima_fecha']]) if 'ultima_fecha' in cols else pd.Series(pd.NaT, index=activos.index)
+        proxima_actual = parse_sheet_dates(activos[cols['proxima_fecha']]) if 'proxima_fecha' in cols else pd.Series(pd.NaT, index=activos.index)
+
+        # ultima + frecuencia; sin última fecha se respeta la próxima cargada a mano; sin ninguna, hoy
+        proxima = ultima + pd.to_timedelta(freq, unit='D')
+        proxima = proxima.fillna(proxima_actual).fillna(today_ts)
+
+        result = pd.DataFrame({
+            'row': activos.index + 2,
+            'id_activo': ids,
+            'frecuencia_dias': freq,
+            'proxima': proxima,
+            'proxima_actual': proxima_actual,
+        })
+        return result[valid.values].reset_index(drop=True)
+
+    @staticmethod
+    def expand_occurrences(due: pd.DataFrame, horizon_days: int, today: Optional[date] = None) -> pd.DataFrame:
+        """
+        Ocurrencias de cada activo desde su próxima fecha hasta hoy + horizonte,
+        siempre sobre la grilla proxima + k * frecuencia (así dos corridas en
+        días distintos producen las mismas fechas). De un activo vencido solo
+        se genera la última fecha incumplida.
+        """
+        if due.empty:
+            return pd.DataFrame(columns=['id_activo', 'fecha_programada'])
+        today_d = np.datetime64(pd.Timestamp(today or date.today()).date(), 'D')
+        end = today_d + np.timedelta64(int(horizon_days), 'D')
+
+        proxima = due['proxima'].to_numpy('datetime64[D]')
+        freq = np.rint(due['frecuencia_dias'].to_numpy(dtype='float64')).astype('int64')
+        overdue_steps = np.maximum((today_d - proxima).astype('int64') // freq, 0)
+        start = proxima + (overdue_steps * freq).astype('timedelta64[D]')
+        span = (end - start).astype('int64')
+        counts = np.where(span >= 0, span // freq + 1, 0)
+
+        total = int(counts.sum())
+        if total == 0:
+            return pd.DataFrame(columns=['id_activo', 'fecha_programada'])
+        owner = np.repeat(np.arange(len(due)), counts)
+        # k-ésima ocurrencia de cada activo: posición global menos el inicio de su bloque
+        k = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        fechas = start[owner] + (k * freq[owner]).astype('timedelta64[D]')
+        return pd.DataFrame({
+            'source': owner,
+            'id_activo': due['id_activo'].to_numpy()[owner],
+            'fecha_programada': pd.to_datetime(fechas).strftime(DATE_FORMAT),
+        })
+
+    @staticmethod
+    def _existing_keys(mttos: pd.DataFrame) -> pd.DataFrame:
+        if mttos is None or mttos.empty:
+            return pd.DataFrame(columns=['id_activo', 'fecha_programada'])
+        cols = columns_map(mttos)
+        if 'id_activo' not in cols or 'fecha_programada' not in cols:
+            return pd.DataFrame(columns=['id_activo', 'fecha_programada'])
+        fechas = parse_sheet_dates(mttos[cols['fecha_programada']])
+        keys = pd.DataFrame({
+            'id_activo': mttos[cols['id_activo']].astype(str).str.strip(),
+            'fecha_programada': fechas.dt.strftime(DATE_FORMAT),
+        })
+        return keys.dropna().drop_duplicates()
+
+    @staticmethod
+    def _allocate_ids(mttos: pd.DataFrame, count: int):
+        """IDs nuevos de mantenimiento: continúan el mayor consecutivo de la hoja"""
+        prefix = DEFAULT_MTTO_PREFIX
+        width = 0
+        cols = columns_map(mttos) if mttos is not None else {}
+        id_col = cols.get('id_mtto') or cols.get('id')
+        if id_col is not None and not mttos.empty:
+            parts = mttos[id_col].dropna().astype(str).str.strip().str.extract(r'^(.*?)(\d+)$').dropna()
+            if not parts.empty:
+                numbers = pd.to_numeric(parts[1])
+                SequenceAllocator.raise_to(MTTO_ID_SEQUENCE, int(numbers.max()))
+                prefix = parts[0].mode().iat[0]
+                width = int(parts[1].str.len().max())
+        first = SequenceAllocator.allocate(MTTO_ID_SEQUENCE, count)
+        return [f"{prefix}{str(n).zfill(width)}" for n in range(first, first + count)]
+
+    @staticmethod
+    def plan(horizon_days: Optional[int] = None, today: Optional[date] = None,
+             dry_run: bool = False, update_activos: bool = True) -> Dict:
+        """
+        Generar los mantenimientos preventivos del horizonte.
+
+        Args:
+            horizon_days: Días hacia adelante (default MAINTENANCE_PLANNING_HORIZON_DAYS)
+            today: Fecha de referencia (default hoy)
+            dry_run: Solo calcular, sin escribir en las hojas
+            update_activos: Escribir proxima_fecha calculada en la hoja de activos
+
+        Returns:
+            Resumen con activos planificados, ocurrencias, creados, omitidos y las filas nuevas
+        """
+        horizon_days = Config.MAINTENANCE_PLANNING_HORIZON_DAYS if horizon_days is None else int(horizon_days)
+        activos = MaintenanceService._read_df('activos')
+        mttos = MaintenanceService._read_df('mantenimientos')
+
+        due = PreventivePlanner.compute_due_dates(activos, today)
+        occurrences = PreventivePlanner.expand_occurrences(due, horizon_days, today)
+
+        # Anti-join contra lo ya programado (idempotencia por id_activo + fecha)
+        existing = PreventivePlanner._existing_keys(mttos)
+        merged = occurrences.merge(existing, on=['id_activo', 'fecha_programada'], how='left', indicator=True)
+        new = merged[merged['_merge'] == 'left_only'].drop(columns='_merge').reset_index(drop=True)
+
+        summary = {
+            'activos': int(len(due)),
+            'ocurrencias': int(len(occurrences)),
+            'existentes': int(len(occurrences) - len(new)),
+            'creados': 0,
+            'activos_actualizados': 0,
+            'frecuencia_invalida': PreventivePlanner.invalid_frequencies(activos),
+            'filas': [],
+        }
+        if summary['frecuencia_invalida']:
+            print(f"⚠️ Activos con frecuencia_dias inválida (se omiten): {summary['frecuencia_invalida']}")
+        if new.empty and not update_activos:
+            return summary
+
+        rows = []
+        if not new.empty:
+            headers = MaintenanceService._get_sheet_headers('mantenimientos')
+            if not headers:
+                raise ValueError('La hoja de mantenimientos no tiene encabezados.')
+            act_cols = columns_map(activos)
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            ids = ['(nuevo)'] * len(new) if dry_run else PreventivePlanner._allocate_ids(mttos, len(new))
+            source_rows = due['row'].to_numpy()[new['source'].to_numpy()] - 2
+
+            base = {
+                'id_mtto': pd.Series(ids),
+                'id_activo': new['id_activo'],
+                'fecha_programada': new['fecha_programada'],
+                'tipo_mtto': 'PREVENTIVO',
+                'estado': 'PROGRAMADO',
+                'observaciones': 'Generado por planificación preventiva',
+                'fecha_creacion': now,
+                'fecha_actualizacion': now,
+            }
+            for field in INHERITED_FIELDS:
+                if field in act_cols:
+                    values = activos[act_cols[field]].to_numpy()[source_rows]
+                    base[field] = pd.Series(values).fillna('').astype(str)
+            table = pd.DataFrame(base)
+            table = table.reindex(columns=[str(h).strip().lower() for h in headers]).fillna('')
+            rows = table.astype(str).values.tolist()
+            summary['filas'] = rows
+
+        if dry_run:
+            summary['creados'] = len(rows)
+            return summary
+
+        if rows:
+            service = MaintenanceService._get_sheet_service()
+            service.spreadsheets().values().append(
+                spreadsheetId=get_sheet_id_from_url(MaintenanceService.sheet_urls()['mantenimientos']),
+                range='A:ZZ',
+                valueInputOption='RAW',
+                insertDataOption='INSERT_ROWS',
+                body={'values': rows},
+            ).execute()
+            MaintenanceService._adjust_row_count('mantenimientos', len(rows))
+            MaintenanceKpiStore.record_created('mantenimientos', estados=['PROGRAMADO'] * len(rows))
+            summary['creados'] = len(rows)
+
+        if update_activos and not due.empty and 'proxima_fecha' in columns_map(activos):
+            changed = due[due['proxima'].ne(due['proxima_actual'])]
+            if not changed.empty:
+                act_id_col = MaintenanceService._id_column(activos, "activos")
+                proxima_col = columns_map(activos)['proxima_fecha']
+                updates = {
+                    rid: {proxima_col: fecha}
+                    for rid, fecha in zip(changed['id_activo'], changed['proxima'].dt.strftime(DATE_FORMAT))
+                }
+                positions = dict(zip(changed['id_activo'], changed['row']))
+                summary['activos_actualizados'] = MaintenanceService._apply_cell_updates(
+                    'activos', activos, act_id_col, positions, updates
+                )
+        return summary
@@ -0,0 +1,277 @@
+"""
+Importación masiva de productos desde CSV o XLSX.
+
+El archivo se valida completo contra los encabezados del inventario antes de
+escribir: si alguna fila tiene errores no se crea ningún producto. Los IDs y
+los consecutivos de Codigo se reservan en bloque (una reserva por
+secuencia), las filas se agregan con un único values.append y los QR se
+encolan para generarse en segundo plano.
+"""
+import io
+import re
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from config import Config
+from app.services.inventory_snapshot import InventorySnapshot
+from app.services.qr_queue import QRQueue
+from app.services.search_index import fold
+from app.services.sequence_allocator import SequenceAllocator, PRODUCT_ID_SEQUENCE, codigo_sequence
+from app.services.sheets_service import SheetsService
+from app.services.sheets_writer import SheetsWriter
+
+
+ABBREVIATION_RE = re.compile(r'^[A-Z]+$')
+FULL_CODE_RE = re.compile(r'^([A-Z]+)-(\d+)$')
+NUMERIC_FIELDS = ('cantidad', 'stock-min')
+DESCRIPTIVE_FIELDS = ('referencia', 'descripcion')
+
+
+class ProductImporter:
+    """
+    Lectura, validación y alta en bloque de productos
+    """
+
+    @staticmethod
+    def read_upload(filename: str, content: bytes) -> pd.DataFrame:
+        """
+        Archivo subido (CSV o XLSX) a DataFrame de texto
+
+        Raises:
+            ValueError: Formato no soportado, archivo vacío o ilegible
+        """
+        name = (filename or '').lower()
+        try:
+            if name.endswith('.xlsx'):
+                df = ProductImporter._read_xlsx(content)
+            elif name.endswith('.csv'):
+                try:
+                    text = content.decode('utf-8-sig')
+                except UnicodeDecodeError:
+                    text = content.decode('latin-1')
+                # Separador detectado (coma o punto y coma, según la configuración regional de Excel)
+                df = pd.read_csv(io.StringIO(text), dtype=str, sep=None, engine='python')
+            else:
+                raise ValueError('Formato no soportado. Use un archivo .csv o .xlsx.')
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f'No se pudo leer el archivo: {e}')
+        df.columns = [str(c).strip() for c in df.columns]
+        df = df.fillna('').astype(str).apply(lambda col: col.str.strip())
+        df = df[df.ne('').any(axis=1)].reset_index(drop=True)
+        if df.empty:
+            raise ValueError('El archivo no tiene filas con datos.')
+        return df
+
+    @staticmethod
+    def _read_xlsx(content: bytes) -> pd.DataFrame:
+        """Primera hoja del libro con openpyxl (solo lectura, valores calculados)"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if not header:
+                raise ValueError('El archivo no tiene encabezados.')
+
+            def text(value):
+                if value is None:
+                    return ''
+                if isinstance(value, float) and value.is_integer():
+                    return str(int(value))
+                return str(value)
+
+            columns = [text(h) for h in header]
+            return pd.DataFrame([[text(v) for v in row[:len(columns)]] for row in rows], columns=columns)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _inventory_codes(inventory: Optional[pd.DataFrame]) -> set:
+        if inventory is None:
+            return set()
+        cols = {str(c).strip().lower(): c for c in inventory.columns}
+        code_col = cols.get('codigo') or cols.get('código')
+        if code_col is None:
+            return set()
+        return set(inventory[code_col].dropna().astype(str).str.strip().str.upper())
+
+    @staticmethod
+    def validate(df: pd.DataFrame, headers: List[str], abbreviations: List[str],
+                 units: List[str], existing_codes: set) -> Dict:
+        """
+        Validar el archivo contra el esquema del inventario
+
+        Args:
+            df: Filas del archivo (texto)
+            headers: Encabezados de la hoja de inventario
+            abbreviations: Abreviaturas de Codigo permitidas (ej. RMEC)
+            units: Unidades de medida permitidas
+            existing_codes: Codigos ya presentes en el inventario (en mayúsculas)
+
+        Returns:
+            {'productos': [...], 'errores': [{'fila', 'errores'}], 'advertencias': [...]}
+            Cada producto trae sus campos con el nombre del encabezado del
+            inventario; Codigo puede ser solo la abreviatura (se asigna luego).
+        """
+        header_by_fold = {fold(h): h for h in headers}
+        id_header = next((h for h in headers if h.strip().lower() == 'id'), None)
+        mapping, unknown, ignored = {}, [], []
+        for column in df.columns:
+            header = header_by_fold.get(fold(column))
+            if header is None:
+                unknown.append(column)
+            elif header == id_header:
+                ignored.append(column)
+            else:
+                mapping[column] = header
+
+        result = {'productos': [], 'errores': [], 'advertencias': []}
+        if unknown:
+            result['errores'].append({'fila': None, 'errores': [
+                f"Columnas que no existen en el inventario: {', '.join(unknown)}"
+            ]})
+            return result
+        if ignored:
+            result['advertencias'].append('La columna ID se ignora: los IDs se asignan automáticamente.')
+        if len(df.index) > Config.PRODUCT_IMPORT_MAX_ROWS:
+            result['errores'].append({'fila': None, 'errores': [
+                f'El archivo tiene {len(df.index)} filas; el máximo es {Config.PRODUCT_IMPORT_MAX_ROWS}.'
+            ]})
+            return result
+
+        by_lower = {fold(h).strip(): h for h in mapping.values()}
+        code_header = by_lower.get('codigo')
+        unit_header = next((h for k, h in by_lower.items() if k.startswith('unidad')), None)
+        allowed_abbr = {a.upper() for a in abbreviations}
+        allowed_units = {fold(u): u for u in units}
+        seen_codes = set()
+
+        for position, raw in enumerate(df.to_dict('records')):
+            product = {mapping[c]: v for c, v in raw.items() if c in mapping}
+            errors = []
+
+            codigo = product.get(code_header, '').upper() if code_header else ''
+            full = FULL_CODE_RE.match(codigo)
+            if not codigo:
+                errors.append('Codigo vacío (use la abreviatura, ej. RMEC, o un código completo, ej. RMEC-12).')
+            elif ABBREVIATION_RE.match(codigo):
+                if codigo not in allowed_abbr:
+                    errors.append(f"Abreviatura de Codigo no permitida: {codigo}.")
+            elif full:
+                if full.group(1) not in allowed_abbr:
+                    errors.append(f"Abreviatura de Codigo no permitida: {full.group(1)}.")
+                elif codigo in existing_codes:
+                    errors.append(f"El Codigo {codigo} ya existe en el inventario.")
+                elif codigo in seen_codes:
+                    errors.append(f"El Codigo {codigo} está repetido en el archivo.")
+                seen_codes.add(codigo)
+            else:
+                errors.append(f"Codigo con formato inválido: {codigo}.")
+            if code_header:
+                product[code_header] = codigo
+
+            if not any(product.get(by_lower[f]) for f in DESCRIPTIVE_FIELDS if f in by_lower):
+                errors.append('Falta Referencia o Descripcion.')
+
+            for field in NUMERIC_FIELDS:
+                header = by_lower.get(field)
+                value = product.get(header, '') if header else ''
+                if value:
+                    try:
+                        number = float(value.replace(',', '.'))
+                    except ValueError:
+                        number = None
+                    if number is None or number < 0:
+                        errors.append(f"{header} debe ser un número mayor o igual a 0.")
+            if by_lower.get('cantidad') and not product.get(by_lower['cantidad']):
+                product[by_lower['cantidad']] = '0'
+
+            if unit_header and product.get(unit_header):
+                unit = allowed_units.get(fold(product[unit_header]))
+                if unit is None:
+                    errors.append(f"Unidad de medida no permitida: {product[unit_header]}.")
+                else:
+                    product[unit_header] = unit
+
+            if errors:
+                # Fila del archivo: encabezado = 1
+                result['errores'].append({'fila': position + 2, 'errores': errors})
+            else:
+                result['productos'].append(product)
+        return result
+
+    @staticmethod
+    def _assign_codes(products: List[Dict], code_header: str) -> None:
+        """Reservar un bloque de consecutivos por abreviatura y completar los Codigo"""
+        # Los códigos completos del archivo elevan la secuencia para no volver a entregarlos
+        for product in products:
+            full = FULL_CODE_RE.match(product[code_header])
+            if full:
+                SequenceAllocator.raise_to(codigo_sequence(full.group(1)), int(full.group(2)))
+        pending: Dict[str, List[Dict]] = {}
+        for product in products:
+            if ABBREVIATION_RE.match(product[code_header]):
+                pending.setdefault(product[code_header], []).append(product)
+        for abbreviation, group in pending.items():
+            first = SequenceAllocator.allocate(codigo_sequence(abbreviation), len(group))
+            for offset, product in enumerate(group):
+                product[code_header] = f'{abbreviation}-{first + offset}'
+
+    @staticmethod
+    def import_products(df: pd.DataFrame, abbreviations: List[str], units: List[str],
+                        base_url: str = None, dry_run: bool = False) -> Dict:
+        """
+        Validar y crear los productos del archivo
+
+        Args:
+            df: Filas leídas con read_upload()
+            abbreviations: Abreviaturas de Codigo permitidas
+            units: Unidades de medida permitidas
+            base_url: URL de la aplicación para los QR
+            dry_run: Solo validar, sin reservar números ni escribir
+
+        Returns:
+            Resumen: filas, validas, errores, advertencias, creados, productos
+            (ID y Codigo asignados) y qr_encolados
+        """
+        SheetsService.get_inventory_data()
+        inventory = InventorySnapshot.latest()
+        headers = [str(c).strip() for c in inventory.columns] if inventory is not None else []
+        if not headers:
+            raise ValueError('No se pudieron leer los encabezados del inventario.')
+
+        checked = ProductImporter.validate(
+            df, headers, abbreviations, units, ProductImporter._inventory_codes(inventory)
+        )
+        products = checked['productos']
+        summary = {
+            'filas': int(len(df.index)),
+            'validas': len(products),
+            'errores': checked['errores'],
+            'advertencias': checked['advertencias'],
+            'creados': 0,
+            'productos': [],
+            'qr_encolados': 0,
+        }
+        if checked['errores'] or dry_run or not products:
+            return summary
+
+        code_header = next(h for h in headers if h.strip().lower() in ('codigo', 'código'))
+        id_header = next((h for h in headers if h.strip().lower() == 'id'), 'ID')
+        first_id = SequenceAllocator.allocate(PRODUCT_ID_SEQUENCE, len(products))
+        for offset, product in enumerate(products):
+            product[id_header] = str(first_id + offset)
+        ProductImporter._assign_codes(products, code_header)
+
+        SheetsWriter.append_products_to_inventory(products)
+        summary['creados'] = len(products)
+        summary['productos'] = [{'ID': p[id_header], 'Codigo': p[code_header]} for p in products]
+        summary['qr_encolados'] = QRQueue.enqueue(
+            [(p[id_header], p[code_header]) for p in products], base_url=base_url
+        )
+        print(f"✓ Importación: {len(products)} productos creados (IDs {first_id}-{first_id + len(products) - 1})")
+        return summary
@@ -0,0 +1,122 @@
+"""
+Fichas compactas de producto para la vista de escaneo.
+
+Con cada snapshot del inventario se guardan solo los campos que muestra un
+escaneo (Codigo, Referencia, stock, Ubicación, Stock-min, unidad), indexados
+por ID, Codigo y Referencia, así que resolver un QR no descarga ni recorre
+el inventario. Los movimientos registrados en este worker actualizan el
+stock de inmediato.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+import pandas as pd
+
+from app.services.inventory_index import find_id_column, normalize_id
+from app.services.inventory_snapshot import InventorySnapshot
+
+
+SCAN_FIELDS = {
+    'Codigo': ['codigo', 'código'],
+    'Referencia': ['referencia'],
+    'Descripcion': ['descripcion', 'descripción'],
+    'cantidad': ['cantidad', 'stock'],
+    'Unidad-medida': ['unidad-medida', 'unidad medida'],
+    'Ubicación': ['ubicación', 'ubicacion'],
+    'Stock-min': ['stock-min', 'stock min', 'stock_min'],
+}
+NUMERIC_FIELDS = ('cantidad', 'Stock-min')
+
+
+def compact_number(value):
+    """10.0 -> 10 para mostrar cantidades enteras sin decimales"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def record_etag(record: Dict) -> str:
+    """Validador del contenido de una ficha"""
+    raw = json.dumps(record, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+class ProductLookup:
+    """
+    ID / Codigo / Referencia -> ficha compacta del producto
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict] = {}
+        self._aliases: Dict[str, str] = {}
+        self._built_at: Optional[float] = None
+        # Último intento de actualización (exitoso o no): marca la antigüedad del snapshot
+        self._checked_at: Optional[float] = None
+
+    def build_from_dataframe(self, df: pd.DataFrame) -> None:
+        """Listener de InventorySnapshot"""
+        if df is None:
+            return
+        cols = {str(c).strip().lower(): c for c in df.columns}
+        id_idx = find_id_column([str(c) for c in df.columns])
+        if id_idx is None:
+            return
+        frame = pd.DataFrame({'ID': df.iloc[:, id_idx].map(normalize_id)})
+        for name, candidates in SCAN_FIELDS.items():
+            column = next((cols[n] for n in candidates if n in cols), None)
+            if column is None:
+                frame[name] = None
+            elif name in NUMERIC_FIELDS:
+                frame[name] = pd.to_numeric(df[column], errors='coerce')
+            else:
+                frame[name] = df[column].fillna('').astype(str).str.strip()
+        frame = frame[frame['ID'].ne('')].drop_duplicates('ID', keep='first')
+        frame = frame.astype(object).where(frame.notna(), None)
+
+        records, aliases = {}, {}
+        for record in frame.to_dict('records'):
+            key = record['ID']
+            for field in NUMERIC_FIELDS:
+                record[field] = compact_number(record[field])
+            records[key] = record
+            for alias in (record.get('Referencia'), record.get('Codigo')):
+                if alias:
+                    aliases.setdefault(str(alias).strip().upper(), key)
+            aliases[key.upper()] = key
+        with self._lock:
+            self._records, self._aliases = records, aliases
+            self._built_at = self._checked_at = time.time()
+
+    def get(self, ref) -> Optional[Dict]:
+        """Ficha por ID, Codigo o Referencia (copia), o None"""
+        text = normalize_id(ref).upper()
+        with self._lock:
+            key = self._aliases.get(text)
+            record = self._records.get(key) if key else None
+            return dict(record) if record else None
+
+    def record_stock(self, product_id, stock) -> None:
+        """Actualizar el stock tras un movimiento registrado en este worker"""
+        key = normalize_id(product_id)
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None:
+                record['cantidad'] = compact_number(stock)
+
+    def is_built(self) -> bool:
+        return self._built_at is not None
+
+    def mark_checked(self) -> None:
+        """Registrar un intento fallido de lectura para no reintentar en cada escaneo"""
+        self._checked_at = time.time()
+
+    def age_seconds(self) -> Optional[float]:
+        return None if self._checked_at is None else time.time() - self._checked_at
+
+
+product_lookup = ProductLookup()
+InventorySnapshot.subscribe(product_lookup.build_from_dataframe)
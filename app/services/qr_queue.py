@@ -0,0 +1,167 @@
+"""
+Cola local de generación de códigos QR.
+
+Las importaciones masivas encolan un QR por producto en SQLite y un hilo en
+segundo plano los genera y sube a Drive de a uno, sin bloquear la petición.
+Un QR tomado por un worker que se cayó se vuelve a entregar cuando vence su
+lease; los que fallan se reintentan hasta QR_QUEUE_MAX_ATTEMPTS.
+"""
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from config import Config
+from app.services import local_store
+
+
+STATUS_PENDING = 'pending'
+STATUS_WORKING = 'working'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+LEASE_SECONDS = 300
+RETRY_DELAY_SECONDS = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS qr_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT NOT NULL,
+    product_code TEXT NOT NULL,
+    base_url TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_at REAL,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_qr_queue_status ON qr_queue (status, id);
+"""
+
+
+class QRQueue:
+    """
+    Cola durable de QR pendientes con un hilo consumidor por proceso
+    """
+
+    _schema_ready = False
+    _wakeup = threading.Event()
+    _worker: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _conn():
+        conn = local_store.connect()
+        if not QRQueue._schema_ready:
+            conn.executescript(_SCHEMA)
+            QRQueue._schema_ready = True
+        return conn
+
+    @staticmethod
+    def enqueue(items: Iterable[Tuple[str, str]], base_url: str = None) -> int:
+        """
+        Encolar QR para (product_id, product_code) e iniciar el consumidor
+
+        Returns:
+            Cantidad de QR encolados
+        """
+        now = time.time()
+        rows = [(str(pid), str(code), base_url, now) for pid, code in items if pid and code]
+        if not rows:
+            return 0
+        QRQueue._conn()
+        with local_store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO qr_queue (product_id, product_code, base_url, created_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        QRQueue.start_background_worker()
+        QRQueue._wakeup.set()
+        return len(rows)
+
+    @staticmethod
+    def _claim() -> Optional[Dict]:
+        QRQueue._conn()
+        now = time.time()
+        with local_store.transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM qr_queue WHERE "
+                "(status = ? AND attempts < ? AND (claimed_at IS NULL OR claimed_at < ?)) "
+                "OR (status = ? AND claimed_at < ?) ORDER BY id LIMIT 1",
+                (STATUS_PENDING, Config.QR_QUEUE_MAX_ATTEMPTS, now - RETRY_DELAY_SECONDS,
+                 STATUS_WORKING, now - LEASE_SECONDS)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE qr_queue SET status = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (STATUS_WORKING, now, row['id'])
+            )
+        return dict(row)
+
+    @staticmethod
+    def _finish(item_id: int, ok: bool, error: str = None, final: bool = False):
+        status = STATUS_DONE if ok else (STATUS_FAILED if final else STATUS_PENDING)
+        # Un reintento pendiente conserva la hora del fallo para esperar RETRY_DELAY_SECONDS
+        retry_after = None if ok or final else time.time()
+        with local_store.transaction() as conn:
+            conn.execute(
+                "UPDATE qr_queue SET status = ?, claimed_at = ?, last_error = ? WHERE id = ?",
+                (status, retry_after, error, item_id)
+            )
+
+    @staticmethod
+    def drain(limit: int = None) -> int:
+        """
+        Generar los QR pendientes (hasta limit)
+
+        Returns:
+            Cantidad de QR generados
+        """
+        from app.services.qr_service import QRService
+
+        done = 0
+        processed = 0
+        while limit is None or processed < limit:
+            item = QRQueue._claim()
+            if item is None:
+                break
+            processed += 1
+            final = item['attempts'] + 1 >= Config.QR_QUEUE_MAX_ATTEMPTS
+            try:
+                ok = QRService.generate_and_upload_qr(
+                    product_id=item['product_id'],
+                    product_code=item['product_code'],
+                    base_url=item['base_url']
+                )
+                QRQueue._finish(item['id'], ok, None if ok else 'No se pudo generar o subir el QR', final)
+                done += int(bool(ok))
+            except Exception as e:
+                print(f"⚠️ Error al generar QR de {item['product_id']}: {e}")
+                QRQueue._finish(item['id'], False, str(e), final)
+        return done
+
+    @staticmethod
+    def status() -> Dict[str, int]:
+        """Cantidad de QR por estado"""
+        rows = QRQueue._conn().execute(
+            "SELECT status, COUNT(*) AS total FROM qr_queue GROUP BY status"
+        ).fetchall()
+        return {row['status']: int(row['total']) for row in rows}
+
+    @staticmethod
+    def _run_worker():
+        while True:
+            QRQueue._wakeup.wait(Config.QR_QUEUE_POLL_SECONDS)
+            QRQueue._wakeup.clear()
+            try:
+                QRQueue.drain()
+            except Exception as e:
+                print(f"Error en el hilo de la cola de QR: {e}")
+
+    @staticmethod
+    def start_background_worker():
+        """Iniciar (una vez por proceso) el hilo que genera los QR encolados"""
+        if QRQueue._worker is not None and QRQueue._worker.is_alive():
+            return
+        QRQueue._conn()
+        QRQueue._worker = threading.Thread(target=QRQueue._run_worker, name='qr-queue-worker', daemon=True)
+        QRQueue._worker.start()
@@ -6,8 +6,8 @@ import io
 import qrcode
 from PIL import Image
 from googleapiclient.http import MediaIoBaseUpload
-from app.services.sheets_writer import get_credentials
-from googleapiclient.discovery import build
+from app.services.sheets_writer import build_service, get_credentials
+from app.services.request_metrics import RequestMetrics
 from config import Config
 
 
@@ -22,6 +22,30 @@ class QRService:
     """
     
     @staticmethod
+    def build_qr_image(url: str, box_size: int = 10, border: int = 4) -> Image.Image:
+        """
+        Construir el código QR como imagen PIL (sin serializar)
+        
+        Args:
+            url: URL a codificar en el QR
+            box_size: Tamaño en píxeles de cada módulo del QR
+            border: Ancho del borde en módulos
+        
+        Returns:
+            Imagen PIL en blanco y negro
+        """
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=box_size,
+            border=border,
+        )
+        qr.add_data(url)
+        qr.make(fit=True)
+        return qr.make_image(fill_color="black", back_color="white").get_image()
+    
+    @staticmethod
+    @RequestMetrics.instrumented('qr_render')
     def generate_qr_code(url: str, filename: str = None) -> io.BytesIO:
         """
         Generar código QR como imagen en memoria
@@ -34,18 +58,8 @@ class QRService:
             BytesIO con la imagen del QR
         """
         try:
-            # Crear instancia de QRCode
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(url)
-            qr.make(fit=True)
-            
             # Crear imagen
-            img = qr.make_image(fill_color="black", back_color="white")
+            img = QRService.build_qr_image(url)
             
             # Convertir a BytesIO
             img_bytes = io.BytesIO()
@@ -117,7 +131,7 @@ class QRService:
         """
         try:
             creds = get_credentials()
-            service = build('drive', 'v3', credentials=creds)
+            service = build_service('drive', 'v3', creds)
             
             # Obtener o crear carpeta QR
             folder_id = QRService.get_or_create_qr_folder(service)
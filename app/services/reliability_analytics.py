@@ -0,0 +1,242 @@
+"""
+Analítica de confiabilidad sobre HISTORICO_MANTENIMIENTOS.
+
+Métricas:
+- Intervalo medio entre ejecuciones por activo (estilo MTBF) y entre
+  correctivos por máquina.
+- Tiempo medio de cierre: fecha_cierre - fecha_ejecucion (estilo MTTR; el
+  histórico no registra duración de la intervención).
+- Cumplimiento: ejecuciones con fecha_ejecucion <= fecha_programada
+  (+ tolerancia) sobre las que tienen ambas fechas.
+- Carga de trabajo por máquina, técnico y mes.
+
+El histórico es de solo agregado, así que el estado se guarda como sumas por
+grupo y fechas de ejecución por activo: cada lectura procesa solo las filas
+nuevas y el informe se reutiliza mientras el histórico no cambie. Si una
+fila ya procesada cambia o desaparece, se reconstruye todo.
+"""
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from app.services.maintenance_service import MaintenanceService
+from app.services.sheet_frames import columns_map, first_pending_row, fingerprint, parse_sheet_dates
+
+
+NO_DATA = '(sin dato)'
+STAT_COLUMNS = [
+    'ejecutados', 'con_fechas', 'a_tiempo', 'retraso_total_dias',
+    'con_cierre', 'cierre_total_dias', 'correctivos',
+]
+GROUPS = {'maquina': 'por_maquina', 'tecnico': 'por_tecnico', 'mes': 'por_mes'}
+
+
+def _text(series: pd.Series) -> pd.Series:
+    out = series.astype(str).str.strip()
+    return out.mask(series.isna() | out.eq('') | out.str.lower().eq('nan'), NO_DATA)
+
+
+class ReliabilityAnalytics:
+    """
+    Informe de confiabilidad con agregados incrementales (uno por proceso)
+    """
+
+    _lock = threading.Lock()
+    _rows = 0
+    _last_fingerprint: Optional[str] = None
+    _version = 0
+    _stats: Dict[str, pd.DataFrame] = {}
+    _exec_dates: Dict[str, np.ndarray] = {}
+    _corrective_dates: Dict[str, np.ndarray] = {}
+    _activo_maquina: Dict[str, str] = {}
+    _report: Optional[Dict] = None
+
+    @staticmethod
+    def _reset():
+        ReliabilityAnalytics._rows = 0
+        ReliabilityAnalytics._last_fingerprint = None
+        ReliabilityAnalytics._stats = {}
+        ReliabilityAnalytics._exec_dates = {}
+        ReliabilityAnalytics._corrective_dates = {}
+        ReliabilityAnalytics._activo_maquina = {}
+        ReliabilityAnalytics._report = None
+
+    @staticmethod
+    def _load_activo_maquina() -> Dict[str, str]:
+        activos = MaintenanceService._read_df('activos')
+        if activos is None or activos.empty:
+            return {}
+        cols = columns_map(activos)
+        if 'id_activo' not in cols or 'id_maquina' not in cols:
+            return {}
+        return dict(zip(_text(activos[cols['id_activo']]), _text(activos[cols['id_maquina']])))
+
+    @staticmethod
+    def _prepare(batch: pd.DataFrame) -> pd.DataFrame:
+        """Filas del histórico a un marco tipado (fechas, retrasos, claves de grupo)"""
+        cols = columns_map(batch)
+
+        def column(name):
+            return batch[cols[name]] if name in cols else pd.Series(np.nan, index=batch.index)
+
+        ejecucion = parse_sheet_dates(column('fecha_ejecucion'))
+        programada = parse_sheet_dates(column('fecha_programada'))
+        cierre = parse_sheet_dates(column('fecha_cierre'))
+        activo = _text(column('id_activo'))
+
+        # Activos que no están en el mapa: recargar la hoja de activos una vez
+        missing = set(activo.unique()) - set(ReliabilityAnalytics._activo_maquina) - {NO_DATA}
+        if missing:
+            ReliabilityAnalytics._activo_maquina.update(ReliabilityAnalytics._load_activo_maquina())
+
+        retraso = (ejecucion - programada).dt.days
+        frame = pd.DataFrame({
+            'activo': activo,
+            'maquina': activo.map(ReliabilityAnalytics._activo_maquina).fillna(NO_DATA),
+            'tecnico': _text(column('tecnico')),
+            'mes': ejecucion.dt.strftime('%Y-%m').fillna(NO_DATA),
+            'ejecucion': ejecucion,
+            'retraso': retraso,
+            'con_fechas': retraso.notna(),
+            'a_tiempo': retraso.le(Config.MAINTENANCE_ON_TIME_TOLERANCE_DAYS) & retraso.notna(),
+            'cierre': (cierre - ejecucion).dt.days,
+            'correctivo': _text(column('tipo_mtto')).str.upper().str.startswith('CORRECT'),
+        })
+        frame['con_cierre'] = frame['cierre'].notna()
+        return frame
+
+    @staticmethod
+    def _group_stats(frame: pd.DataFrame, key: str) -> pd.DataFrame:
+        grouped = frame.groupby(key, sort=False)
+        return pd.DataFrame({
+            'ejecutados': grouped.size(),
+            'con_fechas': grouped['con_fechas'].sum(),
+            'a_tiempo': grouped['a_tiempo'].sum(),
+            'retraso_total_dias': grouped['retraso'].sum(),
+            'con_cierre': grouped['con_cierre'].sum(),
+            'cierre_total_dias': grouped['cierre'].sum(),
+            'correctivos': grouped['correctivo'].sum(),
+        })[STAT_COLUMNS].astype('float64')
+
+    @staticmethod
+    def _merge_dates(store: Dict[str, np.ndarray], keys: pd.Series, dates: pd.Series):
+        valid = dates.notna()
+        if not valid.any():
+            return
+        values = dates[valid].to_numpy('datetime64[D]')
+        for key, positions in pd.Series(np.arange(len(values)), index=keys[valid].to_numpy()).groupby(level=0):
+            previous = store.get(key)
+            merged = values[positions.to_numpy()]
+            if previous is not None:
+                merged = np.concatenate([previous, merged])
+            store[key] = np.sort(merged)
+
+    @staticmethod
+    def _extend(batch: pd.DataFrame):
+        frame = ReliabilityAnalytics._prepare(batch)
+        for key in GROUPS:
+            new = ReliabilityAnalytics._group_stats(frame, key)
+            current = ReliabilityAnalytics._stats.get(key)
+            ReliabilityAnalytics._stats[key] = new if current is None else current.add(new, fill_value=0)
+        ReliabilityAnalytics._merge_dates(ReliabilityAnalytics._exec_dates, frame['activo'], frame['ejecucion'])
+        corrective = frame[frame['correctivo']]
+        ReliabilityAnalytics._merge_dates(
+            ReliabilityAnalytics._corrective_dates, corrective['maquina'], corrective['ejecucion']
+        )
+
+    @staticmethod
+    def _interval_stats(store: Dict[str, np.ndarray]) -> pd.DataFrame:
+        rows = []
+        for key, dates in store.items():
+            gaps = np.diff(dates).astype('int64') if len(dates) > 1 else np.array([], dtype='int64')
+            rows.append({
+                'clave': key,
+                'ejecuciones': int(len(dates)),
+                'intervalo_medio_dias': round(float(gaps.mean()), 1) if len(gaps) else None,
+                'ultima_ejecucion': str(dates[-1]) if len(dates) else None,
+            })
+        return pd.DataFrame(rows, columns=['clave', 'ejecuciones', 'intervalo_medio_dias', 'ultima_ejecucion'])
+
+    @staticmethod
+    def _ratios(stats: pd.DataFrame) -> pd.DataFrame:
+        out = pd.DataFrame(index=stats.index)
+        out['ejecutados'] = stats['ejecutados'].astype(int)
+        out['correctivos'] = stats['correctivos'].astype(int)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out['cumplimiento_pct'] = (100 * stats['a_tiempo'] / stats['con_fechas']).round(1)
+            out['retraso_medio_dias'] = (stats['retraso_total_dias'] / stats['con_fechas']).round(1)
+            out['cierre_medio_dias'] = (stats['cierre_total_dias'] / stats['con_cierre']).round(1)
+        return out.replace([np.inf, -np.inf], np.nan)
+
+    @staticmethod
+    def _records(df: pd.DataFrame) -> List[Dict]:
+        return df.astype(object).where(df.notna(), None).to_dict('records')
+
+    @staticmethod
+    def _build_report() -> Dict:
+        stats = ReliabilityAnalytics._stats
+        report: Dict = {'version': ReliabilityAnalytics._version, 'filas': ReliabilityAnalytics._rows}
+        if not stats:
+            report.update({'resumen': {}, 'por_maquina': [], 'por_tecnico': [], 'por_mes': [], 'por_activo': []})
+            return report
+
+        total = stats['mes'].sum()
+        intervals = ReliabilityAnalytics._interval_stats(ReliabilityAnalytics._exec_dates)
+        corrective = ReliabilityAnalytics._interval_stats(ReliabilityAnalytics._corrective_dates)
+        report['resumen'] = ReliabilityAnalytics._records(
+            ReliabilityAnalytics._ratios(total.to_frame().T)
+        )[0]
+        report['resumen']['intervalo_medio_dias'] = (
+            round(float(intervals['intervalo_medio_dias'].dropna().mean()), 1)
+            if intervals['intervalo_medio_dias'].notna().any() else None
+        )
+
+        for key, name in GROUPS.items():
+            table = ReliabilityAnalytics._ratios(stats[key])
+            table.index.name = key
+            table = table.reset_index()
+            if key == 'mes':
+                table = table.sort_values('mes')
+            else:
+                table = table.sort_values('ejecutados', ascending=False)
+            if key == 'maquina':
+                mtbf = corrective.set_index('clave')['intervalo_medio_dias']
+                table['mtbf_correctivo_dias'] = table['maquina'].map(mtbf)
+            report[name] = ReliabilityAnalytics._records(table)
+
+        report['por_activo'] = ReliabilityAnalytics._records(
+            intervals.rename(columns={'clave': 'id_activo'}).sort_values('ejecuciones', ascending=False)
+        )
+        return report
+
+    @staticmethod
+    def report() -> Dict:
+        """
+        Informe de confiabilidad. Lee el histórico (una descarga) y procesa
+        solo las filas agregadas desde la última llamada.
+        """
+        df = MaintenanceService._read_df('historico')
+        rows = 0 if df is None else len(df.index)
+        with ReliabilityAnalytics._lock:
+            cls = ReliabilityAnalytics
+            # Lo ya procesado debe seguir igual; si no, reconstruir desde cero
+            processed = first_pending_row(df, cls._rows, cls._last_fingerprint)
+            if processed < cls._rows:
+                cls._reset()
+            if rows > processed or cls._report is None:
+                if rows > processed:
+                    cls._extend(df.iloc[processed:])
+                    cls._rows = rows
+                    cls._last_fingerprint = fingerprint(df, rows)
+                    cls._version += 1
+                cls._report = cls._build_report()
+            return cls._report
+
+    @staticmethod
+    def invalidate():
+        """Descartar los agregados (se reconstruyen en el próximo informe)"""
+        with ReliabilityAnalytics._lock:
+            ReliabilityAnalytics._reset()
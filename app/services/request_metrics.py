@@ -0,0 +1,288 @@
+"""
+Tiempos por petición y desglose de las llamadas externas.
+
+Cada petición abre una traza; las llamadas instrumentadas (descarga del CSV,
+parseo con pandas, Sheets API, Drive API, generación de QR) suman a la traza
+activa su tiempo, cantidad y bytes. Al terminar, la respuesta lleva el
+encabezado Server-Timing con el desglose y la duración total se acumula en un
+histograma por endpoint. Las llamadas hechas fuera de una petición (hilos en
+segundo plano) solo cuentan en los totales por categoría.
+"""
+import contextvars
+import functools
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from flask import g, request
+
+
+# Límites superiores de los buckets del histograma, en milisegundos
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('request_trace', default=None)
+
+
+def classify_error(exc: BaseException) -> str:
+    """
+    Clase de error de una llamada externa: quota (429 / límite de uso),
+    auth (401, 403, token inválido), timeout u other
+    """
+    status = None
+    resp = getattr(exc, 'resp', None)            # googleapiclient.errors.HttpError
+    if resp is not None:
+        status = getattr(resp, 'status', None)
+    response = getattr(exc, 'response', None)    # requests.HTTPError
+    if status is None and response is not None:
+        status = getattr(response, 'status_code', None)
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+    text = str(exc).lower()
+    name = type(exc).__name__.lower()
+
+    if status == 429 or 'ratelimitexceeded' in text or 'quota' in text:
+        return 'quota'
+    if status in (401, 403) or 'refresherror' in name or 'invalid_grant' in text:
+        return 'auth'
+    if isinstance(exc, (TimeoutError, socket.timeout)) or 'timeout' in name or 'timed out' in text:
+        return 'timeout'
+    return 'other'
+
+
+class _Stat:
+    __slots__ = ('count', 'seconds', 'bytes', 'errors')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.errors = 0
+
+    def add(self, seconds: float, size: int, failed: bool):
+        self.count += 1
+        self.seconds += seconds
+        self.bytes += size
+        self.errors += int(failed)
+
+    def as_dict(self) -> Dict:
+        return {
+            'llamadas': self.count,
+            'ms': round(self.seconds * 1000, 1),
+            'bytes': self.bytes,
+            'errores': self.errors,
+        }
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'count', 'total')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, ms: float):
+        index = len(LATENCY_BUCKETS_MS)
+        for position, limit in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= limit:
+                index = position
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Límite superior del bucket que contiene el cuantil q (aproximado)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for position, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[position] if position < len(LATENCY_BUCKETS_MS) else float('inf')
+        return float('inf')
+
+    def as_dict(self) -> Dict:
+        return {
+            'peticiones': self.count,
+            'promedio_ms': round(self.total / self.count, 1) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'buckets_ms': {
+                **{str(limit): count for limit, count in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                '+Inf': self.buckets[-1],
+            },
+        }
+
+
+class RequestTrace:
+    """
+    Llamadas externas de una petición, agrupadas por categoría
+    """
+
+    def __init__(self, endpoint: str = None):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stats: Dict[str, _Stat] = {}
+        # (categoría, recurso) -> veces leído y pilas de las lecturas repetidas
+        self.fetches: Dict[Tuple[str, object], int] = {}
+        self.repeated_stacks: Dict[Tuple[str, object], List[List[str]]] = {}
+
+    def add(self, category: str, seconds: float, size: int, failed: bool):
+        self.stats.setdefault(category, _Stat()).add(seconds, size, failed)
+
+    def record_fetch(self, category: str, resource) -> None:
+        key = (category, resource)
+        self.fetches[key] = self.fetches.get(key, 0) + 1
+        if self.fetches[key] > 1:
+            # Solo se captura la pila de las lecturas repetidas (la primera es legítima)
+            stack = traceback.format_stack()[:-3]
+            self.repeated_stacks.setdefault(key, []).append(stack)
+
+    def server_timing(self, total_ms: float) -> str:
+        parts = [f'total;dur={total_ms:.1f}']
+        for category, stat in self.stats.items():
+            desc = f"{stat.count} llamada{'' if stat.count == 1 else 's'}"
+            if stat.bytes:
+                desc += f', {stat.bytes / 1024:.1f} KB'
+            parts.append(f'{category};dur={stat.seconds * 1000:.1f};desc="{desc}"')
+        return ', '.join(parts)
+
+
+class RequestMetrics:
+    """
+    Middleware de tiempos e instrumentación de llamadas externas
+    """
+
+    _lock = threading.Lock()
+    _endpoints: Dict[str, _Histogram] = {}
+    _categories: Dict[str, _Stat] = {}
+    _counters: Dict[Tuple[str, Tuple], float] = {}
+
+    @staticmethod
+    def current_trace() -> Optional[RequestTrace]:
+        return _current_trace.get()
+
+    @staticmethod
+    @contextmanager
+    def track(category: str, resource=None):
+        """
+        Medir una llamada externa. El bloque puede informar los bytes
+        transferidos con span['bytes'] = n. resource identifica lo leído
+        (ej. (sheet_id, gid)) para detectar lecturas repetidas en una petición.
+
+            with RequestMetrics.track('sheets_csv') as span:
+                response = requests.get(url)
+                span['bytes'] = len(response.content)
+        """
+        span = {'bytes': 0}
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield span
+        except Exception as e:
+            failed = True
+            RequestMetrics.increment('external_errors', categoria=category, clase=classify_error(e))
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            size = int(span.get('bytes') or 0)
+            with RequestMetrics._lock:
+                RequestMetrics._categories.setdefault(category, _Stat()).add(seconds, size, failed)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add(category, seconds, size, failed)
+                if resource is not None:
+                    trace.record_fetch(category, resource)
+
+    @staticmethod
+    def instrumented(category: str):
+        """Decorador equivalente a envolver la función en track(category)"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with RequestMetrics.track(category):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def increment(name: str, value: float = 1.0, **labels):
+        """Sumar a un contador con etiquetas (ej. increment('cache', cache='x', resultado='hit'))"""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with RequestMetrics._lock:
+            RequestMetrics._counters[key] = RequestMetrics._counters.get(key, 0.0) + value
+
+    @staticmethod
+    def samples() -> List[Tuple[str, Dict[str, str], float]]:
+        """
+        Valores acumulados de este proceso como (nombre, etiquetas, valor):
+        histogramas de peticiones (buckets acumulados, en segundos), totales
+        de llamadas externas y contadores
+        """
+        result = []
+        with RequestMetrics._lock:
+            for endpoint, histogram in RequestMetrics._endpoints.items():
+                running = 0
+                for limit, count in zip(LATENCY_BUCKETS_MS + (None,), histogram.buckets):
+                    running += count
+                    le = '+Inf' if limit is None else repr(limit / 1000)
+                    result.append(('request_duration_seconds_bucket', {'endpoint': endpoint, 'le': le}, running))
+                result.append(('request_duration_seconds_sum', {'endpoint': endpoint}, histogram.total / 1000))
+                result.append(('request_duration_seconds_count', {'endpoint': endpoint}, histogram.count))
+            for category, stat in RequestMetrics._categories.items():
+                labels = {'categoria': category}
+                result.append(('external_calls_total', labels, stat.count))
+                result.append(('external_call_seconds_total', labels, stat.seconds))
+                result.append(('external_bytes_total', labels, stat.bytes))
+            for (name, labels), value in RequestMetrics._counters.items():
+                result.append((f'{name}_total', dict(labels), value))
+        return result
+
+    @staticmethod
+    def observe_request(endpoint: str, ms: float):
+        with RequestMetrics._lock:
+            RequestMetrics._endpoints.setdefault(endpoint, _Histogram()).observe(ms)
+
+    @staticmethod
+    def snapshot() -> Dict:
+        """Histogramas por endpoint y totales por categoría (este proceso)"""
+        with RequestMetrics._lock:
+            return {
+                'endpoints': {name: h.as_dict() for name, h in sorted(RequestMetrics._endpoints.items())},
+                'llamadas_externas': {name: s.as_dict() for name, s in sorted(RequestMetrics._categories.items())},
+            }
+
+    @staticmethod
+    def init_app(app):
+        """Registrar el middleware de tiempos en la aplicación"""
+
+        @app.before_request
+        def _start_trace():
+            g.request_trace_token = _current_trace.set(RequestTrace(request.endpoint or 'sin_ruta'))
+
+        @app.after_request
+        def _finish_trace(response):
+            trace = _current_trace.get()
+            if trace is None:
+                return response
+            total_ms = (time.perf_counter() - trace.started) * 1000
+            RequestMetrics.observe_request(trace.endpoint, total_ms)
+            response.headers['Server-Timing'] = trace.server_timing(total_ms)
+            return response
+
+        @app.teardown_request
+        def _clear_trace(exc=None):
+            token = g.pop('request_trace_token', None)
+            if token is not None:
+                try:
+                    _current_trace.reset(token)
+                except ValueError:
+                    # Token creado en otro contexto (p. ej. respuesta en streaming)
+                    _current_trace.set(None)
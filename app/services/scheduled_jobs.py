@@ -0,0 +1,90 @@
+"""
+Tareas recurrentes de la aplicación (ver JobScheduler)
+"""
+from config import Config
+from app.services.job_scheduler import JobScheduler
+
+
+def plan_preventive() -> str:
+    """Generar los mantenimientos preventivos del horizonte configurado"""
+    from app.services.preventive_planner import PreventivePlanner
+
+    resumen = PreventivePlanner.plan()
+    texto = (
+        f"{resumen['creados']} creados, {resumen['existentes']} existentes, "
+        f"{resumen['activos']} activos, {resumen['activos_actualizados']} fechas actualizadas"
+    )
+    if resumen['frecuencia_invalida']:
+        texto += f", {len(resumen['frecuencia_invalida'])} con frecuencia_dias inválida"
+    return texto
+
+
+def reconcile_kpis() -> str:
+    """Verificar los KPIs materializados del tablero CMMS"""
+    from app.services.maintenance_kpis import MaintenanceKpiStore
+
+    drift = MaintenanceKpiStore.reconcile()
+    return f"Diferencias corregidas: {drift}" if drift else "Sin diferencias"
+
+
+def warm_caches() -> str:
+    """
+    Precalentar en este worker el snapshot del inventario (y sus índices) y
+    los metadatos y contadores de las hojas CMMS
+    """
+    from app.services.sheets_service import SheetsService
+    from app.services.maintenance_service import MaintenanceService
+
+    productos = len(SheetsService.get_inventory_data())
+    for section in MaintenanceService.sheet_urls():
+        MaintenanceService._get_sheet_headers(section)
+        MaintenanceService._get_sheet_properties(section)
+        MaintenanceService._read_df(section)
+    return f"{productos} productos en el snapshot del inventario"
+
+
+def low_stock_digest() -> str:
+    """
+    Emitir el conjunto vigente de productos con stock bajo (log y, si está
+    configurado, POST JSON a LOW_STOCK_DIGEST_WEBHOOK)
+    """
+    import requests
+    from app.services.low_stock_index import low_stock_index
+    from app.services.sheets_service import SheetsService
+
+    if not low_stock_index.is_built():
+        SheetsService.get_inventory_data()
+    items = low_stock_index.breaches()
+    resumen = ", ".join(f"{i.get('Codigo') or i['ID']} ({i['cantidad']:g}/{i['Stock-min']:g})" for i in items[:50])
+    print(f"📦 Stock bajo: {len(items)} producto(s). {resumen}")
+    if Config.LOW_STOCK_DIGEST_WEBHOOK:
+        response = requests.post(
+            Config.LOW_STOCK_DIGEST_WEBHOOK,
+            json={'total': len(items), 'productos': items},
+            timeout=10,
+        )
+        response.raise_for_status()
+    return f"{len(items)} producto(s) con stock bajo: {resumen}"
+
+
+def register_default_jobs():
+    """Registrar las tareas con las expresiones cron de la configuración"""
+    JobScheduler.register(
+        'planificacion_preventiva', Config.SCHEDULE_PREVENTIVE_PLANNING, plan_preventive,
+        'Generar mantenimientos PROGRAMADO a partir de los activos',
+    )
+    JobScheduler.register(
+        'reconciliar_kpis', Config.SCHEDULE_KPI_RECONCILE, reconcile_kpis,
+        'Comparar los KPIs del tablero CMMS con un recuento completo',
+        timeout_seconds=600,
+    )
+    JobScheduler.register(
+        'precalentar_cache', Config.SCHEDULE_CACHE_WARMUP, warm_caches,
+        'Cargar inventario y hojas CMMS antes del turno',
+        leader_only=False, timeout_seconds=600,
+    )
+    JobScheduler.register(
+        'resumen_bajo_stock', Config.SCHEDULE_LOW_STOCK_DIGEST, low_stock_digest,
+        'Emitir los productos con cantidad <= Stock-min',
+        timeout_seconds=300,
+    )
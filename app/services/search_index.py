@@ -0,0 +1,217 @@
+"""
+Índice invertido para la búsqueda de texto en el inventario.
+
+Indexa Descripcion, Referencia, Codigo y Ubicación con términos sin tildes
+ni mayúsculas (Ubicación = ubicacion), acepta prefijos (rod -> rodamiento)
+y ordena los resultados por relevancia. Con cada snapshot del inventario
+solo se reindexan los productos nuevos, modificados o eliminados.
+"""
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Set
+
+import pandas as pd
+
+from app.services.inventory_index import find_id_column, normalize_id
+from app.services.inventory_snapshot import InventorySnapshot
+
+
+# Campo indexado -> (nombres de columna posibles, peso en el ranking)
+SEARCH_FIELDS = {
+    'Codigo': (['codigo', 'código'], 3.0),
+    'Referencia': (['referencia'], 3.0),
+    'Descripcion': (['descripcion', 'descripción'], 1.0),
+    'Ubicación': (['ubicación', 'ubicacion'], 1.5),
+}
+EXTRA_FIELDS = {
+    'cantidad': ['cantidad', 'stock'],
+    'Unidad-medida': ['unidad-medida', 'unidad medida'],
+}
+# Campos cuyo valor completo sin separadores también es un término (604-2RS1 -> 6042rs1)
+COMPACT_FIELDS = ('Codigo', 'Referencia')
+# Una coincidencia por prefijo vale menos que el término completo
+PREFIX_FACTOR = 0.6
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def fold(text) -> str:
+    """Texto en minúsculas y sin tildes (Ubicación -> ubicacion)"""
+    if text is None:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text) -> List[str]:
+    return _TOKEN_RE.findall(fold(text))
+
+
+def _clean_series(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(series):
+        # Números enteros que pandas leyó como float (7.0 -> 7)
+        return series.map(normalize_id)
+    return series.fillna('').astype(str).str.strip()
+
+
+class InventorySearchIndex:
+    """
+    Términos -> {ID de producto: peso}, con el vocabulario ordenado para
+    resolver prefijos con búsqueda binaria
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._doc_keys: Dict[str, tuple] = {}
+        # ID -> fila (ID, campos de búsqueda, campos extra) en el orden de _columns
+        self._docs: Dict[str, tuple] = {}
+        self._columns: List[str] = []
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._built = False
+
+    @staticmethod
+    def _terms(texts: tuple) -> Dict[str, float]:
+        terms: Dict[str, float] = {}
+        for value, (field, (_, weight)) in zip(texts, SEARCH_FIELDS.items()):
+            tokens = tokenize(value)
+            if field in COMPACT_FIELDS and len(tokens) > 1:
+                tokens.append(''.join(tokens))
+            for token in tokens:
+                terms[token] = max(terms.get(token, 0.0), weight)
+        return terms
+
+    def _remove(self, doc_id: str) -> None:
+        for term in self._doc_terms.pop(doc_id, {}):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self._postings[term]
+                self._vocabulary_dirty = True
+        self._docs.pop(doc_id, None)
+        self._doc_keys.pop(doc_id, None)
+
+    def _add(self, doc_id: str, row: tuple, key: tuple) -> None:
+        terms = self._terms(key)
+        for term, weight in terms.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = {}
+                self._vocabulary_dirty = True
+            posting[doc_id] = weight
+        self._doc_terms[doc_id] = terms
+        self._docs[doc_id] = row
+        self._doc_keys[doc_id] = key
+
+    def build_from_dataframe(self, df: pd.DataFrame) -> None:
+        """
+        Listener de InventorySnapshot: reindexar solo los productos cuyo
+        texto cambió y quitar los que ya no están en la hoja
+        """
+        if df is None:
+            return
+        cols = {str(c).strip().lower(): c for c in df.columns}
+        id_idx = find_id_column([str(c) for c in df.columns])
+        if id_idx is None:
+            return
+
+        frame = pd.DataFrame({'ID': df.iloc[:, id_idx].map(normalize_id)})
+        for name, candidates in [(n, c) for n, (c, _) in SEARCH_FIELDS.items()] + list(EXTRA_FIELDS.items()):
+            column = next((cols[n] for n in candidates if n in cols), None)
+            frame[name] = _clean_series(df[column]) if column is not None else ''
+        frame = frame[frame['ID'].ne('')].drop_duplicates('ID', keep='first')
+
+        columns = list(frame.columns)
+        text_slice = slice(1, 1 + len(SEARCH_FIELDS))
+        with self._lock:
+            self._columns = columns
+            current: Set[str] = set()
+            for row in zip(*(frame[c].tolist() for c in columns)):
+                doc_id = row[0]
+                current.add(doc_id)
+                if self._doc_keys.get(doc_id) == row[text_slice]:
+                    # Mismo texto: solo refrescar los datos que se muestran
+                    self._docs[doc_id] = row
+                    continue
+                self._remove(doc_id)
+                self._add(doc_id, row, row[text_slice])
+            for doc_id in set(self._doc_keys) - current:
+                self._remove(doc_id)
+            self._built = True
+
+    def _expand(self, token: str, prefix: bool) -> Dict[str, float]:
+        """
+        Términos del vocabulario que coinciden con el token y su factor. Un
+        prefijo abarca todo su rango del vocabulario (sin tope), así un token
+        corto no deja fuera productos; el costo lo acotan las postings.
+        """
+        matches = {token: 1.0} if token in self._postings else {}
+        if not prefix:
+            return matches
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        # Los términos son [a-z0-9]+: todo lo que empieza por el token queda antes de token + '\x7f'
+        start = bisect.bisect_left(self._vocabulary, token)
+        end = bisect.bisect_left(self._vocabulary, token + '\x7f', start)
+        for term in self._vocabulary[start:end]:
+            matches.setdefault(term, PREFIX_FACTOR)
+        return matches
+
+    def search(self, query: str, limit: int = 50) -> List[Dict]:
+        """
+        Productos que contienen todos los términos de la consulta (el último,
+        o los que terminan en *, también como prefijo), ordenados por
+        relevancia: peso del campo x rareza del término
+        """
+        raw_terms = [t for t in re.split(r'\s+', query or '') if t]
+        parts = []
+        for position, raw in enumerate(raw_terms):
+            is_prefix = raw.endswith('*') or position == len(raw_terms) - 1
+            tokens = tokenize(raw)
+            # Dentro de un término con separadores (604-2RS1) solo el último fragmento es prefijo
+            parts.extend((tok, is_prefix and i == len(tokens) - 1) for i, tok in enumerate(tokens))
+        if not parts:
+            return []
+
+        with self._lock:
+            total_docs = max(len(self._docs), 1)
+            scores: Optional[Dict[str, float]] = None
+            for token, is_prefix in parts:
+                term_scores: Dict[str, float] = {}
+                expanded = self._expand(token, is_prefix)
+                # Un prefijo pesa según la frecuencia del conjunto de términos que
+                # abarca, así un término exacto nunca queda debajo de uno raro que solo empieza igual
+                prefix_df = sum(len(self._postings[term]) for term in expanded)
+                for term, factor in expanded.items():
+                    posting = self._postings[term]
+                    idf = math.log(1 + total_docs / (len(posting) if factor == 1.0 else prefix_df))
+                    for doc_id, weight in posting.items():
+                        score = weight * factor * idf
+                        if score > term_scores.get(doc_id, 0.0):
+                            term_scores[doc_id] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {d: s + term_scores[d] for d, s in scores.items() if d in term_scores}
+                if not scores:
+                    return []
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:max(int(limit), 1)]
+            return [dict(zip(self._columns, self._docs[doc_id]), score=round(score, 3)) for doc_id, score in ranked]
+
+    def is_built(self) -> bool:
+        return self._built
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+inventory_search_index = InventorySearchIndex()
+InventorySnapshot.subscribe(inventory_search_index.build_from_dataframe)
@@ -0,0 +1,178 @@
+"""
+Asignador de consecutivos compartido entre workers.
+
+Guarda en LOCAL_STATE_DB la marca más alta asignada de cada secuencia (ID de
+producto y consecutivo de cada abreviatura de Codigo). Las marcas se siembran
+y se elevan con cada snapshot del inventario, y cada reserva es una sola
+transacción SQLite con bloqueo de escritura, así que dos workers nunca
+entregan el mismo número.
+"""
+import time
+from typing import Dict
+
+import pandas as pd
+
+from app.services import local_store
+from app.services.inventory_snapshot import InventorySnapshot
+
+
+PRODUCT_ID_SEQUENCE = 'product_id'
+CODIGO_SEQUENCE_PREFIX = 'codigo:'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sequence_seeds (
+    source TEXT PRIMARY KEY,
+    seeded_at REAL NOT NULL
+);
+"""
+
+
+def codigo_sequence(prefix: str) -> str:
+    """Nombre de la secuencia para una abreviatura de Codigo (ej. RMEC)"""
+    return f"{CODIGO_SEQUENCE_PREFIX}{str(prefix).strip().upper()}"
+
+
+class SequenceAllocator:
+    """
+    Reserva atómica de números consecutivos
+    """
+
+    _schema_ready = False
+
+    @staticmethod
+    def _conn():
+        conn = local_store.connect()
+        if not SequenceAllocator._schema_ready:
+            conn.executescript(_SCHEMA)
+            SequenceAllocator._schema_ready = True
+        return conn
+
+    @staticmethod
+    def observe_snapshot(df: pd.DataFrame):
+        """
+        Listener de InventorySnapshot: elevar las marcas con el máximo ID y el
+        máximo consecutivo por abreviatura presentes en la hoja. Nunca las baja,
+        así que un número reservado no se vuelve a entregar aunque el producto
+        todavía no aparezca en la hoja.
+        """
+        if df is None:
+            return
+        columns = {str(c).strip().lower(): c for c in df.columns}
+        marks = {PRODUCT_ID_SEQUENCE: 0}
+
+        id_col = columns.get('id')
+        if id_col is not None:
+            ids = pd.to_numeric(df[id_col], errors='coerce').dropna()
+            if not ids.empty:
+                marks[PRODUCT_ID_SEQUENCE] = int(ids.max())
+
+        code_col = columns.get('codigo') or columns.get('código')
+        if code_col is not None:
+            codes = df[code_col].dropna().astype(str).str.strip().str.upper()
+            parts = codes.str.extract(r'^([A-Z]+)-?(\d+)').dropna()
+            if not parts.empty:
+                maxima = pd.to_numeric(parts[1]).groupby(parts[0]).max()
+                for prefix, value in maxima.items():
+                    marks[codigo_sequence(prefix)] = int(value)
+
+        SequenceAllocator._conn()
+        now = time.time()
+        with local_store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO sequences (name, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET "
+                "value = MAX(value, excluded.value), updated_at = excluded.updated_at",
+                [(name, value, now) for name, value in marks.items()]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sequence_seeds (source, seeded_at) VALUES ('inventory', ?)", (now,)
+            )
+
+    @staticmethod
+    def raise_to(name: str, value: int):
+        """Elevar la marca de una secuencia al menos hasta value (nunca la baja)"""
+        SequenceAllocator._conn()
+        with local_store.transaction() as conn:
+            conn.execute(
+                "INSERT INTO sequences (name, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET "
+                "value = MAX(value, excluded.value), updated_at = excluded.updated_at",
+                (name, int(value), time.time())
+            )
+
+    @staticmethod
+    def _is_seeded() -> bool:
+        row = SequenceAllocator._conn().execute(
+            "SELECT 1 FROM sequence_seeds WHERE source = 'inventory'"
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _ensure_seeded(name: str):
+        """
+        Leer el inventario una vez si las marcas nunca se sembraron
+
+        Raises:
+            RuntimeError: Si la lectura falló y las marcas siguen sin sembrar
+                (contar desde 0 entregaría IDs que ya existen en la hoja)
+        """
+        if name != PRODUCT_ID_SEQUENCE and not name.startswith(CODIGO_SEQUENCE_PREFIX):
+            # Secuencias ajenas al inventario: las siembra quien las usa (raise_to)
+            return
+        if SequenceAllocator._is_seeded():
+            return
+        from app.services.sheets_service import SheetsService
+        SheetsService.get_inventory_data()
+        if not SequenceAllocator._is_seeded():
+            raise RuntimeError(
+                'No se pudo leer el inventario para calcular el siguiente consecutivo. Intenta de nuevo.'
+            )
+
+    @staticmethod
+    def allocate(name: str, count: int = 1) -> int:
+        """
+        Reservar un bloque de números consecutivos
+
+        Args:
+            name: Nombre de la secuencia (PRODUCT_ID_SEQUENCE o codigo_sequence(prefijo))
+            count: Cantidad de números a reservar
+
+        Returns:
+            Primer número del bloque (el bloque es [n, n + count - 1])
+        """
+        count = max(1, int(count))
+        SequenceAllocator._ensure_seeded(name)
+        with local_store.transaction() as conn:
+            row = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()
+            current = int(row['value']) if row else 0
+            conn.execute(
+                "INSERT INTO sequences (name, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (name, current + count, time.time())
+            )
+        return current + 1
+
+    @staticmethod
+    def peek(name: str) -> int:
+        """Siguiente número que entregaría allocate() (sin reservarlo)"""
+        SequenceAllocator._ensure_seeded(name)
+        row = SequenceAllocator._conn().execute(
+            "SELECT value FROM sequences WHERE name = ?", (name,)
+        ).fetchone()
+        return (int(row['value']) if row else 0) + 1
+
+    @staticmethod
+    def high_water_marks() -> Dict[str, int]:
+        """Último número asignado u observado en la hoja, por secuencia"""
+        rows = SequenceAllocator._conn().execute(
+            "SELECT name, value FROM sequences ORDER BY name"
+        ).fetchall()
+        return {row['name']: int(row['value']) for row in rows}
+
+
+InventorySnapshot.subscribe(SequenceAllocator.observe_snapshot)
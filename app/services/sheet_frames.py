@@ -0,0 +1,43 @@
+"""
+Utilidades compartidas para hojas leídas como DataFrame: mapa de columnas
+normalizadas, fechas en texto libre y la huella de las filas ya procesadas
+que usan los agregados incrementales sobre hojas de solo agregado
+(histórico de movimientos e histórico de mantenimientos).
+"""
+import hashlib
+from typing import Dict, Optional
+
+import pandas as pd
+
+
+def columns_map(df: pd.DataFrame) -> Dict[str, str]:
+    """Nombre de columna en minúsculas y sin espacios -> nombre original"""
+    return {str(c).strip().lower(): c for c in df.columns}
+
+
+def parse_sheet_dates(series: pd.Series) -> pd.Series:
+    """Fechas de la hoja (texto libre) a datetime64 normalizado; inválidas -> NaT"""
+    parsed = pd.to_datetime(series.astype(str).str.strip(), errors='coerce', format='mixed', dayfirst=False)
+    return parsed.dt.normalize()
+
+
+def fingerprint(df: pd.DataFrame, rows: int) -> str:
+    """Huella de las primeras `rows` filas: cualquier edición o borrado en ellas la cambia"""
+    hashes = pd.util.hash_pandas_object(df.iloc[:rows].astype(str), index=False).to_numpy()
+    return hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()
+
+
+def first_pending_row(df: Optional[pd.DataFrame], processed: int, last_fingerprint: Optional[str]) -> int:
+    """
+    Primera fila por procesar en una actualización incremental.
+
+    Returns:
+        `processed` si las filas ya procesadas siguen iguales; 0 si alguna
+        cambió o desapareció (hay que reconstruir los agregados)
+    """
+    if not processed:
+        return 0
+    rows = 0 if df is None else len(df.index)
+    if rows < processed or fingerprint(df, processed) != last_fingerprint:
+        return 0
+    return processed
@@ -5,6 +5,9 @@ import pandas as pd
 import requests
 from typing import List, Dict, Optional
 from config import Config
+from app.services.inventory_snapshot import InventorySnapshot
+from app.services.request_metrics import RequestMetrics
+from app.services.sequence_allocator import SequenceAllocator, PRODUCT_ID_SEQUENCE, codigo_sequence
 
 
 class SheetsService:
@@ -30,7 +33,8 @@ class SheetsService:
         """
         Generar URL para descargar la hoja como CSV
         """
-        return f'https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}'
+        base = Config.GOOGLE_FAKE_URL.rstrip('/') if Config.GOOGLE_FAKE_URL else 'https://docs.google.com'
+        return f'{base}/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}'
     
     @staticmethod
     def read_google_sheet(sheet_url: str = None, gid: str = '0') -> pd.DataFrame:
@@ -56,12 +60,15 @@ class SheetsService:
         
         try:
             # Descargar el CSV
-            response = requests.get(csv_url, timeout=10)
-            response.raise_for_status()
+            with RequestMetrics.track('sheets_csv', resource=(sheet_id, str(gid))) as span:
+                response = requests.get(csv_url, timeout=10)
+                response.raise_for_status()
+                span['bytes'] = len(response.content)
             
             # Leer CSV en DataFrame
             from io import StringIO
-            df = pd.read_csv(StringIO(response.text))
+            with RequestMetrics.track('csv_parse'):
+                df = pd.read_csv(StringIO(response.text))
             
             # Limpiar nombres de columnas (eliminar espacios)
             df.columns = df.columns.str.strip()
@@ -87,6 +94,10 @@ class SheetsService:
         try:
             df = SheetsService.read_google_sheet(sheet_url)
             
+            # Publicar el snapshot para que los índices en memoria se reconstruyan
+            if sheet_url is None or sheet_url == Config.INVENTORY_SHEET_URL:
+                InventorySnapshot.publish(df)
+            
             # Convertir DataFrame a lista de diccionarios
             # Reemplazar NaN con None para JSON
             df = df.where(pd.notna(df), None)
@@ -118,13 +129,17 @@ class SheetsService:
     def get_next_product_id(sheet_url: str = None):
         """
         Obtener el siguiente ID consecutivo para un nuevo producto.
-        Lee el inventario, toma el máximo valor numérico de la columna ID y retorna max + 1.
-        Si no hay productos o no hay IDs numéricos, retorna 1.
+        Para el inventario configurado lo consulta en SequenceAllocator (sin
+        reservarlo; la reserva se hace con SequenceAllocator.allocate al crear).
+        Para otra hoja lee el inventario, toma el máximo valor numérico de la
+        columna ID y retorna max + 1. Si no hay IDs numéricos, retorna 1.
         
         Returns:
             int: Siguiente ID a asignar
         """
         try:
+            if sheet_url is None or sheet_url == Config.INVENTORY_SHEET_URL:
+                return SequenceAllocator.peek(PRODUCT_ID_SEQUENCE)
             data = SheetsService.get_inventory_data(sheet_url)
             if not data:
                 return 1
@@ -150,7 +165,8 @@ class SheetsService:
     def get_next_codigo_consecutivo(prefix: str, sheet_url: str = None) -> int:
         """
         Obtener el siguiente número consecutivo para un código con la abreviatura dada.
-        Busca en el inventario todos los valores de Codigo que empiecen con "PREFIX-"
+        Para el inventario configurado lo consulta en SequenceAllocator (sin reservarlo).
+        Para otra hoja busca todos los valores de Codigo que empiecen con "PREFIX-"
         (ej. RMEC-1, RMEC-2), extrae el número y retorna max + 1. Si no hay ninguno, retorna 1.
         
         Args:
@@ -162,10 +178,12 @@ class SheetsService:
         """
         import re
         try:
-            data = SheetsService.get_inventory_data(sheet_url)
             prefix_clean = str(prefix).strip().upper()
             if not prefix_clean:
                 return 1
+            if sheet_url is None or sheet_url == Config.INVENTORY_SHEET_URL:
+                return SequenceAllocator.peek(codigo_sequence(prefix_clean))
+            data = SheetsService.get_inventory_data(sheet_url)
             numbers = []
             code_keys = ['Codigo', 'codigo', 'Código', 'CODIGO', 'Codigo ']
             for item in data:
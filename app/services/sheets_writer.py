@@ -2,13 +2,19 @@
 Servicio para escribir datos en Google Sheets usando la API
 """
 import os
+import re
 import json
+import urllib.parse
 from datetime import datetime
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from config import Config
+from app.services.request_metrics import RequestMetrics
+from app.services.inventory_index import inventory_row_index, find_id_column, normalize_id
 
 
 # Scopes necesarios
@@ -60,6 +66,49 @@ def _load_token_from_backup() -> dict:
     return None
 
 
+class TrackedHttpRequest(HttpRequest):
+    """
+    Petición de la API de Google que registra tiempo, bytes enviados y errores
+    en RequestMetrics (categoría sheets_api o drive_api)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if Config.GOOGLE_FAKE_URL:
+            # googleapiclient arma la URL de subida con https aunque el endpoint sea http
+            fake = urllib.parse.urlparse(Config.GOOGLE_FAKE_URL)
+            parsed = urllib.parse.urlparse(self.uri)
+            if parsed.netloc == fake.netloc and parsed.scheme != fake.scheme:
+                self.uri = urllib.parse.urlunparse(parsed._replace(scheme=fake.scheme))
+
+    def execute(self, http=None, num_retries=0):
+        category = 'drive_api' if '/drive/' in self.uri else 'sheets_api'
+        # Las lecturas (GET) a la misma URL en una petición cuentan como repetidas
+        resource = self.uri if self.method == 'GET' else None
+        with RequestMetrics.track(category, resource=resource) as span:
+            span['bytes'] = len(self.body or b'')
+            return super().execute(http=http, num_retries=num_retries)
+
+
+# Ruta de cada API bajo GOOGLE_FAKE_URL (misma estructura que las URLs reales)
+_FAKE_API_PATHS = {
+    'sheets': 'sheets/',
+    'drive': 'drive/{version}/',
+}
+
+
+def build_service(api: str, version: str, creds):
+    """
+    Cliente de la API de Google con las llamadas instrumentadas. Con
+    GOOGLE_FAKE_URL apunta al servidor local de scripts/fake_google_server.py
+    """
+    if Config.GOOGLE_FAKE_URL:
+        endpoint = Config.GOOGLE_FAKE_URL.rstrip('/') + '/' + _FAKE_API_PATHS[api].format(version=version)
+        return build(api, version, credentials=creds, requestBuilder=TrackedHttpRequest,
+                     client_options={'api_endpoint': endpoint}, static_discovery=True)
+    return build(api, version, credentials=creds, requestBuilder=TrackedHttpRequest)
+
+
 def get_credentials():
     """
     Obtener credenciales de Google API con manejo automático de refresh.
@@ -77,6 +126,10 @@ def get_credentials():
     Raises:
         ValueError: Si no se puede obtener o refrescar el token
     """
+    # Servidor local de pruebas: no hay token que cargar ni refrescar
+    if Config.GOOGLE_FAKE_URL:
+        return AnonymousCredentials()
+    
     token_data = None
     
     # 1. Intentar desde variable de entorno (prioridad)
@@ -139,7 +192,12 @@ def get_credentials():
         if creds.expired and creds.refresh_token:
             try:
                 print("🔄 Token expirado, refrescando automáticamente...")
-                creds.refresh(Request())
+                try:
+                    creds.refresh(Request())
+                except Exception:
+                    RequestMetrics.increment('token_refresh', resultado='error')
+                    raise
+                RequestMetrics.increment('token_refresh', resultado='ok')
                 print("✅ Token refrescado exitosamente")
                 
                 # Guardar el token actualizado
@@ -188,11 +246,49 @@ def get_sheet_id_from_url(url: str) -> str:
     return url
 
 
+def column_letter(index: int) -> str:
+    """Convertir índice de columna 0-based a letra A1 (0 -> A, 25 -> Z, 26 -> AA)"""
+    result = ""
+    index += 1
+    while index > 0:
+        index, rem = divmod(index - 1, 26)
+        result = chr(65 + rem) + result
+    return result
+
+
+def row_from_updated_range(updated_range: str):
+    """Extraer la fila inicial de un rango A1 devuelto por la API (ej. 'Hoja 1!A120:L120' -> 120)"""
+    match = re.search(r'\$?[A-Z]+\$?(\d+)', str(updated_range or '').split('!')[-1])
+    return int(match.group(1)) if match else None
+
+
 class SheetsWriter:
     """
     Servicio para escribir en Google Sheets
     """
     
+    @staticmethod
+    def _history_values(data: dict, username: str) -> list:
+        """
+        Preparar los valores de una fila según las columnas del histórico
+        Columnas: Codigo, Referencia, Descripcion, Unidad-medida, cantidad, 
+        Ubicación, Stock-min, Estado, Metodo, FechaMovimiento, Usuario, UnidadesUtilizadas
+        """
+        return [
+            data.get('Codigo', ''),
+            data.get('Referencia', ''),
+            data.get('Descripcion', ''),
+            data.get('Unidad-medida', ''),
+            data.get('cantidad', ''),  # Stock final después del ajuste
+            data.get('Ubicación', ''),
+            data.get('Stock-min', ''),
+            data.get('Estado', ''),
+            data.get('Metodo', ''),  # 'Ingreso' o 'Salida'
+            data.get('FechaMovimiento') or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # FechaMovimiento
+            data.get('Usuario') or username,  # Usuario
+            data.get('UnidadesUtilizadas', ''),  # Unidades utilizadas (ajuste)
+        ]
+    
     @staticmethod
     def append_row_to_history(data: dict, username: str = 'Sistema') -> bool:
         """
@@ -205,32 +301,31 @@ class SheetsWriter:
         Returns:
             True si se agregó correctamente, False en caso contrario
         """
+        return SheetsWriter.append_rows_to_history([data], username)
+    
+    @staticmethod
+    def append_rows_to_history(rows: list, username: str = 'Sistema') -> bool:
+        """
+        Agregar varias filas al histórico de movimientos con una sola llamada append
+        
+        Args:
+            rows: Lista de diccionarios con los datos de cada movimiento. Cada uno
+                  puede traer 'FechaMovimiento' y 'Usuario' propios.
+            username: Usuario por defecto para las filas que no traen 'Usuario'
+        
+        Returns:
+            True si se agregaron correctamente, False en caso contrario
+        """
+        if not rows:
+            return True
         try:
             creds = get_credentials()
-            service = build('sheets', 'v4', credentials=creds)
+            service = build_service('sheets', 'v4', creds)
             
             sheet_id = get_sheet_id_from_url(Config.HISTORY_SHEET_URL)
             
-            # Preparar los valores de la fila según las columnas del histórico
-            # Columnas: Codigo, Referencia, Descripcion, Unidad-medida, cantidad, 
-            # Ubicación, Stock-min, Estado, Metodo, FechaMovimiento, Usuario, UnidadesUtilizadas
-            values = [
-                data.get('Codigo', ''),
-                data.get('Referencia', ''),
-                data.get('Descripcion', ''),
-                data.get('Unidad-medida', ''),
-                data.get('cantidad', ''),  # Stock final después del ajuste
-                data.get('Ubicación', ''),
-                data.get('Stock-min', ''),
-                data.get('Estado', ''),
-                data.get('Metodo', ''),  # 'Ingreso' o 'Salida'
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # FechaMovimiento
-                username,  # Usuario
-                data.get('UnidadesUtilizadas', ''),  # Unidades utilizadas (ajuste)
-            ]
-            
             body = {
-                'values': [values]
+                'values': [SheetsWriter._history_values(data, username) for data in rows]
             }
             
             result = service.spreadsheets().values().append(
@@ -274,60 +369,211 @@ class SheetsWriter:
             ID del producto creado o None si falló
         """
         try:
-            creds = get_credentials()
-            service = build('sheets', 'v4', credentials=creds)
-            
-            sheet_id = get_sheet_id_from_url(Config.INVENTORY_SHEET_URL)
-            
-            # Leer el sheet para obtener los headers
-            result = service.spreadsheets().values().get(
-                spreadsheetId=sheet_id,
-                range='A1:Z1'  # Solo la primera fila (headers)
-            ).execute()
-            
-            rows = result.get('values', [])
-            if not rows:
-                print("❌ No se encontraron headers en el sheet")
-                return None
-            
-            headers = [str(h).strip() for h in rows[0]]
-            
-            # Preparar valores en el orden de las columnas
-            values = []
-            for header in headers:
-                # Buscar el valor en product_data (case insensitive)
-                value = ''
-                for key, val in product_data.items():
-                    if str(key).strip().lower() == header.lower():
-                        value = str(val) if val is not None else ''
-                        break
-                values.append(value)
-            
-            # Agregar la nueva fila
-            body = {
-                'values': [values]
-            }
-            
-            result = service.spreadsheets().values().append(
-                spreadsheetId=sheet_id,
-                range='A:Z',
-                valueInputOption='RAW',
-                insertDataOption='INSERT_ROWS',
-                body=body
-            ).execute()
-            
-            if values and len(values) > 0:
-                product_id = values[0] if values[0] else None
-                return product_id
-            
-            return None
-            
+            created = SheetsWriter.append_products_to_inventory([product_data])
+            return created[0] if created else None
         except Exception as e:
             print(f"Error al crear producto: {e}")
             import traceback
             traceback.print_exc()
             return None
     
+    @staticmethod
+    def append_products_to_inventory(products: list) -> list:
+        """
+        Agregar productos al final del inventario con una sola llamada append
+        
+        Args:
+            products: Lista de diccionarios {campo: valor}; los campos se
+                      ubican por encabezado (sin distinguir mayúsculas)
+        
+        Returns:
+            Valor de la primera columna (ID) de cada fila agregada, en orden
+        
+        Raises:
+            Exception: Si la hoja no tiene encabezados o la API falla
+        """
+        if not products:
+            return []
+        
+        creds = get_credentials()
+        service = build_service('sheets', 'v4', creds)
+        
+        sheet_id = get_sheet_id_from_url(Config.INVENTORY_SHEET_URL)
+        
+        # Leer el sheet para obtener los headers
+        result = service.spreadsheets().values().get(
+            spreadsheetId=sheet_id,
+            range='A1:Z1'  # Solo la primera fila (headers)
+        ).execute()
+        
+        rows = result.get('values', [])
+        if not rows:
+            raise Exception("No se encontraron headers en el sheet")
+        
+        headers = [str(h).strip() for h in rows[0]]
+        
+        # Preparar valores en el orden de las columnas
+        body_values = []
+        for product_data in products:
+            lowered = {str(k).strip().lower(): v for k, v in product_data.items()}
+            body_values.append([
+                str(lowered[header.lower()]) if lowered.get(header.lower()) is not None else ''
+                for header in headers
+            ])
+        
+        # Agregar las nuevas filas
+        result = service.spreadsheets().values().append(
+            spreadsheetId=sheet_id,
+            range='A:Z',
+            valueInputOption='RAW',
+            insertDataOption='INSERT_ROWS',
+            body={'values': body_values}
+        ).execute()
+        
+        # Registrar la fila de cada producto nuevo en el índice de posiciones
+        id_col_index = find_id_column(headers)
+        first_row = row_from_updated_range(result.get('updates', {}).get('updatedRange'))
+        if id_col_index is not None and first_row:
+            for offset, values in enumerate(body_values):
+                inventory_row_index.record_append(values[id_col_index], first_row + offset)
+        
+        return [values[0] if values and values[0] else None for values in body_values]
+    
+    @staticmethod
+    def batch_update_products(updates: dict) -> list:
+        """
+        Actualizar varios productos del inventario con un único batchUpdate
+        
+        Las filas se resuelven con el índice de posiciones y se verifican todas
+        juntas (encabezados + celdas de ID) con un solo batchGet. Si alguna no
+        está indexada o no coincide, se relee el inventario una vez y se
+        reintenta solo para esas.
+        
+        Args:
+            updates: {product_id: {campo: valor}}
+        
+        Returns:
+            Lista de product_id escritos (los que no se encontraron quedan fuera)
+        """
+        if not updates:
+            return []
+        
+        creds = get_credentials()
+        service = build_service('sheets', 'v4', creds)
+        sheet_id = get_sheet_id_from_url(Config.INVENTORY_SHEET_URL)
+        
+        verified = {}
+        headers = []
+        pending = list(updates.keys())
+        for attempt in range(2):
+            if attempt == 1:
+                if not pending:
+                    break
+                # Refrescar el snapshot (reconstruye el índice) y reintentar los no resueltos
+                from app.services.sheets_service import SheetsService
+                SheetsService.get_inventory_data()
+            
+            id_col_index = inventory_row_index.id_col_index
+            rows = {pid: inventory_row_index.lookup(pid) for pid in pending}
+            candidates = [pid for pid in pending if rows[pid]]
+            if id_col_index is None or not candidates:
+                continue
+            
+            id_letter = column_letter(id_col_index)
+            result = service.spreadsheets().values().batchGet(
+                spreadsheetId=sheet_id,
+                ranges=['A1:Z1'] + [f'{id_letter}{rows[pid]}' for pid in candidates]
+            ).execute()
+            value_ranges = result.get('valueRanges', [])
+            header_values = value_ranges[0].get('values', [[]]) if value_ranges else [[]]
+            headers = [str(h).strip() for h in header_values[0]] if header_values else []
+            if find_id_column(headers) != id_col_index:
+                inventory_row_index.invalidate()
+                continue
+            
+            for pid, value_range in zip(candidates, value_ranges[1:]):
+                cell = value_range.get('values', [['']])
+                current_id = cell[0][0] if cell and cell[0] else ''
+                if normalize_id(current_id) == normalize_id(pid):
+                    verified[pid] = rows[pid]
+                else:
+                    inventory_row_index.invalidate(pid)
+            pending = [pid for pid in pending if pid not in verified]
+        
+        data = []
+        for pid, row_number in verified.items():
+            for idx, header in enumerate(headers):
+                header_normalized = header.lower().strip()
+                for key, value in updates[pid].items():
+                    if str(key).lower().strip() == header_normalized:
+                        data.append({
+                            'range': f'{column_letter(idx)}{row_number}',
+                            'values': [[str(value)]]
+                        })
+                        break
+        
+        if data:
+            service.spreadsheets().values().batchUpdate(
+                spreadsheetId=sheet_id,
+                body={'valueInputOption': 'RAW', 'data': data}
+            ).execute()
+        
+        if pending:
+            print(f"⚠️ No se encontraron en el inventario los productos: {', '.join(map(str, pending))}")
+        return list(verified.keys())
+    
+    @staticmethod
+    def _update_indexed_row(service, sheet_id: str, product_id: str, updated_data: dict) -> bool:
+        """
+        Actualizar un producto usando la fila registrada en el índice de posiciones
+        
+        Lee en una sola llamada la fila de encabezados y la celda de ID de la fila
+        indexada; si la celda no corresponde al producto (filas insertadas o
+        borradas desde otro lugar) no escribe nada. Luego actualiza solo las
+        celdas presentes en updated_data con un único batchUpdate.
+        
+        Returns:
+            True si se escribió; False si hay que recurrir a la lectura completa
+        """
+        row_number = inventory_row_index.lookup(product_id)
+        id_col_index = inventory_row_index.id_col_index
+        if not row_number or id_col_index is None:
+            return False
+        
+        id_cell = f'{column_letter(id_col_index)}{row_number}'
+        result = service.spreadsheets().values().batchGet(
+            spreadsheetId=sheet_id,
+            ranges=['A1:Z1', id_cell]
+        ).execute()
+        value_ranges = result.get('valueRanges', [])
+        header_values = value_ranges[0].get('values', [[]]) if value_ranges else [[]]
+        id_values = value_ranges[1].get('values', [['']]) if len(value_ranges) > 1 else [['']]
+        headers = [str(h).strip() for h in header_values[0]] if header_values else []
+        current_id = id_values[0][0] if id_values and id_values[0] else ''
+        
+        if find_id_column(headers) != id_col_index or normalize_id(current_id) != normalize_id(product_id):
+            print(f"⚠️ Índice de filas desactualizado para el producto '{product_id}' (fila {row_number}); se relee la hoja")
+            inventory_row_index.invalidate(product_id)
+            return False
+        
+        data = []
+        for idx, header in enumerate(headers):
+            header_normalized = header.lower().strip()
+            for key, value in updated_data.items():
+                if str(key).lower().strip() == header_normalized:
+                    data.append({
+                        'range': f'{column_letter(idx)}{row_number}',
+                        'values': [[str(value)]]
+                    })
+                    break
+        
+        if data:
+            service.spreadsheets().values().batchUpdate(
+                spreadsheetId=sheet_id,
+                body={'valueInputOption': 'RAW', 'data': data}
+            ).execute()
+        return True
+    
     @staticmethod
     def update_product_in_inventory(product_id: str, updated_data: dict) -> bool:
         """
@@ -342,10 +588,14 @@ class SheetsWriter:
         """
         try:
             creds = get_credentials()
-            service = build('sheets', 'v4', credentials=creds)
+            service = build_service('sheets', 'v4', creds)
             
             sheet_id = get_sheet_id_from_url(Config.INVENTORY_SHEET_URL)
             
+            # Camino rápido: fila conocida por el índice, escritura solo de las celdas cambiadas
+            if SheetsWriter._update_indexed_row(service, sheet_id, product_id, updated_data):
+                return True
+            
             # Leer el sheet para encontrar la fila del producto
             result = service.spreadsheets().values().get(
                 spreadsheetId=sheet_id,
@@ -360,34 +610,10 @@ class SheetsWriter:
             headers = [str(h).strip() for h in rows[0]]
             
             # Buscar la fila del producto
-            # Buscar en la columna 'id' o primera columna
             row_index = None
-            id_col_index = None
             
             # Buscar columna de ID (prioridad: primera columna si es 'ID', luego 'id', luego 'codigo'/'código')
-            id_col_index = None
-            
-            if len(headers) > 0 and str(headers[0]).strip() == 'ID':
-                id_col_index = 0
-            else:
-                for idx, header in enumerate(headers):
-                    header_lower = str(header).strip().lower()
-                    if header_lower == 'id':
-                        id_col_index = idx
-                        break
-                
-                if id_col_index is None:
-                    for idx, header in enumerate(headers):
-                        if str(header).strip() == 'ID':
-                            id_col_index = idx
-                            break
-                
-                if id_col_index is None:
-                    for idx, header in enumerate(headers):
-                        header_lower = str(header).strip().lower()
-                        if header_lower in ['codigo', 'código']:
-                            id_col_index = idx
-                            break
+            id_col_index = find_id_column(headers)
             
             if id_col_index is None:
                 print(f"Error: No se encontró columna de ID en el Google Sheet")
@@ -395,6 +621,12 @@ class SheetsWriter:
             else:
                 product_id_str = str(product_id).strip()
                 
+                # Aprovechar la lectura completa para reconstruir el índice de filas
+                inventory_row_index.rebuild(
+                    headers,
+                    [row[id_col_index] if len(row) > id_col_index else '' for row in rows[1:]]
+                )
+                
                 for i, row in enumerate(rows[1:], start=2):
                     if len(row) > id_col_index:
                         row_id = str(row[id_col_index]).strip()
@@ -0,0 +1,186 @@
+"""
+Índice de trigramas para encontrar referencias y códigos aproximados.
+
+Los valores se comparan sin tildes, mayúsculas ni separadores
+(604-2RS1-C3GJN = 6042rs1c3gjn), así que un guion faltante no cuenta como
+diferencia, y dos caracteres transpuestos solo cambian algunos trigramas.
+La similitud es el coeficiente de Dice entre los conjuntos de trigramas.
+
+Para acotar la latencia en catálogos grandes, los candidatos se toman de
+los trigramas más raros de la consulta hasta MAX_CANDIDATES y solo esos se
+puntúan; los trigramas muy frecuentes no se recorren.
+"""
+import re
+import threading
+from itertools import islice
+from typing import Dict, FrozenSet, List, Set
+
+import pandas as pd
+
+from app.services.inventory_index import find_id_column, normalize_id
+from app.services.inventory_snapshot import InventorySnapshot
+from app.services.search_index import fold
+
+
+MATCH_FIELDS = {
+    'Codigo': ['codigo', 'código'],
+    'Referencia': ['referencia'],
+}
+DISPLAY_FIELDS = {
+    'Descripcion': ['descripcion', 'descripción'],
+}
+MAX_CANDIDATES = 2000
+MIN_SIMILARITY = 0.3
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def compact(value) -> str:
+    """Texto sin tildes, mayúsculas ni separadores (604-2RS1 -> 6042rs1)"""
+    return _NON_ALNUM.sub('', fold(value))
+
+
+def trigrams(value: str) -> FrozenSet[str]:
+    """Trigramas del texto compacto, con relleno para dar peso a inicio y fin"""
+    if not value:
+        return frozenset()
+    padded = f'  {value} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _adjacent_swap(a: str, b: str) -> bool:
+    """True si b es a con un único par de caracteres vecinos intercambiado"""
+    if len(a) != len(b):
+        return False
+    diff = [i for i in range(len(a)) if a[i] != b[i]]
+    return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+
+
+class TrigramIndex:
+    """
+    Trigrama -> IDs de producto, más los trigramas de cada valor indexado
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Set[str]] = {}
+        # ID -> {campo: (valor original, valor compacto, trigramas)}
+        self._entries: Dict[str, Dict[str, tuple]] = {}
+        # ID -> fila (ID, campos comparados, campos extra) en el orden de _columns
+        self._display: Dict[str, tuple] = {}
+        self._columns: List[str] = []
+        self._keys: Dict[str, tuple] = {}
+        self._built = False
+
+    def _remove(self, doc_id: str) -> None:
+        for _, _, grams in self._entries.pop(doc_id, {}).values():
+            for gram in grams:
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.discard(doc_id)
+                    if not posting:
+                        del self._postings[gram]
+        self._display.pop(doc_id, None)
+        self._keys.pop(doc_id, None)
+
+    def _add(self, doc_id: str, values: Dict[str, str], display: tuple, key: tuple) -> None:
+        entries = {}
+        for field, value in values.items():
+            text = compact(value)
+            if not text:
+                continue
+            grams = trigrams(text)
+            entries[field] = (value, text, grams)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(doc_id)
+        self._entries[doc_id] = entries
+        self._display[doc_id] = display
+        self._keys[doc_id] = key
+
+    def build_from_dataframe(self, df: pd.DataFrame) -> None:
+        """Listener de InventorySnapshot: reindexar solo lo que cambió"""
+        if df is None:
+            return
+        cols = {str(c).strip().lower(): c for c in df.columns}
+        id_idx = find_id_column([str(c) for c in df.columns])
+        if id_idx is None:
+            return
+
+        frame = pd.DataFrame({'ID': df.iloc[:, id_idx].map(normalize_id)})
+        for name, candidates in list(MATCH_FIELDS.items()) + list(DISPLAY_FIELDS.items()):
+            column = next((cols[n] for n in candidates if n in cols), None)
+            frame[name] = df[column].fillna('').astype(str).str.strip() if column is not None else ''
+        frame = frame[frame['ID'].ne('')].drop_duplicates('ID', keep='first')
+
+        match_fields = list(MATCH_FIELDS)
+        columns = list(frame.columns)
+        key_slice = slice(1, 1 + len(match_fields))
+        with self._lock:
+            self._columns = columns
+            current: Set[str] = set()
+            for row in zip(*(frame[c].tolist() for c in columns)):
+                doc_id = row[0]
+                current.add(doc_id)
+                key = row[key_slice]
+                if self._keys.get(doc_id) == key:
+                    self._display[doc_id] = row
+                    continue
+                self._remove(doc_id)
+                self._add(doc_id, dict(zip(match_fields, key)), row, key)
+            for doc_id in set(self._keys) - current:
+                self._remove(doc_id)
+            self._built = True
+
+    def suggest(self, query: str, limit: int = 10, min_similarity: float = MIN_SIMILARITY) -> List[Dict]:
+        """
+        Productos cuyo Codigo o Referencia se parece a la consulta, del más al
+        menos parecido. Cada resultado indica el campo y el valor coincidente.
+        """
+        text = compact(query)
+        grams = trigrams(text)
+        if not grams:
+            return []
+        with self._lock:
+            # Candidatos desde los trigramas más raros (los más selectivos)
+            ordered = sorted((len(self._postings[g]), g) for g in grams if g in self._postings)
+            candidates: Set[str] = set()
+            for size, gram in ordered:
+                if len(candidates) >= MAX_CANDIDATES:
+                    break
+                posting = self._postings[gram]
+                if size > MAX_CANDIDATES:
+                    # Los trigramas que siguen son todavía más frecuentes
+                    candidates.update(islice(posting, MAX_CANDIDATES - len(candidates)))
+                    break
+                candidates.update(posting)
+
+            scored = []
+            for doc_id in candidates:
+                best = None
+                for field, (value, value_text, value_grams) in self._entries.get(doc_id, {}).items():
+                    if value_text == text:
+                        similarity = 1.0
+                    else:
+                        similarity = 2 * len(grams & value_grams) / (len(grams) + len(value_grams))
+                        # Dos caracteres vecinos intercambiados (error de digitación típico)
+                        if _adjacent_swap(value_text, text):
+                            similarity = max(similarity, 0.9)
+                    if best is None or similarity > best[0]:
+                        best = (similarity, field, value)
+                if best and best[0] >= min_similarity:
+                    scored.append((best, doc_id))
+            scored.sort(key=lambda item: (-item[0][0], item[1]))
+            return [
+                dict(zip(self._columns, self._display[doc_id]), campo=field, coincidencia=value, similitud=round(similarity, 3))
+                for (similarity, field, value), doc_id in scored[:max(int(limit), 1)]
+            ]
+
+    def is_built(self) -> bool:
+        return self._built
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+reference_trigram_index = TrigramIndex()
+InventorySnapshot.subscribe(reference_trigram_index.build_from_dataframe)
@@ -28,6 +28,10 @@ class Config:
     # ID de la pestaña/hoja para usuarios (gid)
     USERS_SHEET_GID = os.environ.get('USERS_SHEET_GID', '0')
     
+    # Segundos que la sesión reutiliza la lista de usuarios antes de releer la hoja
+    # (el login siempre la lee)
+    USERS_CACHE_SECONDS = int(os.environ.get('USERS_CACHE_SECONDS', '60'))
+    
     # Columnas del Excel de usuarios
     USERS_COLUMN_USERNAME = os.environ.get('USERS_COLUMN_USERNAME', 'User')
     USERS_COLUMN_PASSWORD = os.environ.get('USERS_COLUMN_PASSWORD', 'pass')
@@ -62,6 +66,79 @@ class Config:
         'https://docs.google.com/spreadsheets/d/1ESHSvtxnbgpzbGBppkC2z82-MIC26-RcLbudSIKOqMo/edit?usp=sharing'
     )
 
+    # Segundos que se conservan en caché los encabezados y metadatos de las hojas CMMS
+    MAINTENANCE_METADATA_TTL_SECONDS = int(os.environ.get('MAINTENANCE_METADATA_TTL_SECONDS', '600'))
+
+    # Servidor local que imita Google Sheets/Drive (scripts/fake_google_server.py),
+    # ej. http://127.0.0.1:8765. Vacío: se usan los servicios reales de Google
+    GOOGLE_FAKE_URL = os.environ.get('GOOGLE_FAKE_URL', '')
+
+    # Base de datos local (SQLite en modo WAL) para estado compartido entre workers
+    LOCAL_STATE_DB = os.environ.get('LOCAL_STATE_DB', os.path.join('instance', 'convexa_state.db'))
+
+    # Diario de movimientos de stock: los movimientos se confirman al guardarse
+    # en LOCAL_STATE_DB y se aplican a Google Sheets en lotes en segundo plano
+    MOVEMENT_JOURNAL_ENABLED = os.environ.get('MOVEMENT_JOURNAL_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    MOVEMENT_JOURNAL_FLUSH_SECONDS = float(os.environ.get('MOVEMENT_JOURNAL_FLUSH_SECONDS', '3'))
+    MOVEMENT_JOURNAL_BATCH_SIZE = int(os.environ.get('MOVEMENT_JOURNAL_BATCH_SIZE', '200'))
+    MOVEMENT_JOURNAL_LEASE_SECONDS = int(os.environ.get('MOVEMENT_JOURNAL_LEASE_SECONDS', '120'))
+    # Intentos por movimiento antes de marcarlo como fallido y segundos que el
+    # export CSV puede tardar en reflejar un lote ya escrito con la API
+    MOVEMENT_JOURNAL_MAX_ATTEMPTS = int(os.environ.get('MOVEMENT_JOURNAL_MAX_ATTEMPTS', '10'))
+    MOVEMENT_JOURNAL_EXPORT_LAG_SECONDS = float(os.environ.get('MOVEMENT_JOURNAL_EXPORT_LAG_SECONDS', '60'))
+
+    # Lista de reposición: días de entrega del proveedor (se repone si el stock
+    # llega a Stock-min antes) y días de consumo que debe cubrir el pedido
+    REORDER_LEAD_TIME_DAYS = int(os.environ.get('REORDER_LEAD_TIME_DAYS', '7'))
+    REORDER_COVER_DAYS = int(os.environ.get('REORDER_COVER_DAYS', '30'))
+
+    # Importación masiva de productos (filas por archivo) y cola de QR en segundo
+    # plano: reintentos por QR y segundos entre revisiones de la cola
+    PRODUCT_IMPORT_MAX_ROWS = int(os.environ.get('PRODUCT_IMPORT_MAX_ROWS', '5000'))
+    QR_QUEUE_MAX_ATTEMPTS = int(os.environ.get('QR_QUEUE_MAX_ATTEMPTS', '5'))
+    QR_QUEUE_POLL_SECONDS = float(os.environ.get('QR_QUEUE_POLL_SECONDS', '30'))
+
+    # Tiempos por petición: encabezado Server-Timing con el desglose de llamadas a
+    # Google (CSV, Sheets API, Drive) e histogramas por endpoint
+    REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+    # Presupuesto de llamadas a Google por ruta (@call_budget): 'warn' registra una
+    # advertencia al excederlo, 'raise' lanza CallBudgetExceeded (siempre en pruebas), 'off'
+    CALL_BUDGET_MODE = os.environ.get('CALL_BUDGET_MODE', 'warn')
+
+    # /metrics (formato Prometheus): segundos entre volcados de cada worker a
+    # LOCAL_STATE_DB y token opcional (Authorization: Bearer <token>)
+    METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '15'))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+    # Vista de escaneo de QR: segundos que se sirve el snapshot del inventario
+    # antes de volver a leer la hoja
+    SCAN_SNAPSHOT_MAX_AGE_SECONDS = int(os.environ.get('SCAN_SNAPSHOT_MAX_AGE_SECONDS', '120'))
+
+    # KPIs del tablero CMMS materializados en LOCAL_STATE_DB: cada cuánto se
+    # reconcilian contra un recuento completo (0 desactiva) y cuántos segundos
+    # un snapshot de la hoja no sobrescribe un contador recién actualizado
+    MAINTENANCE_KPI_RECONCILE_SECONDS = int(os.environ.get('MAINTENANCE_KPI_RECONCILE_SECONDS', '900'))
+    MAINTENANCE_KPI_SNAPSHOT_GRACE_SECONDS = int(os.environ.get('MAINTENANCE_KPI_SNAPSHOT_GRACE_SECONDS', '60'))
+
+    # Días hacia adelante que cubre la planificación preventiva de activos
+    MAINTENANCE_PLANNING_HORIZON_DAYS = int(os.environ.get('MAINTENANCE_PLANNING_HORIZON_DAYS', '30'))
+
+    # Días de atraso sobre fecha_programada que aún cuentan como ejecución a tiempo
+    MAINTENANCE_ON_TIME_TOLERANCE_DAYS = int(os.environ.get('MAINTENANCE_ON_TIME_TOLERANCE_DAYS', '0'))
+
+    # Programador de tareas recurrentes (expresiones cron de 5 campos, hora local
+    # del servidor; vacío desactiva la tarea). Solo un worker ejecuta las tareas
+    # globales: el que obtiene el bloqueo de SCHEDULER_LOCK_FILE
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE', os.path.join('instance', 'scheduler.lock'))
+    SCHEDULE_PREVENTIVE_PLANNING = os.environ.get('SCHEDULE_PREVENTIVE_PLANNING', '0 2 * * *')
+    SCHEDULE_KPI_RECONCILE = os.environ.get('SCHEDULE_KPI_RECONCILE', '*/15 * * * *')
+    SCHEDULE_CACHE_WARMUP = os.environ.get('SCHEDULE_CACHE_WARMUP', '30 5 * * 1-6')
+    # Resumen de stock bajo (desactivado por defecto) y webhook opcional que recibe el JSON
+    SCHEDULE_LOW_STOCK_DIGEST = os.environ.get('SCHEDULE_LOW_STOCK_DIGEST', '')
+    LOW_STOCK_DIGEST_WEBHOOK = os.environ.get('LOW_STOCK_DIGEST_WEBHOOK', '')
+
 
 class DevelopmentConfig(Config):
     """Configuración para desarrollo"""
@@ -0,0 +1,465 @@
+"""
+Benchmark de las rutas principales con inventarios sintéticos.
+
+Por cada tamaño de inventario genera datos sintéticos (productos, histórico
+de movimientos y hojas CMMS), levanta scripts/fake_google_server.py con esos
+datos y, en un proceso nuevo (cachés y memoria limpias), ejecuta las rutas:
+dashboard.index, product.detail GET/POST, product.create GET/POST,
+maintenance.dashboard y las páginas de sección CMMS. Informa por ruta p50/p95,
+llamadas externas por petición (del encabezado Server-Timing) frente al
+presupuesto de @call_budget, y memoria pico por petición (tracemalloc, medida
+en una petición aparte para no alterar los tiempos).
+
+Uso:
+    python scripts/benchmark_routes.py --tamanos 1000,10000,100000 --iteraciones 20
+    python scripts/benchmark_routes.py --latencia-ms 120 --salida instance/benchmarks/base.json
+    python scripts/benchmark_routes.py --comparar instance/benchmarks/base.json instance/benchmarks/nuevo.json
+    python scripts/benchmark_routes.py --solo-fixtures fixtures/ --tamanos 5000
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Agregar el directorio raíz al path
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+import requests
+
+
+BENCH_USER = 'admin'
+BENCH_PASSWORD = 'benchmark'
+
+EXTERNAL_CATEGORIES = ('sheets_csv', 'sheets_api', 'drive_api')
+SERVER_TIMING_RE = re.compile(r'(\w+);dur=([\d.]+);desc="(\d+) llamada')
+
+CODIGOS = ['RMEC', 'RELE', 'RHID', 'RNEU', 'INS', 'HER']
+UNIDADES = ['Unidad', 'Metro', 'Kilogramo', 'Litro', 'Caja']
+ESTADOS_MTTO = ['PROGRAMADO', 'PENDIENTE', 'EN_PROCESO', 'HECHO', 'REPROGRAMADO']
+
+
+# -- Datos sintéticos -------------------------------------------------------
+
+def synthetic_dataset(products: int, movements_per_product: float = 3, seed: int = 42) -> Dict[str, List[List]]:
+    """
+    Filas (encabezado incluido) de cada hoja para un inventario de products
+    productos. Las hojas CMMS escalan con el inventario: una máquina por cada
+    100 productos (mínimo 10), 3 activos por máquina y 4 mantenimientos y
+    8 registros históricos por activo.
+    """
+    from config import Config
+
+    rnd = random.Random(seed)
+    today = date.today()
+
+    inventory = [['ID', 'Codigo', 'Referencia', 'Descripcion', 'Unidad-medida', 'cantidad',
+                  'Ubicación', 'Stock-min', 'Estado']]
+    consecutivos = {codigo: 0 for codigo in CODIGOS}
+    for product_id in range(1, products + 1):
+        codigo = rnd.choice(CODIGOS)
+        consecutivos[codigo] += 1
+        inventory.append([
+            product_id,
+            f'{codigo}-{consecutivos[codigo]}',
+            f'{rnd.randint(600, 9999)}-{rnd.choice(["2RS1", "ZZ", "C3", "NR", "K"])}-{product_id:06d}',
+            f'Repuesto {codigo.lower()} {product_id}',
+            rnd.choice(UNIDADES),
+            rnd.randint(0, 200),
+            f'Estante {rnd.choice("ABCDEFGH")}{rnd.randint(1, 20)}',
+            rnd.randint(1, 20),
+            'Activo',
+        ])
+
+    history = [['Codigo', 'Referencia', 'Descripcion', 'Unidad-medida', 'cantidad', 'Ubicación',
+                'Stock-min', 'Estado', 'Metodo', 'FechaMovimiento', 'Usuario', 'UnidadesUtilizadas']]
+    for _ in range(int(products * movements_per_product)):
+        row = inventory[rnd.randint(1, products)]
+        moment = datetime.now() - timedelta(days=rnd.randint(0, 365), minutes=rnd.randint(0, 1440))
+        history.append(row[1:9] + [
+            rnd.choice(['Ingreso', 'Salida', 'Salida']),
+            moment.strftime('%Y-%m-%d %H:%M:%S'),
+            rnd.choice(['admin', 'bodega1', 'bodega2']),
+            rnd.randint(1, 10),
+        ])
+
+    machines = max(10, products // 100)
+    maquinas = [['id_maquina', 'nombre', 'ubicacion', 'responsable', 'estado', 'fecha_creacion', 'fecha_actualizacion']]
+    activos = [['id_activo', 'id_maquina', 'nombre', 'actividad', 'tecnico', 'frecuencia_dias',
+                'ultima_fecha', 'proxima_fecha', 'fecha_creacion', 'fecha_actualizacion']]
+    mantenimientos = [['id_mtto', 'id_activo', 'id_maquina', 'actividad', 'tecnico', 'estado',
+                       'fecha_programada', 'fecha_ejecucion', 'fecha_creacion', 'fecha_actualizacion']]
+    historico_mttos = [['id_hist', 'id_mtto', 'id_activo', 'id_maquina', 'actividad', 'tecnico', 'estado',
+                        'fecha_programada', 'fecha_ejecucion', 'fecha_cierre', 'cerrado_por']]
+    creado = (today - timedelta(days=400)).isoformat()
+    for m in range(1, machines + 1):
+        id_maquina = f'MAQ-{m}'
+        maquinas.append([id_maquina, f'Máquina {m}', f'Planta {rnd.randint(1, 3)}',
+                         rnd.choice(['juan', 'oscar', 'daniel']), 'OPERATIVA', creado, creado])
+        for a in range(1, 4):
+            id_activo = f'ACT-{m}-{a}'
+            frecuencia = rnd.choice([7, 15, 30, 90])
+            ultima = today - timedelta(days=rnd.randint(0, frecuencia))
+            actividad = rnd.choice(['Lubricación', 'Inspección', 'Cambio de filtro', 'Calibración'])
+            tecnico = rnd.choice(['tec1', 'tec2', 'tec3'])
+            activos.append([id_activo, id_maquina, f'Componente {a}', actividad, tecnico, frecuencia,
+                            ultima.isoformat(), (ultima + timedelta(days=frecuencia)).isoformat(), creado, creado])
+            for k in range(4):
+                programada = ultima + timedelta(days=frecuencia * (k + 1))
+                mantenimientos.append([f'MT-{m}-{a}-{k}', id_activo, id_maquina, actividad, tecnico,
+                                       rnd.choice(ESTADOS_MTTO), programada.isoformat(), '', creado, creado])
+            for k in range(8):
+                programada = ultima - timedelta(days=frecuencia * (k + 1))
+                ejecutada = programada + timedelta(days=rnd.randint(0, 3))
+                historico_mttos.append([f'HI-{m}-{a}-{k}', f'MT-{m}-{a}-H{k}', id_activo, id_maquina, actividad,
+                                        tecnico, 'HECHO', programada.isoformat(), ejecutada.isoformat(),
+                                        ejecutada.isoformat() + ' 17:00:00', 'admin'])
+
+    return {
+        'inventario': inventory,
+        'historico': history,
+        'usuarios': [[Config.USERS_COLUMN_USERNAME, Config.USERS_COLUMN_PASSWORD], [BENCH_USER, BENCH_PASSWORD]],
+        'unidades': [['Unidad']] + [[u] for u in UNIDADES],
+        'maquinas': maquinas,
+        'activos': activos,
+        'mantenimientos': mantenimientos,
+        'historico_mantenimientos': historico_mttos,
+    }
+
+
+def write_fixtures(dataset: Dict[str, List[List]], directory: str) -> None:
+    """Escribir cada hoja como <rol>.csv (formato de fake_google_server.py)"""
+    os.makedirs(directory, exist_ok=True)
+    for name, rows in dataset.items():
+        with open(os.path.join(directory, f'{name}.csv'), 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(rows)
+
+
+# -- Servidor local de Google -------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_server(fixtures_dir: str, latency_ms: float = 0, jitter_ms: float = 0,
+                      error_rate: float = 0, timeout: float = 120):
+    """
+    Levantar fake_google_server.py en otro proceso (su memoria y CPU no se
+    mezclan con las de la aplicación medida)
+
+    Returns:
+        (proceso, URL base)
+    """
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).parent / 'fake_google_server.py'),
+         '--port', str(port), '--fixtures', fixtures_dir, '--latency-ms', str(latency_ms),
+         '--jitter-ms', str(jitter_ms), '--error-rate', str(error_rate)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('El servidor local de Google terminó al iniciar')
+        try:
+            requests.get(f'{url}/_fake/stats', timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('El servidor local de Google no respondió a tiempo')
+
+
+def fake_calls(url: str) -> Dict[str, int]:
+    return requests.get(f'{url}/_fake/stats', timeout=10).json()['llamadas']
+
+
+# -- Medición ---------------------------------------------------------------
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentil por rango más cercano (q entre 0 y 1)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 2)
+
+
+def external_calls(server_timing: str) -> Dict[str, int]:
+    """Llamadas por categoría informadas en el encabezado Server-Timing"""
+    return {
+        category: int(count)
+        for category, _, count in SERVER_TIMING_RE.findall(server_timing or '')
+        if category in EXTERNAL_CATEGORIES
+    }
+
+
+def scenarios(dataset: Dict[str, List[List]], rnd: random.Random) -> List[Dict]:
+    """Rutas a medir: nombre, endpoint (para el presupuesto), método, ruta y formulario"""
+    product_ids = [row[0] for row in dataset['inventario'][1:]]
+
+    def new_product():
+        return {
+            'codigo_abrev': rnd.choice(CODIGOS), 'Referencia': f'BENCH-{rnd.randint(0, 10 ** 9)}',
+            'Descripcion': 'Producto de benchmark', 'Unidad-medida': 'Unidad', 'cantidad': '5',
+            'Ubicación': 'Estante Z1', 'Stock-min': '1', 'Estado': 'Activo',
+        }
+
+    return [
+        {'nombre': 'dashboard.index', 'endpoint': 'dashboard.index', 'metodo': 'GET', 'ruta': lambda: '/dashboard'},
+        {'nombre': 'product.detail GET', 'endpoint': 'product.detail', 'metodo': 'GET',
+         'ruta': lambda: f'/product/detail/{rnd.choice(product_ids)}'},
+        {'nombre': 'product.detail POST', 'endpoint': 'product.detail', 'metodo': 'POST',
+         'ruta': lambda: f'/product/detail/{rnd.choice(product_ids)}',
+         'datos': lambda: {'tipo_movimiento': 'ingreso', 'unidades': str(rnd.randint(1, 5))}},
+        {'nombre': 'product.create GET', 'endpoint': 'product.create', 'metodo': 'GET', 'ruta': lambda: '/product/create'},
+        {'nombre': 'product.create POST', 'endpoint': 'product.create', 'metodo': 'POST',
+         'ruta': lambda: '/product/create', 'datos': new_product},
+        {'nombre': 'maintenance.dashboard', 'endpoint': 'maintenance.dashboard', 'metodo': 'GET',
+         'ruta': lambda: '/mantenimiento/'},
+        {'nombre': 'maintenance.maquinas', 'endpoint': 'maintenance.maquinas', 'metodo': 'GET',
+         'ruta': lambda: '/mantenimiento/maquinas'},
+        {'nombre': 'maintenance.activos', 'endpoint': 'maintenance.activos', 'metodo': 'GET',
+         'ruta': lambda: '/mantenimiento/activos'},
+        {'nombre': 'maintenance.mantenimientos', 'endpoint': 'maintenance.mantenimientos', 'metodo': 'GET',
+         'ruta': lambda: '/mantenimiento/mantenimientos'},
+        {'nombre': 'maintenance.historico', 'endpoint': 'maintenance.historico', 'metodo': 'GET',
+         'ruta': lambda: '/mantenimiento/historico'},
+    ]
+
+
+def _request(client, scenario: Dict):
+    path = scenario['ruta']()
+    data = scenario['datos']() if 'datos' in scenario else None
+    started = time.perf_counter()
+    if scenario['metodo'] == 'POST':
+        response = client.post(path, data=data)
+    else:
+        response = client.get(path)
+    ms = (time.perf_counter() - started) * 1000
+    response.close()
+    return response, ms
+
+
+def benchmark_size(products: int, iterations: int, movements_per_product: float, seed: int) -> Dict:
+    """
+    Medir todas las rutas con un inventario de products productos. Se ejecuta
+    en un proceso propio con GOOGLE_FAKE_URL apuntando al servidor local.
+    """
+    from app import create_app
+    from app.services.call_budget import CallBudget
+
+    rnd = random.Random(seed)
+    dataset = synthetic_dataset(products, movements_per_product, seed)
+    url = os.environ['GOOGLE_FAKE_URL']
+
+    app = create_app()
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    client = app.test_client()
+    login = client.post('/auth/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+    if login.status_code != 302:
+        raise RuntimeError(f'No se pudo iniciar sesión con el usuario de benchmark ({login.status_code})')
+
+    routes = {}
+    for scenario in scenarios(dataset, rnd):
+        calls_before = fake_calls(url)
+
+        # Primera petición (cachés frías para esta ruta) aparte de las medidas
+        response, first_ms = _request(client, scenario)
+        timings, statuses, calls = [], {}, []
+        for _ in range(iterations):
+            response, ms = _request(client, scenario)
+            timings.append(ms)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            calls.append(sum(external_calls(response.headers.get('Server-Timing')).values()))
+
+        # Memoria pico de una petición adicional (tracemalloc agrega sobrecosto a los tiempos)
+        tracemalloc.start()
+        _request(client, scenario)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        calls_after = fake_calls(url)
+        backend_ops = {
+            op: calls_after[op] - calls_before.get(op, 0)
+            for op in calls_after if calls_after[op] - calls_before.get(op, 0)
+        }
+        budget = CallBudget.budget_for_endpoint(app, scenario['endpoint'])
+        errors = sum(count for status, count in statuses.items() if status >= 500)
+        routes[scenario['nombre']] = {
+            'primera_ms': round(first_ms, 2),
+            'p50_ms': percentile(timings, 0.50),
+            'p95_ms': percentile(timings, 0.95),
+            'max_ms': round(max(timings), 2) if timings else None,
+            'codigos': {str(k): v for k, v in sorted(statuses.items())},
+            'errores': errors,
+            'llamadas_externas_promedio': round(sum(calls) / len(calls), 2) if calls else 0,
+            'llamadas_externas_max': max(calls) if calls else 0,
+            'presupuesto': budget,
+            'excede_presupuesto': budget is not None and bool(calls) and max(calls) > budget,
+            'operaciones_google': dict(sorted(backend_ops.items())),
+            'memoria_pico_mb': round(peak / 1024 / 1024, 2),
+        }
+        print(f"  {scenario['nombre']:<28} p50 {routes[scenario['nombre']]['p50_ms']:>9} ms  "
+              f"p95 {routes[scenario['nombre']]['p95_ms']:>9} ms  llamadas {routes[scenario['nombre']]['llamadas_externas_max']}"
+              f"  memoria {routes[scenario['nombre']]['memoria_pico_mb']} MB"
+              + (f'  ⚠️ {errors} errores' if errors else ''), file=sys.stderr)
+
+    result = {
+        'productos': products,
+        'filas': {name: len(rows) - 1 for name, rows in dataset.items()},
+        'rutas': routes,
+    }
+    try:
+        import resource
+        # ru_maxrss está en KB en Linux
+        result['memoria_max_proceso_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        pass
+    return result
+
+
+def run_size_in_subprocess(products: int, args) -> Dict:
+    """Generar fixtures, levantar el servidor local y medir en un proceso nuevo"""
+    with tempfile.TemporaryDirectory(prefix='convexa_bench_') as workdir:
+        fixtures = os.path.join(workdir, 'fixtures')
+        write_fixtures(synthetic_dataset(products, args.movimientos_por_producto, args.semilla), fixtures)
+        fake, url = start_fake_server(fixtures, args.latencia_ms, args.variacion_ms)
+        try:
+            output = os.path.join(workdir, 'resultado.json')
+            env = {
+                **os.environ,
+                'GOOGLE_FAKE_URL': url,
+                'LOCAL_STATE_DB': os.path.join(workdir, 'state.db'),
+                'CALL_BUDGET_MODE': 'off',
+                'REQUEST_METRICS_ENABLED': 'true',
+                'MOVEMENT_JOURNAL_ENABLED': os.environ.get('MOVEMENT_JOURNAL_ENABLED', 'false'),
+                'SCHEDULER_ENABLED': 'false',
+            }
+            subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), '--_tamano', str(products), '--_salida', output,
+                 '--iteraciones', str(args.iteraciones), '--semilla', str(args.semilla),
+                 '--movimientos-por-producto', str(args.movimientos_por_producto)],
+                env=env, check=True, cwd=str(ROOT), stdout=subprocess.DEVNULL
+            )
+            with open(output, encoding='utf-8') as f:
+                return json.load(f)
+        finally:
+            fake.terminate()
+            fake.wait(timeout=10)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(ROOT),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base_path: str, new_path: str) -> None:
+    """Imprimir la diferencia de p50/p95 y llamadas entre dos resultados"""
+    with open(base_path, encoding='utf-8') as f:
+        base = {r['productos']: r for r in json.load(f)['resultados']}
+    with open(new_path, encoding='utf-8') as f:
+        new = {r['productos']: r for r in json.load(f)['resultados']}
+
+    def delta(before, after):
+        if before in (None, 0) or after is None:
+            return '     -'
+        return f'{(after - before) / before * 100:+6.1f}%'
+
+    for products in sorted(set(base) & set(new)):
+        print(f"\n📦 {products} productos")
+        print(f"{'ruta':<28} {'p50 base':>10} {'p50 nuevo':>10} {'Δ':>7} {'p95 base':>10} {'p95 nuevo':>10} {'Δ':>7} {'llamadas':>9}")
+        for route in base[products]['rutas']:
+            if route not in new[products]['rutas']:
+                continue
+            b, n = base[products]['rutas'][route], new[products]['rutas'][route]
+            print(f"{route:<28} {b['p50_ms']:>10} {n['p50_ms']:>10} {delta(b['p50_ms'], n['p50_ms']):>7} "
+                  f"{b['p95_ms']:>10} {n['p95_ms']:>10} {delta(b['p95_ms'], n['p95_ms']):>7} "
+                  f"{b['llamadas_externas_max']:>4}→{n['llamadas_externas_max']:<4}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de rutas con inventarios sintéticos')
+    parser.add_argument('--tamanos', default='1000,10000', help='Productos por inventario, separados por coma')
+    parser.add_argument('--iteraciones', type=int, default=20, help='Peticiones medidas por ruta')
+    parser.add_argument('--movimientos-por-producto', type=float, default=3,
+                        help='Filas del histórico de movimientos por producto')
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Latencia del servidor local por llamada')
+    parser.add_argument('--variacion-ms', type=float, default=0, help='Variación aleatoria de la latencia (+/-)')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto instance/benchmarks/)')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NUEVO'), help='Comparar dos resultados')
+    parser.add_argument('--solo-fixtures', metavar='DIR',
+                        help='Solo escribir los CSV sintéticos (del primer tamaño) para fake_google_server.py')
+    parser.add_argument('--_tamano', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--_salida', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.comparar:
+        compare(*args.comparar)
+        return
+
+    if args._tamano:
+        # Proceso hijo: medir un tamaño y escribir el resultado
+        result = benchmark_size(args._tamano, args.iteraciones, args.movimientos_por_producto, args.semilla)
+        with open(args._salida, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    sizes = [int(s) for s in args.tamanos.split(',') if s.strip()]
+    if args.solo_fixtures:
+        write_fixtures(synthetic_dataset(sizes[0], args.movimientos_por_producto, args.semilla), args.solo_fixtures)
+        print(f"✅ Fixtures de {sizes[0]} productos escritas en {args.solo_fixtures}")
+        return
+
+    results = []
+    for products in sizes:
+        print(f"📦 {products} productos...")
+        started = time.time()
+        results.append(run_size_in_subprocess(products, args))
+        print(f"   listo en {time.time() - started:.1f} s")
+
+    report = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': {
+            'tamanos': sizes,
+            'iteraciones': args.iteraciones,
+            'movimientos_por_producto': args.movimientos_por_producto,
+            'latencia_ms': args.latencia_ms,
+            'variacion_ms': args.variacion_ms,
+            'semilla': args.semilla,
+        },
+        'resultados': results,
+    }
+    output = args.salida or os.path.join(
+        str(ROOT), 'instance', 'benchmarks', f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Resultados guardados en {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,553 @@
+"""
+Servidor local que imita Google Sheets y Google Drive para medir la
+aplicación sin tocar las hojas reales.
+
+Implementa lo que usa la aplicación:
+- Exportación CSV: GET /spreadsheets/d/<id>/export?format=csv&gid=<gid>
+- Sheets API v4: spreadsheets.get / batchUpdate (deleteDimension,
+  insertDimension, appendDimension) y values.get / batchGet / update /
+  append / batchUpdate
+- Drive API v3: files.list (name, parents, mimeType, trashed en q),
+  files.create y files.update (metadatos y subida resumable, media o multipart)
+
+Las hojas se siembran desde CSV: <rol>.csv (inventario, usuarios, historico,
+unidades, maquinas, activos, mantenimientos, historico_mantenimientos) se
+asigna a la hoja configurada para ese rol en config.py; <spreadsheet_id>.csv
+a esa hoja. Un sufijo __<gid> (ej. inventario__123.csv) crea otra pestaña.
+
+Para apuntar la aplicación al servidor:
+    GOOGLE_FAKE_URL=http://127.0.0.1:8765 python app.py
+
+Uso:
+    python scripts/fake_google_server.py --fixtures fixtures/ --latency-ms 150 --error-rate 0.02
+
+Control en tiempo de ejecución:
+    GET  /_fake/stats   Llamadas por operación
+    POST /_fake/config  {"latency_ms": 80, "jitter_ms": 20, "error_rate": 0.1, "error_status": 429}
+    POST /_fake/reset   Volver a sembrar desde las fixtures
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from flask import Flask, Response, jsonify, request
+
+from config import Config
+
+
+ROLE_SHEETS = {
+    'inventario': lambda: (Config.INVENTORY_SHEET_URL, 0),
+    'usuarios': lambda: (Config.USERS_SHEET_URL, int(Config.USERS_SHEET_GID or 0)),
+    'historico': lambda: (Config.HISTORY_SHEET_URL, 0),
+    'unidades': lambda: (Config.UNITS_OF_MEASURE_SHEET_URL, 0),
+    'maquinas': lambda: (Config.MAINTENANCE_SHEET_MAQUINAS, 0),
+    'activos': lambda: (Config.MAINTENANCE_SHEET_ACTIVOS, 0),
+    'mantenimientos': lambda: (Config.MAINTENANCE_SHEET_MANTENIMIENTOS, 0),
+    'historico_mantenimientos': lambda: (Config.MAINTENANCE_SHEET_HISTORICO_MANTENIMIENTOS, 0),
+}
+
+A1_RE = re.compile(r'^([A-Z]*)(\d*)$')
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+
+
+def spreadsheet_id(url: str) -> str:
+    return url.split('/d/')[1].split('/')[0] if '/d/' in url else url
+
+
+def column_index(letters: str) -> int:
+    index = 0
+    for char in letters:
+        index = index * 26 + (ord(char) - 64)
+    return index - 1
+
+
+def column_letters(index: int) -> str:
+    result = ''
+    index += 1
+    while index > 0:
+        index, rem = divmod(index - 1, 26)
+        result = chr(65 + rem) + result
+    return result
+
+
+def parse_range(a1: str) -> Tuple[Optional[str], Optional[int], Optional[int], Optional[int], Optional[int]]:
+    """
+    'Hoja!A2:C10' -> (título, col_ini, fila_ini, col_fin, fila_fin), 0-based e
+    inclusivo; None donde el rango no tiene límite ('A:Z', '5:5')
+    """
+    title = None
+    if '!' in a1:
+        title, a1 = a1.rsplit('!', 1)
+        title = title.strip("'")
+    start, _, end = a1.upper().partition(':')
+    end = end or start
+    bounds = []
+    for part in (start, end):
+        match = A1_RE.match(part)
+        if not match:
+            raise ValueError(f'Rango inválido: {a1}')
+        letters, digits = match.groups()
+        bounds.append((column_index(letters) if letters else None, int(digits) - 1 if digits else None))
+    (c1, r1), (c2, r2) = bounds
+    return title, c1, r1, c2, r2
+
+
+class FakeError(Exception):
+    def __init__(self, status: int, message: str, reason: str = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.reason = reason
+
+    def response(self):
+        google_status = {400: 'INVALID_ARGUMENT', 404: 'NOT_FOUND', 429: 'RESOURCE_EXHAUSTED',
+                         500: 'INTERNAL', 503: 'UNAVAILABLE'}.get(self.status, 'UNKNOWN')
+        body = {'error': {'code': self.status, 'message': self.message, 'status': google_status}}
+        if self.reason:
+            body['error']['errors'] = [{'reason': self.reason, 'message': self.message}]
+        return Response(json.dumps(body), status=self.status, mimetype='application/json')
+
+
+class FakeGoogleStore:
+    """
+    Hojas (id -> gid -> pestaña) y archivos de Drive en memoria
+    """
+
+    def __init__(self, fixtures_dir: str = None, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, error_status: int = 429, seed: int = None):
+        self.fixtures_dir = fixtures_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.sheets: Dict[str, Dict[int, Dict]] = {}
+        self.files: Dict[str, Dict] = {}
+        self.uploads: Dict[str, Dict] = {}
+        self.calls: Dict[str, int] = {}
+        self.reset()
+
+    # -- Siembra ---------------------------------------------------------
+
+    def reset(self):
+        with self.lock:
+            self.sheets, self.files, self.uploads, self.calls = {}, {}, {}, {}
+            if self.fixtures_dir:
+                self.load_fixtures(self.fixtures_dir)
+
+    def load_fixtures(self, directory: str):
+        for path in sorted(Path(directory).glob('*.csv')):
+            name, _, gid = path.stem.partition('__')
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                rows = [row for row in csv.reader(f)]
+            self.seed(name, rows, gid=int(gid) if gid else None)
+
+    def seed(self, name: str, rows: List[List], gid: int = None, title: str = None):
+        """Cargar filas (la primera es el encabezado) en la hoja de un rol o id"""
+        if name in ROLE_SHEETS:
+            url, default_gid = ROLE_SHEETS[name]()
+            sheet_id = spreadsheet_id(url)
+        else:
+            sheet_id, default_gid = name, 0
+        gid = default_gid if gid is None else gid
+        with self.lock:
+            tabs = self.sheets.setdefault(sheet_id, {})
+            tabs[gid] = {
+                'title': title or (f'Hoja {len(tabs) + 1}' if gid not in tabs else tabs[gid]['title']),
+                'index': len(tabs) if gid not in tabs else tabs[gid]['index'],
+                'rows': [['' if v is None else str(v) for v in row] for row in rows],
+            }
+
+    # -- Latencia, errores y conteo -----------------------------------------
+
+    def before_call(self, operation: str):
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self.error_rate and self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay / 1000)
+        if fail:
+            reason = {429: 'rateLimitExceeded', 403: 'userRateLimitExceeded'}.get(self.error_status)
+            raise FakeError(self.error_status, f'Error inyectado en {operation}', reason)
+
+    # -- Hojas ---------------------------------------------------------------
+
+    def tab(self, sheet_id: str, gid: int = None, title: str = None) -> Dict:
+        tabs = self.sheets.get(sheet_id)
+        if not tabs:
+            raise FakeError(404, f'Requested entity was not found: {sheet_id}')
+        if title is not None:
+            for tab in tabs.values():
+                if tab['title'] == title:
+                    return tab
+            raise FakeError(400, f'Unable to parse range: {title}')
+        if gid is None:
+            return min(tabs.values(), key=lambda t: t['index'])
+        if gid not in tabs:
+            # Como la API real: un gid inexistente es INVALID_ARGUMENT, no NOT_FOUND
+            raise FakeError(400, f'No grid with id: {gid}')
+        return tabs[gid]
+
+    def export_csv(self, sheet_id: str, gid: int) -> str:
+        with self.lock:
+            rows = self.tab(sheet_id, gid)['rows']
+            width = max((len(r) for r in rows), default=0)
+            out = io.StringIO()
+            writer = csv.writer(out, lineterminator='\n')
+            for row in rows:
+                writer.writerow(row + [''] * (width - len(row)))
+            return out.getvalue()
+
+    def metadata(self, sheet_id: str) -> Dict:
+        with self.lock:
+            tabs = self.sheets.get(sheet_id)
+            if not tabs:
+                raise FakeError(404, f'Requested entity was not found: {sheet_id}')
+            return {
+                'spreadsheetId': sheet_id,
+                'sheets': [
+                    {'properties': {
+                        'sheetId': gid, 'title': tab['title'], 'index': tab['index'],
+                        'gridProperties': {
+                            'rowCount': len(tab['rows']),
+                            'columnCount': max([len(r) for r in tab['rows']] + [26]),
+                        },
+                    }}
+                    for gid, tab in sorted(tabs.items(), key=lambda item: item[1]['index'])
+                ],
+            }
+
+    def get_values(self, sheet_id: str, a1: str) -> Dict:
+        title, c1, r1, c2, r2 = parse_range(a1)
+        with self.lock:
+            rows = self.tab(sheet_id, title=title)['rows']
+            r1 = r1 or 0
+            r2 = len(rows) - 1 if r2 is None else min(r2, len(rows) - 1)
+            values = []
+            for row in rows[r1:r2 + 1]:
+                cells = row[(c1 or 0):(None if c2 is None else c2 + 1)]
+                while cells and cells[-1] == '':
+                    cells = cells[:-1]
+                values.append(list(cells))
+            while values and not values[-1]:
+                values.pop()
+        result = {'range': a1, 'majorDimension': 'ROWS'}
+        if values:
+            result['values'] = values
+        return result
+
+    def write_values(self, sheet_id: str, a1: str, values: List[List]) -> Dict:
+        title, c1, r1, _, _ = parse_range(a1)
+        c1, r1 = c1 or 0, r1 or 0
+        with self.lock:
+            rows = self.tab(sheet_id, title=title)['rows']
+            for offset, new_row in enumerate(values or []):
+                index = r1 + offset
+                while len(rows) <= index:
+                    rows.append([])
+                row = rows[index]
+                if len(row) < c1 + len(new_row):
+                    row.extend([''] * (c1 + len(new_row) - len(row)))
+                for position, value in enumerate(new_row):
+                    row[c1 + position] = '' if value is None else str(value)
+        last_col = c1 + max([len(r) for r in values or [[]]] + [1]) - 1
+        return {
+            'spreadsheetId': sheet_id,
+            'updatedRange': f'{column_letters(c1)}{r1 + 1}:{column_letters(last_col)}{r1 + len(values or [])}',
+            'updatedRows': len(values or []),
+            'updatedCells': sum(len(r) for r in values or []),
+        }
+
+    def append_values(self, sheet_id: str, a1: str, values: List[List]) -> Dict:
+        title, c1, _, _, _ = parse_range(a1)
+        with self.lock:
+            rows = self.tab(sheet_id, title=title)['rows']
+            last = len(rows)
+            while last > 0 and not any(cell != '' for cell in rows[last - 1]):
+                last -= 1
+            target = f"{column_letters(c1 or 0)}{last + 1}"
+            if title:
+                target = f"'{title}'!{target}"
+            updates = self.write_values(sheet_id, target, values)
+        return {'spreadsheetId': sheet_id, 'tableRange': a1, 'updates': updates}
+
+    def batch_update(self, sheet_id: str, requests_: List[Dict]) -> Dict:
+        with self.lock:
+            tabs = self.sheets.get(sheet_id)
+            if not tabs:
+                raise FakeError(404, f'Requested entity was not found: {sheet_id}')
+            replies = []
+            for item in requests_:
+                if 'deleteDimension' in item:
+                    rng = item['deleteDimension']['range']
+                    if rng.get('dimension', 'ROWS') == 'ROWS':
+                        rows = self.tab(sheet_id, int(rng.get('sheetId', 0)))['rows']
+                        del rows[int(rng['startIndex']):int(rng['endIndex'])]
+                elif 'insertDimension' in item:
+                    rng = item['insertDimension']['range']
+                    if rng.get('dimension', 'ROWS') == 'ROWS':
+                        rows = self.tab(sheet_id, int(rng.get('sheetId', 0)))['rows']
+                        start, end = int(rng['startIndex']), int(rng['endIndex'])
+                        rows[start:start] = [[] for _ in range(end - start)]
+                elif 'appendDimension' in item:
+                    spec = item['appendDimension']
+                    if spec.get('dimension', 'ROWS') == 'ROWS':
+                        self.tab(sheet_id, int(spec.get('sheetId', 0)))['rows'].extend(
+                            [] for _ in range(int(spec.get('length', 0)))
+                        )
+                replies.append({})
+        return {'spreadsheetId': sheet_id, 'replies': replies}
+
+    # -- Drive ---------------------------------------------------------------
+
+    def list_files(self, query: str) -> Dict:
+        conditions = {
+            'name': re.findall(r"name\s*=\s*'((?:[^'\\]|\\.)*)'", query),
+            'parents': re.findall(r"'((?:[^'\\]|\\.)*)'\s+in\s+parents", query),
+            'mimeType': re.findall(r"mimeType\s*=\s*'([^']*)'", query),
+        }
+        with self.lock:
+            files = []
+            for item in self.files.values():
+                if item.get('trashed') and 'trashed=false' in query.replace(' ', ''):
+                    continue
+                if conditions['name'] and item['name'] != conditions['name'][0].replace("\\'", "'"):
+                    continue
+                if conditions['parents'] and conditions['parents'][0] not in item['parents']:
+                    continue
+                if conditions['mimeType'] and item['mimeType'] != conditions['mimeType'][0]:
+                    continue
+                files.append({'id': item['id'], 'name': item['name'], 'mimeType': item['mimeType']})
+        return {'kind': 'drive#fileList', 'files': files}
+
+    def save_file(self, metadata: Dict, content: bytes = None, file_id: str = None) -> Dict:
+        with self.lock:
+            if file_id is not None:
+                if file_id not in self.files:
+                    raise FakeError(404, f'File not found: {file_id}')
+                item = self.files[file_id]
+                if metadata.get('name'):
+                    item['name'] = metadata['name']
+            else:
+                file_id = uuid.uuid4().hex[:28]
+                item = {
+                    'id': file_id,
+                    'name': metadata.get('name', 'Sin título'),
+                    'parents': list(metadata.get('parents') or []),
+                    'mimeType': metadata.get('mimeType') or 'application/octet-stream',
+                    'size': 0,
+                }
+                self.files[file_id] = item
+            if content is not None:
+                item['size'] = len(content)
+                item['content'] = content
+            return {'kind': 'drive#file', 'id': file_id, 'name': item['name'], 'mimeType': item['mimeType']}
+
+
+def _multipart_parts(body: bytes, content_type: str) -> Tuple[Dict, bytes]:
+    """Metadatos y contenido de una subida multipart/related"""
+    from email.parser import BytesParser
+
+    message = BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    parts = message.get_payload()
+    metadata = json.loads(parts[0].get_payload(decode=True) or b'{}')
+    return metadata, parts[1].get_payload(decode=True)
+
+
+def create_fake_app(store: FakeGoogleStore) -> Flask:
+    """Aplicación Flask con los endpoints de Sheets/Drive sobre store"""
+    app = Flask('fake_google')
+
+    @app.errorhandler(FakeError)
+    def _fake_error(error):
+        return error.response()
+
+    @app.errorhandler(ValueError)
+    def _bad_request(error):
+        return FakeError(400, str(error)).response()
+
+    # -- Exportación CSV ---------------------------------------------------
+
+    @app.route('/spreadsheets/d/<sheet_id>/export')
+    def export(sheet_id):
+        store.before_call('csv_export')
+        gid = int(request.args.get('gid', '0') or 0)
+        return Response(store.export_csv(sheet_id, gid), mimetype='text/csv; charset=utf-8')
+
+    # -- Sheets API v4 ------------------------------------------------------
+
+    @app.route('/sheets/v4/spreadsheets/<path:rest>', methods=['GET', 'POST', 'PUT'])
+    def sheets_api(rest):
+        body = request.get_json(silent=True) or {}
+        if ':' in rest.split('/', 1)[0]:
+            sheet_id, action = rest.split(':', 1)
+            if action == 'batchUpdate' and request.method == 'POST':
+                store.before_call('spreadsheets.batchUpdate')
+                return jsonify(store.batch_update(sheet_id, body.get('requests', [])))
+            raise FakeError(404, f'Operación no soportada: {action}')
+
+        if '/' not in rest:
+            store.before_call('spreadsheets.get')
+            return jsonify(store.metadata(rest))
+
+        sheet_id, values_part = rest.split('/', 1)
+        if values_part == 'values:batchGet' and request.method == 'GET':
+            store.before_call('values.batchGet')
+            return jsonify({
+                'spreadsheetId': sheet_id,
+                'valueRanges': [store.get_values(sheet_id, a1) for a1 in request.args.getlist('ranges')],
+            })
+        if values_part == 'values:batchUpdate' and request.method == 'POST':
+            store.before_call('values.batchUpdate')
+            responses = [store.write_values(sheet_id, item['range'], item.get('values', []))
+                         for item in body.get('data', [])]
+            return jsonify({
+                'spreadsheetId': sheet_id,
+                'totalUpdatedRows': sum(r['updatedRows'] for r in responses),
+                'responses': responses,
+            })
+        if not values_part.startswith('values/'):
+            raise FakeError(404, f'Ruta no soportada: {rest}')
+        a1 = values_part[len('values/'):]
+        if a1.endswith(':append') and request.method == 'POST':
+            store.before_call('values.append')
+            return jsonify(store.append_values(sheet_id, a1[:-len(':append')], body.get('values', [])))
+        if request.method == 'PUT':
+            store.before_call('values.update')
+            return jsonify(store.write_values(sheet_id, a1, body.get('values', [])))
+        if request.method == 'GET':
+            store.before_call('values.get')
+            return jsonify(store.get_values(sheet_id, a1))
+        raise FakeError(404, f'Operación no soportada: {request.method} {rest}')
+
+    # -- Drive API v3 -------------------------------------------------------
+
+    @app.route('/drive/v3/files', methods=['GET', 'POST'])
+    def drive_files():
+        if request.method == 'GET':
+            store.before_call('files.list')
+            return jsonify(store.list_files(request.args.get('q', '')))
+        store.before_call('files.create')
+        return jsonify(store.save_file(request.get_json(silent=True) or {}))
+
+    @app.route('/drive/v3/files/<file_id>', methods=['PATCH'])
+    def drive_file_update(file_id):
+        store.before_call('files.update')
+        return jsonify(store.save_file(request.get_json(silent=True) or {}, file_id=file_id))
+
+    @app.route('/upload/drive/v3/files', methods=['POST', 'PUT'], defaults={'file_id': None})
+    @app.route('/upload/drive/v3/files/<file_id>', methods=['PATCH', 'PUT'])
+    def drive_upload(file_id):
+        upload_type = request.args.get('uploadType', 'media')
+        upload_id = request.args.get('upload_id')
+
+        if upload_id:
+            # Segunda parte de una subida resumable: el contenido completo en un PUT
+            with store.lock:
+                pending = store.uploads.pop(upload_id, None)
+            if pending is None:
+                raise FakeError(404, 'Sesión de subida inexistente')
+            return jsonify(store.save_file(pending['metadata'], request.get_data(), file_id=pending['file_id']))
+
+        operation = 'files.update' if file_id else 'files.create'
+        store.before_call(operation)
+        if upload_type == 'resumable':
+            upload_id = uuid.uuid4().hex
+            with store.lock:
+                store.uploads[upload_id] = {'metadata': request.get_json(silent=True) or {}, 'file_id': file_id}
+            location = request.base_url + f'?uploadType=resumable&upload_id={upload_id}'
+            return Response('', status=200, headers={'Location': location})
+        if upload_type == 'multipart':
+            metadata, content = _multipart_parts(request.get_data(), request.headers.get('Content-Type', ''))
+            return jsonify(store.save_file(metadata, content, file_id=file_id))
+        return jsonify(store.save_file({}, request.get_data(), file_id=file_id))
+
+    # -- Control -------------------------------------------------------------
+
+    @app.route('/_fake/stats')
+    def fake_stats():
+        with store.lock:
+            return jsonify({
+                'llamadas': dict(sorted(store.calls.items())),
+                'hojas': {sid: {gid: len(tab['rows']) for gid, tab in tabs.items()} for sid, tabs in store.sheets.items()},
+                'archivos': len(store.files),
+            })
+
+    @app.route('/_fake/config', methods=['POST'])
+    def fake_config():
+        body = request.get_json(silent=True) or {}
+        with store.lock:
+            for key in ('latency_ms', 'jitter_ms', 'error_rate'):
+                if key in body:
+                    setattr(store, key, float(body[key]))
+            if 'error_status' in body:
+                store.error_status = int(body['error_status'])
+        return jsonify({'latency_ms': store.latency_ms, 'jitter_ms': store.jitter_ms,
+                        'error_rate': store.error_rate, 'error_status': store.error_status})
+
+    @app.route('/_fake/reset', methods=['POST'])
+    def fake_reset():
+        store.reset()
+        return jsonify({'ok': True})
+
+    return app
+
+
+def serve_in_thread(store: FakeGoogleStore, host: str = '127.0.0.1', port: int = 0, quiet: bool = True):
+    """
+    Levantar el servidor en un hilo (para benchmarks en el mismo proceso)
+
+    Returns:
+        (servidor werkzeug, URL base); detener con servidor.shutdown()
+    """
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class _Handler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            if not quiet:
+                super().log_request(*args, **kwargs)
+
+    server = make_server(host, port, create_fake_app(store), threaded=True, request_handler=_Handler)
+    thread = threading.Thread(target=server.serve_forever, name='fake-google', daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local que imita Google Sheets/Drive')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', help='Directorio con los CSV para sembrar las hojas')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Latencia agregada a cada llamada')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Variación aleatoria de la latencia (+/-)')
+    parser.add_argument('--error-rate', type=float, default=0, help='Proporción de llamadas que fallan (0-1)')
+    parser.add_argument('--error-status', type=int, default=429, help='Código HTTP de los errores inyectados')
+    parser.add_argument('--seed', type=int, help='Semilla para latencia y errores reproducibles')
+    args = parser.parse_args()
+
+    if args.fixtures and not os.path.isdir(args.fixtures):
+        parser.error(f'No existe el directorio de fixtures: {args.fixtures}')
+    store = FakeGoogleStore(args.fixtures, args.latency_ms, args.jitter_ms,
+                            args.error_rate, args.error_status, args.seed)
+    print(f"📄 Hojas sembradas: {len(store.sheets)}")
+    print(f"🔗 Usa GOOGLE_FAKE_URL=http://{args.host}:{args.port}")
+    create_fake_app(store).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
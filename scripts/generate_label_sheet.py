@@ -0,0 +1,106 @@
+"""
+Script para generar hojas de etiquetas (QR + Codigo + Referencia) en lote
+Filtra el inventario por código y/o ubicación y escribe un PDF multipágina
+o una carpeta con una imagen PNG por página
+"""
+import os
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.sheets_service import SheetsService
+from app.services.label_service import LabelService, DEFAULT_COLUMNS, DEFAULT_ROWS
+
+
+def generate_label_sheet(output: str, codigo: str = None, ubicacion: str = None, formato: str = 'pdf',
+                         base_url: str = None, columnas: int = DEFAULT_COLUMNS, filas: int = DEFAULT_ROWS):
+    """
+    Generar la hoja de etiquetas para los productos filtrados
+
+    Args:
+        output: Archivo PDF de salida o carpeta de salida (formato png)
+        codigo: Patrón de código (ej. RMEC o RMEC-*)
+        ubicacion: Texto contenido en la ubicación
+        formato: 'pdf' o 'png'
+        base_url: URL base de la aplicación (opcional)
+        columnas: Etiquetas por fila
+        filas: Filas de etiquetas por página
+    """
+    print("="*70)
+    print("🏷️  GENERADOR DE HOJAS DE ETIQUETAS")
+    print("="*70)
+    print()
+
+    if base_url is None:
+        base_url = os.environ.get('BASE_URL', 'https://convexa-1.onrender.com')
+    base_url = base_url.rstrip('/')
+
+    print("📋 Obteniendo productos del inventario...")
+    products = SheetsService.get_inventory_data()
+    if not products:
+        print("❌ No se encontraron productos en el inventario")
+        return
+
+    selected = LabelService.filter_products(products, codigo=codigo, ubicacion=ubicacion)
+    pages = LabelService.iter_pages(selected, base_url, columns=columnas, rows=filas)
+
+    page_count = 0
+    if formato == 'png':
+        os.makedirs(output, exist_ok=True)
+        for page_count, page in enumerate(pages, 1):
+            page.save(os.path.join(output, f"etiquetas-{page_count:04d}.png"), format='PNG', optimize=True)
+            print(f"   ✅ Página {page_count} generada")
+    else:
+        def counted(iterable):
+            nonlocal page_count
+            for page in iterable:
+                page_count += 1
+                print(f"   ✅ Página {page_count} generada")
+                yield page
+
+        with open(output, 'wb') as f:
+            for chunk in LabelService.stream_pdf(counted(pages)):
+                f.write(chunk)
+
+    print()
+    if page_count == 0:
+        print("⚠️  Ningún producto cumple el filtro")
+    else:
+        print(f"✨ {page_count} página(s) escritas en: {output}")
+    print("="*70)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Generar hojas de etiquetas QR para productos del inventario'
+    )
+    parser.add_argument('--codigo', type=str, default=None,
+                        help='Patrón de código (ej: RMEC o "RMEC-*")')
+    parser.add_argument('--ubicacion', type=str, default=None,
+                        help='Filtrar por texto contenido en la ubicación')
+    parser.add_argument('--formato', choices=['pdf', 'png'], default='pdf',
+                        help='pdf: un archivo multipágina; png: una imagen por página')
+    parser.add_argument('--salida', type=str, default=None,
+                        help='Archivo PDF o carpeta PNG de salida (por defecto etiquetas.pdf / etiquetas/)')
+    parser.add_argument('--base-url', type=str, default=None,
+                        help='URL base de la aplicación (ej: https://convexa-1.onrender.com)')
+    parser.add_argument('--columnas', type=int, default=DEFAULT_COLUMNS,
+                        help='Etiquetas por fila')
+    parser.add_argument('--filas', type=int, default=DEFAULT_ROWS,
+                        help='Filas de etiquetas por página')
+
+    args = parser.parse_args()
+
+    generate_label_sheet(
+        output=args.salida or ('etiquetas' if args.formato == 'png' else 'etiquetas.pdf'),
+        codigo=args.codigo,
+        ubicacion=args.ubicacion,
+        formato=args.formato,
+        base_url=args.base_url,
+        columnas=args.columnas,
+        filas=args.filas
+    )
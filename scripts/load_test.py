@@ -0,0 +1,378 @@
+"""
+Prueba de carga con usuarios concurrentes autenticados.
+
+Simula N usuarios que inician sesión y repiten, en proporciones
+configurables, escaneos de QR (vista de escaneo JSON con If-None-Match),
+movimientos de stock (POST a product.detail), cargas del tablero de
+inventario y ediciones de mantenimientos (CMMS). Informa por ruta y en
+total: peticiones por segundo, tasa de error y latencias p50/p90/p95/p99.
+
+Por defecto levanta scripts/fake_google_server.py con un inventario
+sintético y la aplicación con gunicorn (wsgi:app) con los workers e hilos
+indicados, para dimensionarlos antes de un despliegue. Con --url se usa
+un servidor ya levantado (que debe apuntar con GOOGLE_FAKE_URL a un
+servidor local sembrado con --solo-fixtures).
+
+Uso:
+    python scripts/load_test.py --usuarios 20 --duracion 60 --workers 2 --hilos 4
+    python scripts/load_test.py --mezcla escaneo=60,movimiento=20,tablero=10,cmms=10 --latencia-ms 120
+    python scripts/load_test.py --solo-fixtures fixtures/ --usuarios 50 --productos 20000
+    python scripts/load_test.py --url http://127.0.0.1:8000 --usuarios 50 --salida instance/carga.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Agregar el directorio raíz al path
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+import requests
+
+from benchmark_routes import (
+    ESTADOS_MTTO, _free_port, _git_commit, fake_calls, percentile, start_fake_server,
+    synthetic_dataset, write_fixtures,
+)
+
+
+LOAD_PASSWORD = 'carga'
+DEFAULT_MIX = 'escaneo=50,movimiento=20,tablero=20,cmms=10'
+ACTIONS = ('escaneo', 'movimiento', 'tablero', 'cmms')
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """'escaneo=50,movimiento=20' -> proporciones por acción (suman 1)"""
+    mix = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ACTIONS:
+            raise ValueError(f"Acción desconocida en la mezcla: {name} (opciones: {', '.join(ACTIONS)})")
+        mix[name] = float(weight or 0)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError('La mezcla debe tener al menos una acción con peso mayor a 0')
+    return {name: weight / total for name, weight in mix.items() if weight > 0}
+
+
+def load_dataset(products: int, users: int, seed: int) -> Dict[str, List[List]]:
+    """Datos sintéticos con un usuario carga1..cargaN por usuario simulado"""
+    dataset = synthetic_dataset(products, seed=seed)
+    dataset['usuarios'] += [[f'carga{n}', LOAD_PASSWORD] for n in range(1, users + 1)]
+    return dataset
+
+
+# -- Servidor de la aplicación ----------------------------------------------
+
+def start_app_server(fake_url: str, workdir: str, workers: int, threads: int, timeout: float = 120):
+    """
+    Levantar wsgi:app con gunicorn apuntando al servidor local de Google
+
+    Returns:
+        (proceso, URL base, archivo de log)
+    """
+    port = _free_port()
+    log_path = os.path.join(workdir, 'gunicorn.log')
+    env = {
+        **os.environ,
+        'GOOGLE_FAKE_URL': fake_url,
+        'LOCAL_STATE_DB': os.path.join(workdir, 'state.db'),
+        'SCHEDULER_LOCK_FILE': os.path.join(workdir, 'scheduler.lock'),
+        # Producción exige cookies Secure, que no viajan por http://127.0.0.1
+        'FLASK_ENV': 'development',
+        'CALL_BUDGET_MODE': os.environ.get('CALL_BUDGET_MODE', 'off'),
+    }
+    log = open(log_path, 'w', encoding='utf-8')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'wsgi:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(threads), '--timeout', '120'],
+        cwd=str(ROOT), env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            log.close()
+            raise RuntimeError(f'gunicorn terminó al iniciar; ver {log_path}')
+        try:
+            requests.get(f'{url}/auth/login', timeout=2)
+            return process, url, log
+        except requests.ConnectionError:
+            time.sleep(0.3)
+    process.kill()
+    log.close()
+    raise RuntimeError('La aplicación no respondió a tiempo')
+
+
+# -- Usuarios simulados -----------------------------------------------------
+
+class VirtualUser(threading.Thread):
+    """
+    Un usuario con su propia sesión que ejecuta acciones hasta stop_at
+    """
+
+    def __init__(self, number: int, base_url: str, username: str, password: str, mix: Dict[str, float],
+                 dataset: Dict[str, List[List]], start_at: float, stop_at: float, pause_ms: float,
+                 seed: int, results: List, lock: threading.Lock):
+        super().__init__(name=f'usuario-{number}', daemon=True)
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.actions = list(mix)
+        self.weights = [mix[a] for a in self.actions]
+        self.product_ids = [str(row[0]) for row in dataset['inventario'][1:]]
+        self.mtto_ids = [row[0] for row in dataset['mantenimientos'][1:]]
+        self.start_at = start_at
+        self.stop_at = stop_at
+        self.pause_ms = pause_ms
+        self.random = random.Random(seed + number)
+        self.results = results
+        self.lock = lock
+        self.session = requests.Session()
+        # ETag por producto: un lector que vuelve a escanear el mismo QR manda If-None-Match
+        self.etags: Dict[str, str] = {}
+        # Productos escaneados recientemente (los escaneos se repiten sobre un grupo pequeño)
+        self.recent: List[str] = []
+        self.local: List = []
+
+    def _record(self, route: str, started: float, status: Optional[int], error: Optional[str] = None):
+        self.local.append((route, time.time(), (time.perf_counter() - started) * 1000, status, error))
+
+    def _call(self, route: str, method: str, path: str, **kwargs) -> Optional[requests.Response]:
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, allow_redirects=False,
+                                            timeout=60, **kwargs)
+        except requests.RequestException as e:
+            self._record(route, started, None, type(e).__name__)
+            return None
+        error = None
+        if response.status_code >= 500 or response.status_code == 429:
+            error = f'HTTP {response.status_code}'
+        elif response.status_code in (301, 302) and '/auth/login' in response.headers.get('Location', ''):
+            error = 'sesion_perdida'
+        self._record(route, started, response.status_code, error)
+        return response
+
+    def login(self) -> bool:
+        response = self._call('auth.login', 'POST', '/auth/login',
+                              data={'username': self.username, 'password': self.password})
+        return response is not None and response.status_code == 302 \
+            and '/auth/login' not in response.headers.get('Location', '')
+
+    def _pick_product(self) -> str:
+        if self.recent and self.random.random() < 0.5:
+            return self.random.choice(self.recent)
+        product_id = self.random.choice(self.product_ids)
+        self.recent = (self.recent + [product_id])[-20:]
+        return product_id
+
+    def escaneo(self):
+        product_id = self._pick_product()
+        headers = {'If-None-Match': self.etags[product_id]} if product_id in self.etags else {}
+        response = self._call('product.scan', 'GET', f'/product/escaneo/{product_id}?formato=json', headers=headers)
+        if response is not None and response.headers.get('ETag'):
+            self.etags[product_id] = response.headers['ETag']
+
+    def movimiento(self):
+        product_id = self._pick_product()
+        self._call('product.detail POST', 'POST', f'/product/detail/{product_id}', data={
+            'tipo_movimiento': self.random.choice(['ingreso', 'salida']),
+            'unidades': str(self.random.randint(1, 3)),
+        })
+        self.etags.pop(product_id, None)
+
+    def tablero(self):
+        self._call('dashboard.index', 'GET', '/dashboard')
+
+    def cmms(self):
+        mtto_id = self.random.choice(self.mtto_ids)
+        self._call('maintenance.mantenimientos_editar', 'POST', f'/mantenimiento/mantenimientos/{mtto_id}/editar', data={
+            'estado': self.random.choice([e for e in ESTADOS_MTTO if e != 'HECHO']),
+            'observaciones': f'Prueba de carga {datetime.now():%H:%M:%S}',
+        })
+
+    def run(self):
+        time.sleep(max(0.0, self.start_at - time.time()))
+        if self.login():
+            while time.time() < self.stop_at:
+                action = self.random.choices(self.actions, weights=self.weights)[0]
+                getattr(self, action)()
+                if self.pause_ms:
+                    time.sleep(self.random.uniform(0.5, 1.5) * self.pause_ms / 1000)
+        with self.lock:
+            self.results.extend(self.local)
+
+
+# -- Reporte ----------------------------------------------------------------
+
+def summarize(samples: List, window_start: float, window_end: float) -> Dict:
+    """Peticiones por segundo, tasa de error y latencias por ruta dentro de la ventana medida"""
+    seconds = max(window_end - window_start, 1e-9)
+    routes: Dict[str, List] = {}
+    for sample in samples:
+        if window_start <= sample[1] <= window_end:
+            routes.setdefault(sample[0], []).append(sample)
+
+    def stats(items: List) -> Dict:
+        latencies = [s[2] for s in items]
+        errors: Dict[str, int] = {}
+        for s in items:
+            if s[4]:
+                errors[s[4]] = errors.get(s[4], 0) + 1
+        statuses: Dict[str, int] = {}
+        for s in items:
+            key = str(s[3]) if s[3] is not None else 'sin_respuesta'
+            statuses[key] = statuses.get(key, 0) + 1
+        return {
+            'peticiones': len(items),
+            'por_segundo': round(len(items) / seconds, 2),
+            'tasa_error': round(sum(errors.values()) / len(items), 4) if items else 0,
+            'errores': dict(sorted(errors.items())),
+            'codigos': dict(sorted(statuses.items())),
+            'p50_ms': percentile(latencies, 0.50),
+            'p90_ms': percentile(latencies, 0.90),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': round(max(latencies), 2) if latencies else None,
+        }
+
+    return {
+        'segundos_medidos': round(seconds, 1),
+        'total': stats([s for items in routes.values() for s in items]),
+        'rutas': {route: stats(items) for route, items in sorted(routes.items())},
+    }
+
+
+def print_summary(summary: Dict) -> None:
+    print(f"\n{'ruta':<36} {'pet.':>7} {'pet/s':>8} {'error':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    rows = list(summary['rutas'].items()) + [('TOTAL', summary['total'])]
+    for route, s in rows:
+        print(f"{route:<36} {s['peticiones']:>7} {s['por_segundo']:>8} {s['tasa_error'] * 100:>6.2f}% "
+              f"{s['p50_ms']!s:>9} {s['p95_ms']!s:>9} {s['p99_ms']!s:>9} {s['max_ms']!s:>9}")
+    for route, s in rows:
+        if s['errores']:
+            print(f"⚠️ {route}: {s['errores']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga con usuarios concurrentes')
+    parser.add_argument('--usuarios', type=int, default=10, help='Usuarios simultáneos')
+    parser.add_argument('--duracion', type=float, default=60, help='Segundos de carga (sin contar la rampa)')
+    parser.add_argument('--rampa', type=float, default=5, help='Segundos para iniciar todos los usuarios (no se miden)')
+    parser.add_argument('--mezcla', default=DEFAULT_MIX, help=f'Proporción de acciones (por defecto {DEFAULT_MIX})')
+    parser.add_argument('--pausa-ms', type=float, default=0, help='Pausa media entre acciones de un usuario')
+    parser.add_argument('--workers', type=int, default=2, help='Workers de gunicorn')
+    parser.add_argument('--hilos', type=int, default=4, help='Hilos por worker de gunicorn')
+    parser.add_argument('--productos', type=int, default=5000, help='Productos del inventario sintético')
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Latencia del servidor local de Google por llamada')
+    parser.add_argument('--variacion-ms', type=float, default=0, help='Variación aleatoria de la latencia (+/-)')
+    parser.add_argument('--tasa-errores', type=float, default=0, help='Proporción de llamadas a Google que fallan (0-1)')
+    parser.add_argument('--url', help='Usar una aplicación ya levantada en lugar de iniciar gunicorn')
+    parser.add_argument('--usuario', help='Con --url: usuario compartido por todos (por defecto carga1..cargaN)')
+    parser.add_argument('--clave', default=LOAD_PASSWORD, help='Con --url: contraseña de --usuario')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', help='Archivo JSON con el resultado')
+    parser.add_argument('--solo-fixtures', metavar='DIR',
+                        help='Solo escribir los CSV (con los usuarios carga1..N) para fake_google_server.py')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mezcla)
+    except ValueError as e:
+        parser.error(str(e))
+
+    dataset = load_dataset(args.productos, args.usuarios, args.semilla)
+    if args.solo_fixtures:
+        write_fixtures(dataset, args.solo_fixtures)
+        print(f"✅ Fixtures de {args.productos} productos y {args.usuarios} usuarios escritas en {args.solo_fixtures}")
+        return
+
+    processes, logs = [], []
+    workdir = tempfile.TemporaryDirectory(prefix='convexa_carga_')
+    fake_url = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            fixtures = os.path.join(workdir.name, 'fixtures')
+            write_fixtures(dataset, fixtures)
+            fake, fake_url = start_fake_server(fixtures, args.latencia_ms, args.variacion_ms, args.tasa_errores)
+            processes.append(fake)
+            app, base_url, log = start_app_server(fake_url, workdir.name, args.workers, args.hilos)
+            processes.append(app)
+            logs.append(log)
+            print(f"🚀 gunicorn {args.workers} workers x {args.hilos} hilos en {base_url} (Google local: {fake_url})")
+
+        results: List = []
+        lock = threading.Lock()
+        now = time.time()
+        measure_from = now + args.rampa
+        stop_at = measure_from + args.duracion
+        users = [
+            VirtualUser(
+                n, base_url, args.usuario or f'carga{n}', args.clave if args.usuario else LOAD_PASSWORD, mix,
+                dataset, now + args.rampa * (n - 1) / max(args.usuarios, 1), stop_at, args.pausa_ms,
+                args.semilla, results, lock
+            )
+            for n in range(1, args.usuarios + 1)
+        ]
+        print(f"👥 {args.usuarios} usuarios, mezcla {', '.join(f'{k}={v:.0%}' for k, v in mix.items())}, "
+              f"{args.duracion:.0f} s medidos tras {args.rampa:.0f} s de rampa")
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+
+        logins = [s for s in results if s[0] == 'auth.login']
+        failed_logins = sum(1 for s in logins if s[3] != 302)
+        summary = summarize([s for s in results if s[0] != 'auth.login'], measure_from, stop_at)
+        print_summary(summary)
+        if failed_logins:
+            print(f"⚠️ {failed_logins} usuarios no pudieron iniciar sesión")
+
+        report = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'parametros': {
+                'usuarios': args.usuarios, 'duracion': args.duracion, 'rampa': args.rampa, 'mezcla': mix,
+                'pausa_ms': args.pausa_ms, 'productos': args.productos,
+                'workers': None if args.url else args.workers, 'hilos': None if args.url else args.hilos,
+                'latencia_ms': args.latencia_ms, 'variacion_ms': args.variacion_ms,
+                'tasa_errores': args.tasa_errores, 'url': args.url,
+            },
+            'logins_fallidos': failed_logins,
+            **summary,
+        }
+        if fake_url:
+            report['operaciones_google'] = fake_calls(fake_url)
+        if args.salida:
+            os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"✅ Resultado guardado en {args.salida}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for log in logs:
+            log.close()
+        workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()